@@ -0,0 +1,60 @@
+""" Benchmark for setting up SSH tunnels from AsyncSshClient
+
+Runs a command on 100 simulated hosts through a fake 'ssh' binary whose
+tunnel setup takes HANDSHAKE_SECONDS, like a real handshake to a remote host,
+and reports the wall-clock time. The original run(), which opened and closed
+tunnels with blocking subprocess calls on the event loop, is kept as a
+baseline: it serializes the handshakes regardless of parallelism.
+
+Usage: python benchmarks/bench_async_tunnels.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from dcos_test_utils import ssh_client
+
+HANDSHAKE_SECONDS = 0.1
+
+FAKE_SSH = """#!/bin/sh
+for arg in "$@"; do
+    case "$arg" in
+        -fnN) sleep {handshake}; exit 0;;
+    esac
+done
+exit 0
+"""
+
+
+class BlockingTunnelSshClient(ssh_client.AsyncSshClient):
+    """ The original run() opening its tunnel on the event loop thread, kept as a baseline
+    """
+    async def run(self, sem: asyncio.Semaphore, host: str, cmd: list) -> dict:
+        hostname, port = ssh_client.parse_ip(host)
+        async with sem:
+            with self.tunnel(hostname, port) as t:
+                full_cmd = ['ssh', '-p', str(t.port)] + t.opt_list + [t.target] + cmd
+                result = await self._run_cmd_return_dict_async(full_cmd)
+        result['host'] = host
+        return result
+
+
+def main(hosts=100, parallelism=10):
+    targets = ['10.0.{}.{}'.format(i // 256, i % 256) for i in range(hosts)]
+    with tempfile.TemporaryDirectory() as bin_dir:
+        fake_ssh = os.path.join(bin_dir, 'ssh')
+        with open(fake_ssh, 'w') as f:
+            f.write(FAKE_SSH.format(handshake=HANDSHAKE_SECONDS))
+        os.chmod(fake_ssh, 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+        for label, cls in (('blocking tunnels', BlockingTunnelSshClient), ('async tunnels', ssh_client.AsyncSshClient)):
+            client = cls('core', 'key', targets, parallelism=parallelism, reuse_tunnels=False)
+            start = time.perf_counter()
+            client.run_command('run', ['true'])
+            elapsed = time.perf_counter() - start
+            print('{:<16} {} hosts, parallelism {}: {:6.2f} s'.format(label, hosts, parallelism, elapsed))
+
+
+if __name__ == '__main__':
+    main()
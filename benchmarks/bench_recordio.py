@@ -0,0 +1,116 @@
+""" Throughput benchmarks for dcos_test_utils.recordio
+
+Decodes multi-MB RecordIO feeds made of either tiny or large records,
+delivered in network-sized chunks, and reports MB/s. The original
+byte-at-a-time decoder is kept here as a baseline for comparison.
+
+Also compares encoding many small messages one frame at a time with
+'Encoder.encode()' against the batched 'Encoder.encode_many()' and
+'Encoder.write_to()' paths.
+
+Usage: python benchmarks/bench_recordio.py
+"""
+import io
+import time
+
+from dcos_test_utils import recordio
+
+
+class ByteWiseDecoder(recordio.Decoder):
+    """ The original per-byte decoding loop, kept as a baseline
+    """
+    def decode(self, data):
+        records = []
+        for c in data:
+            if self.state == self.HEADER:
+                if c != ord('\n'):
+                    self.buffer += bytes([c])
+                    continue
+                self.length = int(bytes(self.buffer).decode("UTF-8"))
+                self.buffer = bytes("", "UTF-8")
+                self.state = self.RECORD
+                if self.length == 0:
+                    records.append(self.deserialize(self.buffer))
+                    self.state = self.HEADER
+            elif self.state == self.RECORD:
+                self.buffer += bytes([c])
+                if len(self.buffer) == self.length:
+                    records.append(self.deserialize(self.buffer))
+                    self.buffer = bytes("", "UTF-8")
+                    self.state = self.HEADER
+        return records
+
+
+class ConcatEncoder(recordio.Encoder):
+    """ The original per-frame encoder, kept as a baseline
+    """
+    def encode(self, message):
+        s = self.serialize(message)
+        return bytes(str(len(s)) + "\n", "UTF-8") + s
+
+
+def make_feed(record_size, total_size):
+    encoder = recordio.Encoder(lambda m: m)
+    record = encoder.encode(b'x' * record_size)
+    return record * (total_size // len(record) + 1)
+
+
+def run(decoder_cls, feed, chunk_size):
+    decoder = decoder_cls(lambda d: d)
+    count = 0
+    start = time.perf_counter()
+    for i in range(0, len(feed), chunk_size):
+        count += len(decoder.decode(feed[i:i + chunk_size]))
+    elapsed = time.perf_counter() - start
+    return count, elapsed
+
+
+def bench_encoder(count=50000):
+    messages = [b'{"type": "ACKNOWLEDGE", "id": %d, "data": "%s"}' % (i, b'x' * 512) for i in range(count)]
+    encoder = recordio.Encoder(lambda m: m)
+    baseline = ConcatEncoder(lambda m: m)
+
+    def per_frame():
+        out = io.BytesIO()
+        for m in messages:
+            out.write(baseline.encode(m))
+
+    def joined():
+        io.BytesIO().write(b''.join(encoder.encode_many(messages)))
+
+    def write_to():
+        encoder.write_to(io.BytesIO(), messages)
+
+    for label, fn in (('original encode()', per_frame),
+                      ('encode_many() + join', joined),
+                      ('write_to()', write_to)):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print('{:<22} {:8d} messages in {:6.3f}s = {:10.0f} messages/s'.format(
+            label, count, elapsed, count / elapsed))
+
+
+def main():
+    scenarios = [
+        # (label, record size, feed size, chunk size)
+        ('tiny records', 64, 8 * 2 ** 20, 64 * 2 ** 10),
+        ('large records', 2 * 2 ** 20, 16 * 2 ** 20, 64 * 2 ** 10),
+    ]
+    for label, record_size, total_size, chunk_size in scenarios:
+        feed = make_feed(record_size, total_size)
+        mb = len(feed) / 2 ** 20
+        count, elapsed = run(recordio.Decoder, feed, chunk_size)
+        print('{:<14} Decoder:         {:8d} records {:7.1f} MB in {:6.3f}s = {:8.1f} MB/s'.format(
+            label, count, mb, elapsed, mb / elapsed))
+        # The baseline is far too slow for the full feed; time a slice of it.
+        baseline_feed = feed[:256 * 2 ** 10]
+        count, elapsed = run(ByteWiseDecoder, baseline_feed, chunk_size)
+        baseline_mb = len(baseline_feed) / 2 ** 20
+        print('{:<14} ByteWiseDecoder: {:8d} records {:7.1f} MB in {:6.3f}s = {:8.1f} MB/s'.format(
+            label, count, baseline_mb, elapsed, baseline_mb / elapsed))
+    bench_encoder()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+""" Benchmark for deriving service clients from a DcosApiSession
+
+Every service property (marathon, jobs, cosmos, ...) derives a new client
+from the session. This measures the per-access cost of doing so with the
+original copy.deepcopy() based DcosApiSession.copy() and with the current
+implementation, which shares the connection pools of the parent session.
+
+Usage: python benchmarks/bench_session_copy.py
+"""
+import copy
+import time
+
+from dcos_test_utils import dcos_api
+
+
+class DeepCopyApiSession(dcos_api.DcosApiSession):
+    """ DcosApiSession using the original deep copy, kept as a baseline
+    """
+    def copy(self):
+        new = copy.deepcopy(self)
+        new.session.cookies.clear()
+        return new
+
+
+def make_session(cls):
+    api = cls(
+        'http://leader.mesos',
+        ['10.0.0.{}'.format(i) for i in range(3)],
+        ['10.0.1.{}'.format(i) for i in range(100)],
+        ['10.0.2.{}'.format(i) for i in range(10)],
+        dcos_api.DcosUser({'token': 'foo'}))
+    api.session.auth = dcos_api.DcosAuth('foo')
+    return api
+
+
+def main(count=2000):
+    for label, cls in (('copy.deepcopy()', DeepCopyApiSession), ('derived session', dcos_api.DcosApiSession)):
+        api = make_session(cls)
+        for prop in ('marathon', 'jobs', 'health'):
+            start = time.perf_counter()
+            for _ in range(count):
+                getattr(api, prop)
+            elapsed = time.perf_counter() - start
+            print('{:<16} .{:<9} {:8.1f} us per access'.format(label, prop, elapsed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
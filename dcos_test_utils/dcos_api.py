@@ -6,24 +6,115 @@ it is sometimes necessary to query specific nodes within a DC/OS cluster,
 so there is ARNodeApiClientMixin to allow querying nodes without boilerplate
 to set the correct port and scheme.
 """
+import concurrent.futures
 import copy
+import functools
+import json
 import logging
 import os
-from typing import List, Optional
+import threading
+import time
+from collections import namedtuple
+from typing import Generator, List, Optional
 
 import requests
-import retrying
 
 from dcos_test_utils import (
     diagnostics,
     jobs,
     marathon,
     package,
-    helpers
+    helpers,
+    recordio
 )
 
 log = logging.getLogger(__name__)
 
+ReadinessProbe = namedtuple('ReadinessProbe', ['name', 'check', 'depends_on'])
+
+
+def _timed(fn, cancel_event: threading.Event) -> float:
+    start = time.time()
+    with helpers.cancel_polls(cancel_event):
+        fn()
+    return time.time() - start
+
+
+def run_readiness_probes(probes: List[ReadinessProbe], max_workers: Optional[int]=None) -> dict:
+    """ Runs readiness probes concurrently, starting each probe as soon as all of
+    the probes it depends on have passed. Probes without a dependency between them
+    therefore wait in parallel and the total wait is bounded by the slowest chain
+    of probes rather than the sum of all of them
+
+    :param probes: probes to run. A probe passes when its check returns without raising
+    :type probes: list
+    :param max_workers: maximum number of probes to run at once (defaults to all of them)
+    :type max_workers: int
+
+    If a probe fails, the polls of the probes still running are cancelled (see
+    :func:`~dcos_test_utils.helpers.cancel_polls`) so that their threads end.
+
+    :returns: mapping of probe name to the number of seconds it took to pass
+    :rtype: dict
+    """
+    names = {p.name for p in probes}
+    for probe in probes:
+        unknown = set(probe.depends_on) - names
+        assert not unknown, 'Probe {} depends on unknown probes: {}'.format(probe.name, unknown)
+
+    timings = {}
+    pending = list(probes)
+    running = {}
+    cancel_event = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(probes) or 1)
+    try:
+        while pending or running:
+            for probe in [p for p in pending if all(d in timings for d in p.depends_on)]:
+                pending.remove(probe)
+                log.info('Starting readiness probe: {}'.format(probe.name))
+                running[executor.submit(_timed, probe.check, cancel_event)] = probe
+            if not running:
+                raise Exception('Readiness probes have circular dependencies: {}'.format(
+                    [p.name for p in pending]))
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                probe = running.pop(future)
+                timings[probe.name] = future.result()
+                log.info('Readiness probe {} passed in {:.1f} seconds'.format(probe.name, timings[probe.name]))
+    finally:
+        # do not block on probes still running if another one failed, but stop their polls
+        cancel_event.set()
+        executor.shutdown(wait=False)
+    return timings
+
+
+def cached_client(fn):
+    """ Decorator for DcosApiSession properties which derive a service client from the
+    session. Derived clients share the session's retry policy and pollers
+    (see :class:`~dcos_test_utils.helpers.SharedPollers`). If the session was
+    created with cache_clients=True, the client is built once and reused on subsequent
+    accesses for as long as the session's auth, user, TLS settings, default Url and node
+    lists are unchanged; otherwise a new client is built on every access
+    """
+    def derive(self):
+        client = fn(self)
+        client.retry_policy = self.retry_policy
+        client.shared_pollers = self.shared_pollers
+        return client
+
+    @functools.wraps(fn)
+    def wrapper(self):
+        if not self.cache_clients:
+            return derive(self)
+        key = self._client_cache_key()
+        cached = self._client_cache.get(fn.__name__)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        client = derive(self)
+        self._client_cache[fn.__name__] = (key, client)
+        return client
+    return wrapper
+
 
 class DcosUser:
     """ Representation of a DC/OS user used for authentication
@@ -72,9 +163,7 @@ class Exhibitor(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
     """
     def __init__(self, default_url: helpers.Url, session: Optional[requests.Session]=None,
                  exhibitor_admin_password: Optional[str]=None):
-        super().__init__(default_url)
-        if session is not None:
-            self.session = session
+        super().__init__(default_url, session=session)
         if exhibitor_admin_password is not None:
             # Override auth to use HTTP basic auth with the provided admin password.
             self.session.auth = requests.auth.HTTPBasicAuth('admin', exhibitor_admin_password)
@@ -98,6 +187,14 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
     :param auth_user: use this user's auth for all requests.
         Note: user must be authenticated explicitly or call self.wait_for_dcos()
     :type auth_user: DcosUser
+    :param cache_clients: if True, service clients such as marathon or jobs are built
+        once and reused until auth or the default Url change, see :func:`cached_client`
+    :type cache_clients: bool
+
+    :param pool_config: HTTP connection pool settings for this session and the clients derived from it
+    :type pool_config: helpers.ConnectionPoolConfig
+    :param retry_policy: how requests of this session and the clients derived from it are retried
+    :type retry_policy: helpers.RetryPolicy
     """
     def __init__(
             self,
@@ -106,13 +203,20 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             slaves: Optional[List[str]],
             public_slaves: Optional[List[str]],
             auth_user: Optional[DcosUser],
-            exhibitor_admin_password: Optional[str]=None):
-        super().__init__(helpers.Url.from_string(dcos_url))
+            exhibitor_admin_password: Optional[str]=None,
+            cache_clients: bool=False,
+            pool_config: Optional[helpers.ConnectionPoolConfig]=None,
+            retry_policy: Optional[helpers.RetryPolicy]=None):
+        super().__init__(helpers.Url.from_string(dcos_url), pool_config=pool_config)
+        self.retry_policy = retry_policy if retry_policy is not None else helpers.RetryPolicy()
+        self.shared_pollers = helpers.SharedPollers()
         self.master_list = masters
         self.slave_list = slaves
         self.public_slave_list = public_slaves
         self.auth_user = auth_user
         self.exhibitor_admin_password = exhibitor_admin_password
+        self.cache_clients = cache_clients
+        self._client_cache = {}
 
     @classmethod
     def create(cls):
@@ -136,6 +240,9 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         * **MASTER_HOSTS**: a complete list of the expected master IPs (optional)
         * **SLAVE_HOSTS**: a complete list of the expected private slaves IPs (optional)
         * **PUBLIC_SLAVE_HOSTS**: a complete list of the public slave IPs (optional)
+        * **DCOS_HTTP_POOL_CONNECTIONS**, **DCOS_HTTP_POOL_MAXSIZE**, **DCOS_HTTP_POOL_BLOCK**,
+          **DCOS_HTTP_KEEP_ALIVE**, **DCOS_HTTP_TCP_KEEPALIVE**: HTTP connection pool settings (optional),
+          see :func:`~dcos_test_utils.helpers.ConnectionPoolConfig.from_env`
 
         :returns: arguments to initialize a DcosApiSesssion
         :rtype: dict
@@ -161,7 +268,8 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             'dcos_url': os.getenv('DCOS_DNS_ADDRESS', 'http://leader.mesos'),
             'masters': masters.split(',') if masters is not None else None,
             'slaves': slaves.split(',') if slaves is not None else [],
-            'public_slaves': public_slaves.split(',') if public_slaves is not None else []}
+            'public_slaves': public_slaves.split(',') if public_slaves is not None else [],
+            'pool_config': helpers.ConnectionPoolConfig.from_env()}
 
     @property
     def masters(self) -> List[str]:
@@ -214,7 +322,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
                 [s['hostname'] for s in slaves_json if s['attributes'].get('public_ip') == 'true'])
             log.info('Public slave list set as: {}'.format(self.public_slaves))
 
-    @retrying.retry(wait_fixed=5000, stop_max_delay=120 * 1000)
+    @helpers.poll('dcos_api.login_default_user', timeout=120, initial_interval=5, max_interval=5)
     def login_default_user(self):
         """retry default user login because in some deployments,
         the login endpoint might not be routable immediately
@@ -245,10 +353,11 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         # Set requests auth
         self.session.auth = DcosAuth(self.auth_user.auth_token)
 
-    @retrying.retry(wait_fixed=1000,
-                    stop_max_delay=5*60*1000,
-                    retry_on_result=lambda ret: ret is False,
-                    retry_on_exception=lambda x: False)
+    @helpers.poll('dcos_api.wait_for_marathon_up',
+                  timeout=5*60,
+                  max_interval=1,
+                  retry_on_result=lambda ret: ret is False,
+                  retry_on_exception=lambda x: False)
     def _wait_for_marathon_up(self):
         r = self.get('/marathon/v2/info')
         # http://mesosphere.github.io/marathon/api-console/index.html
@@ -261,7 +370,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             log.info(msg.format(r.status_code))
             return False
 
-    @retrying.retry(wait_fixed=1000, stop_max_delay=5*60*1000)
+    @helpers.poll('dcos_api.wait_for_zk_quorum', timeout=5*60, max_interval=1)
     def _wait_for_zk_quorum(self):
         """Queries exhibitor to ensure all master ZKs have joined
         """
@@ -275,10 +384,11 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         # zk nodes will be private but masters can be public
         assert len(zk_nodes) == len(self.masters), 'ZooKeeper has not formed the expected quorum'
 
-    @retrying.retry(wait_fixed=1000,
-                    stop_max_delay=5*60*1000,
-                    retry_on_result=lambda ret: ret is False,
-                    retry_on_exception=lambda x: False)
+    @helpers.poll('dcos_api.wait_for_slaves_to_join',
+                  timeout=5*60,
+                  max_interval=1,
+                  retry_on_result=lambda ret: ret is False,
+                  retry_on_exception=lambda x: False)
     def _wait_for_slaves_to_join(self):
         r = self.get('/mesos/master/slaves')
         if r.status_code != 200:
@@ -299,10 +409,11 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             log.info(msg.format(num_slaves, self.all_slaves))
             return False
 
-    @retrying.retry(wait_fixed=1000,
-                    stop_max_delay=5*60*1000,
-                    retry_on_result=lambda ret: ret is False,
-                    retry_on_exception=lambda x: False)
+    @helpers.poll('dcos_api.wait_for_adminrouter_up',
+                  timeout=5*60,
+                  max_interval=1,
+                  retry_on_result=lambda ret: ret is False,
+                  retry_on_exception=lambda x: False)
     def _wait_for_adminrouter_up(self):
         try:
             # Yeah, we can also put it in retry_on_exception, but
@@ -316,65 +427,94 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             log.info("Nginx is UP!")
             return True
 
-    # Retry if returncode is False, do not retry on exceptions.
-    # We don't want to infinite retries while waiting for agent endpoints,
-    # when we are retrying on both HTTP 502 and 404 statuses
-    # Added a stop_max_attempt to 60.
-    @retrying.retry(wait_fixed=2000,
-                    retry_on_result=lambda r: r is False,
-                    retry_on_exception=lambda _: False,
-                    stop_max_attempt_number=60)
-    def _wait_for_srouter_slaves_endpoints(self):
-        # Get currently known agents. This request is served straight from
-        # Mesos (no AdminRouter-based caching is involved).
-        r = self.get('/mesos/master/slaves')
-
-        # If the agent has restarted, the mesos endpoint can give 502
-        # for a brief moment.
-        if r.status_code == 502:
+    def _srouter_slave_endpoint_ready(self, slave_id: str) -> bool:
+        """ Returns True if Admin Router serves the state endpoint of the given
+        agent and False if the agent is still coming up
+        """
+        in_progress_status_codes = (
+            # AdminRouter's slave endpoint internally uses cached Mesos
+            # state data. That is, slave IDs of just recently joined
+            # slaves can be unknown here. For those, this endpoint
+            # returns a 404. Retry in this case, until this endpoint
+            # is confirmed to work for all known agents.
+            404,
+            # During a node restart or a DC/OS upgrade, this
+            # endpoint returns a 502 temporarily, until the agent has
+            # started up and the Mesos agent HTTP server can be reached.
+            502,
+            # We have seen this endpoint return 503 with body
+            # b'Agent has not finished recovery' on a cluster which
+            # later became healthy.
+            503,
+        )
+        uri = '/slave/{}/slave%281%29/state'.format(slave_id)
+        r = self.get(uri)
+        if r.status_code in in_progress_status_codes:
             return False
-
-        assert r.status_code == 200
-
+        assert r.status_code == 200, (
+            'Expecting status code 200 for GET request to {uri} but got '
+            '{status_code} with body {content}'
+        ).format(uri=uri, status_code=r.status_code, content=r.content)
         data = r.json()
-        # only check against the slaves we expect to be in the cluster
-        # so we can check that cluster has returned after a failure
-        # in which case will will have new slaves and dead slaves
-        slaves_ids = sorted(x['id'] for x in data['slaves'] if x['hostname'] in self.all_slaves)
-
-        for slave_id in slaves_ids:
-            in_progress_status_codes = (
-                # AdminRouter's slave endpoint internally uses cached Mesos
-                # state data. That is, slave IDs of just recently joined
-                # slaves can be unknown here. For those, this endpoint
-                # returns a 404. Retry in this case, until this endpoint
-                # is confirmed to work for all known agents.
-                404,
-                # During a node restart or a DC/OS upgrade, this
-                # endpoint returns a 502 temporarily, until the agent has
-                # started up and the Mesos agent HTTP server can be reached.
-                502,
-                # We have seen this endpoint return 503 with body
-                # b'Agent has not finished recovery' on a cluster which
-                # later became healthy.
-                503,
-            )
-            uri = '/slave/{}/slave%281%29/state'.format(slave_id)
-            r = self.get(uri)
-            if r.status_code in in_progress_status_codes:
+        assert "id" in data
+        assert data["id"] == slave_id
+        return True
+
+    def _wait_for_srouter_slaves_endpoints(self, parallelism: int=10):
+        """ Waits until Admin Router serves the state endpoint of every expected agent.
+        Agents are probed concurrently by up to parallelism workers. Agents that have
+        already been confirmed are remembered, so later attempts only re-poll the
+        stragglers
+
+        :param parallelism: number of agents to probe at the same time
+        :type parallelism: int
+        """
+        ready_slave_ids = set()
+
+        # Retry if returncode is False, do not retry on exceptions.
+        # We don't want to infinite retries while waiting for agent endpoints,
+        # when we are retrying on both HTTP 502 and 404 statuses
+        # Added a stop_max_attempt to 60.
+        @helpers.poll('dcos_api.wait_for_srouter_slaves_endpoints',
+                      max_interval=2,
+                      retry_on_result=lambda r: r is False,
+                      retry_on_exception=lambda _: False,
+                      max_attempts=60)
+        def wait():
+            # Get currently known agents. This request is served straight from
+            # Mesos (no AdminRouter-based caching is involved).
+            r = self.get('/mesos/master/slaves')
+
+            # If the agent has restarted, the mesos endpoint can give 502
+            # for a brief moment.
+            if r.status_code == 502:
                 return False
-            assert r.status_code == 200, (
-                'Expecting status code 200 for GET request to {uri} but got '
-                '{status_code} with body {content}'
-            ).format(uri=uri, status_code=r.status_code, content=r.content)
-            data = r.json()
-            assert "id" in data
-            assert data["id"] == slave_id
 
-    @retrying.retry(wait_fixed=2000,
-                    stop_max_delay=5*60*1000,
-                    retry_on_result=lambda r: r is False,
-                    retry_on_exception=lambda _: False)
+            assert r.status_code == 200
+
+            data = r.json()
+            # only check against the slaves we expect to be in the cluster
+            # so we can check that cluster has returned after a failure
+            # in which case will will have new slaves and dead slaves
+            slaves_ids = sorted(x['id'] for x in data['slaves'] if x['hostname'] in self.all_slaves)
+            pending = [slave_id for slave_id in slaves_ids if slave_id not in ready_slave_ids]
+            if not pending:
+                return True
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+                results = list(executor.map(self._srouter_slave_endpoint_ready, pending))
+            ready_slave_ids.update(slave_id for slave_id, ready in zip(pending, results) if ready)
+            log.info('Admin Router agent endpoints ready: {} of {}'.format(
+                len(ready_slave_ids.intersection(slaves_ids)), len(slaves_ids)))
+            return all(results)
+
+        wait()
+
+    @helpers.poll('dcos_api.wait_for_metronome',
+                  timeout=5*60,
+                  max_interval=2,
+                  retry_on_result=lambda r: r is False,
+                  retry_on_exception=lambda _: False)
     def _wait_for_metronome(self):
         # Although this is named `wait_for_metronome`, some of the waiting
         # done in this function is, implicitly, for Admin Router.
@@ -401,9 +541,10 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         assert r.status_code == 200, "Expecting status code 200 for Metronome but got {} with body {}"\
             .format(r.status_code, r.content)
 
-    @retrying.retry(wait_fixed=2000,
-                    retry_on_result=lambda r: r is False,
-                    retry_on_exception=lambda _: False)
+    @helpers.poll('dcos_api.wait_for_all_healthy_services',
+                  max_interval=2,
+                  retry_on_result=lambda r: r is False,
+                  retry_on_exception=lambda _: False)
     def _wait_for_all_healthy_services(self):
         r = self.health.get('/units')
         r.raise_for_status()
@@ -416,15 +557,46 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
 
         return all_healthy
 
-    def wait_for_dcos(self):
+    def wait_for_dcos(self) -> dict:
         """ This method will wait for:
         * cluster endpoints to come up immediately after deployment has completed
         * authentication with DC/OS to be successful
         * all DC/OS services becoming healthy
         * all explicitly declared nodes register to register
+
+        Checks that do not depend on each other are run concurrently, see
+        :func:`run_readiness_probes`
+
+        :returns: mapping of readiness probe name to the number of seconds it took to pass
+        :rtype: dict
+        """
+        self.readiness_timings = run_readiness_probes([
+            ReadinessProbe('adminrouter', self._probe_on_copy('_wait_for_adminrouter_up'), ()),
+            ReadinessProbe('login', self.login_default_user, ('adminrouter',)),
+            ReadinessProbe('node_lists', self._check_and_set_node_lists, ('login',)),
+            ReadinessProbe('marathon', self._probe_on_copy('_wait_for_marathon_up'), ('node_lists',)),
+            ReadinessProbe('zk_quorum', self._probe_on_copy('_wait_for_zk_quorum'), ('node_lists',)),
+            ReadinessProbe('slaves_joined', self._probe_on_copy('_wait_for_slaves_to_join'), ('node_lists',)),
+            ReadinessProbe('srouter_slaves_endpoints', self._probe_on_copy('_wait_for_srouter_slaves_endpoints'),
+                           ('slaves_joined',)),
+            ReadinessProbe('metronome', self._probe_on_copy('_wait_for_metronome'), ('node_lists',)),
+            ReadinessProbe('healthy_services', self._probe_on_copy('_wait_for_all_healthy_services'),
+                           ('node_lists',))])
+        return self.readiness_timings
+
+    def _probe_on_copy(self, name: str):
+        """ Returns a readiness check which calls the method name on a copy of this session
+        made when the check starts. Probes run concurrently on worker threads and
+        requests.Session is not thread-safe, so each of them gets a session of its own.
+        The login and node_lists probes change this session itself; no other probe runs
+        at the same time as they do
+        """
+        return lambda: getattr(self.copy(), name)()
+
+    def _check_and_set_node_lists(self):
+        """ Checks that all host lists were supplied if the cluster is set to wait for
+        hosts, then fills in the lists that are unset from the cluster
         """
-        self._wait_for_adminrouter_up()
-        self.login_default_user()
         wait_for_hosts = os.getenv('WAIT_FOR_HOSTS', 'true') == 'true'
         master_list_set = self.master_list is not None
         slave_list_set = self.slave_list is not None
@@ -438,20 +610,36 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
                 'Alternatively, set WAIT_FOR_HOSTS=false in the environment to use whichever hosts '
                 'are currently registered.')
         self.set_node_lists_if_unset()
-        self._wait_for_marathon_up()
-        self._wait_for_zk_quorum()
-        self._wait_for_slaves_to_join()
-        self._wait_for_srouter_slaves_endpoints()
-        self._wait_for_metronome()
-        self._wait_for_all_healthy_services()
 
     def copy(self):
         """ Create a new client session from this one without cookies, with the authentication intact.
+        The new client shares this session's connection pools but has its own headers and cookies,
+        see :func:`~dcos_test_utils.helpers.derive_session`
         """
-        new = copy.deepcopy(self)
-        new.session.cookies.clear()
+        new = copy.copy(self)
+        new.session = helpers.derive_session(self.session)
+        new.auth_user = copy.copy(self.auth_user)
+        for attr in ('master_list', 'slave_list', 'public_slave_list'):
+            setattr(new, attr, copy.copy(getattr(self, attr)))
+        new._client_cache = {}
         return new
 
+    def _client_cache_key(self) -> tuple:
+        """ State which clients cached by :func:`cached_client` were derived from.
+        Auth objects are compared by identity, so logging in again invalidates the cache.
+        The node lists are copied into tuples, so that changing a list in place does too
+        """
+        return (
+            self.session.auth,
+            self.session.verify,
+            self.auth_user,
+            getattr(self.auth_user, 'auth_token', None),
+            str(self.default_url),
+            None if self.master_list is None else tuple(self.master_list),
+            None if self.slave_list is None else tuple(self.slave_list),
+            None if self.public_slave_list is None else tuple(self.public_slave_list),
+            self.exhibitor_admin_password)
+
     def get_user_session(self, user: DcosUser):
         """Returns a copy of this client session with a new user
 
@@ -467,6 +655,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         return new
 
     @property
+    @cached_client
     def exhibitor(self):
         """ Property which creates a new :class:`Exhibitor`
         """
@@ -484,6 +673,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             exhibitor_admin_password=self.exhibitor_admin_password)
 
     @property
+    @cached_client
     def marathon(self):
         """ Property which returns a :class:`dcos_test_utils.marathon.Marathon`
         derived from this session
@@ -493,6 +683,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             session=self.copy().session)
 
     @property
+    @cached_client
     def metronome(self):
         """ Property which returns a copy of this session where all requests are
         prefaced with /service/metronome
@@ -502,6 +693,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         return new
 
     @property
+    @cached_client
     def jobs(self):
         """ Property which returns a :class:`dcos_test_utils.jobs.Jobs`
         derived from this session
@@ -511,6 +703,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
                 session=self.copy().session)
 
     @property
+    @cached_client
     def cosmos(self):
         """ Property which returns a :class:`dcos_test_utils.package.Cosmos`
         derived from this session
@@ -520,6 +713,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             session=self.copy().session)
 
     @property
+    @cached_client
     def health(self):
         """ Property which returns a :class:`dcos_test_utils.diagnostics.Diagnostics`
         derived from this session
@@ -532,6 +726,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
             session=self.copy().session)
 
     @property
+    @cached_client
     def logs(self):
         """ Property which returns a copy of this session where all requests are
         prefaced with /system/v1/logs
@@ -541,6 +736,7 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         return new
 
     @property
+    @cached_client
     def metrics(self):
         """ Property which returns a copy of this session where all requests are
         prefaced with /system/v1/metrics/v0
@@ -676,6 +872,32 @@ class DcosApiSession(helpers.ARNodeApiClientMixin, helpers.RetryCommonHttpErrors
         r.raise_for_status()
         return r.text
 
+    def mesos_operator_events(
+            self,
+            chunk_size: int=recordio.DEFAULT_CHUNK_SIZE,
+            **kwargs) -> Generator[dict, None, None]:
+        """ Subscribes to the Mesos operator API and lazily yields its events. The
+        underlying stream is decoded incrementally, so it can be tailed indefinitely
+        without accumulating events in memory
+
+        :param chunk_size: number of bytes to read from the stream at a time
+        :type chunk_size: int
+        :param kwargs: any keyword args that can be passed to :func:`DcosApiSession.post`
+
+        :returns: generator of event dicts, starting with the SUBSCRIBED event
+        """
+        r = self.post(
+            '/mesos/api/v1',
+            json={'type': 'SUBSCRIBE'},
+            headers={'Accept': 'application/json'},
+            stream=True,
+            **kwargs)
+        r.raise_for_status()
+        try:
+            yield from recordio.iter_records(r, lambda d: json.loads(d.decode('UTF-8')), chunk_size)
+        finally:
+            r.close()
+
     def get_version(self) -> str:
         """ Queries the DC/OS version endpoint to get DC/OS version
 
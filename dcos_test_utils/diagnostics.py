@@ -5,12 +5,21 @@ Based on the utilities in dcos/dcos-integration-tests test_dcos_diagnostics.py
 This is tested via the test_dcos_diagnostics.py module in the dcos-integration-test module in dcos/dcos
 """
 
+import collections
+import concurrent.futures
 import datetime
+import fnmatch
+import hashlib
 import logging
 import os
+import re
+import struct
+import threading
+import time
+import shutil
 import uuid
-
-import retrying
+import zipfile
+import zlib
 
 from dcos_test_utils import helpers
 
@@ -18,11 +27,237 @@ from dcos_test_utils.helpers import (
     ARNodeApiClientMixin,
     ApiClientSession,
     RetryCommonHttpErrorsMixin,
-    check_json
+    check_json,
+    poll
 )
 
 log = logging.getLogger(__name__)
 
+# Bytes read from the network and written to disk at a time while downloading bundles
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DownloadResult = collections.namedtuple(
+    'DownloadResult', ['path', 'size', 'seconds', 'resumed_from', 'checksum', 'extracted'])
+
+
+class _DownloadProgress:
+    """ Thread-safe byte counter of one bundle download which reports to an optional callback
+    """
+    def __init__(self, bundle: str, callback=None):
+        self.bundle = bundle
+        self.callback = callback
+        self.total = None
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+    def add(self, size: int):
+        with self._lock:
+            self.downloaded += size
+            if self.callback is not None:
+                self.callback(self.bundle, self.downloaded, self.total)
+
+
+class _BundlePipeline:
+    """ Consumes a bundle in order while it is downloaded: hashes it and extracts the
+    zip members whose names match one of the patterns, reading the local file headers
+    as they go by instead of the central directory at the end of the file. Only the
+    current header and chunk are held in memory. Members which cannot be parsed as a
+    stream (e.g. stored ones whose size follows the data, as zipfile writes them to a
+    non-seekable file) end the streaming parse; the remaining members are extracted
+    from the finished bundle through its central directory instead
+
+    :param checksum: hashlib algorithm name, e.g. 'sha256', or None to not hash
+    :param extract: fnmatch patterns of the member names to extract, or None
+    :param extract_directory: directory the matching members are written to
+    """
+    LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+    LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+    DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+
+    def __init__(self, checksum=None, extract=None, extract_directory=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        self.hash = hashlib.new(checksum) if checksum else None
+        self.patterns = list(extract or [])
+        self.extract_directory = extract_directory
+        self.chunk_size = chunk_size
+        self.extracted = []
+        self._buffer = b''
+        self._state = 'header' if self.patterns else 'done'
+        self._member = None
+        self._streamed = set()
+        self._unstreamable = None
+
+    def feed(self, data: bytes):
+        if self.hash is not None:
+            self.hash.update(data)
+        if self._state == 'done':
+            return
+        self._buffer += data
+        while self._state != 'done' and self._step():
+            pass
+
+    def close(self, path=None):
+        """ Returns the hex digest (or None) and the paths of the extracted members
+
+        :param path: path of the complete bundle, needed to extract the members which could not be streamed
+        """
+        if self._state not in ('header', 'done'):
+            raise ValueError('Bundle ended in the middle of zip member {}'.format(self._member['name']))
+        if self._unstreamable is not None:
+            self._extract_remaining(path)
+        return (self.hash.hexdigest() if self.hash is not None else None), self.extracted
+
+    def _extract_remaining(self, path):
+        log.info('Cannot stream zip member {}, extracting the remaining members from {}'.format(
+            self._unstreamable, path))
+        with zipfile.ZipFile(path) as bundle:
+            for info in bundle.infolist():
+                if info.filename in self._streamed:
+                    continue
+                output = self._open_member(info.filename)
+                if output is None:
+                    continue
+                # zipfile checks the CRC once the member is read to the end
+                with output, bundle.open(info) as member:
+                    shutil.copyfileobj(member, output, self.chunk_size)
+
+    def _step(self) -> bool:
+        """ Consumes what it can from the buffer, returns False if more data is needed
+        """
+        if self._state == 'header':
+            return self._read_header()
+        if self._state == 'data':
+            return self._read_data()
+        return self._read_descriptor()
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < 4:
+            return False
+        if self._buffer[:4] != self.LOCAL_HEADER_SIGNATURE:
+            # the central directory follows the last member
+            self._state = 'done'
+            self._buffer = b''
+            return False
+        if len(self._buffer) < self.LOCAL_HEADER.size:
+            return False
+        _, _, flags, method, _, _, crc, compressed, _, name_length, extra_length = \
+            self.LOCAL_HEADER.unpack_from(self._buffer)
+        end = self.LOCAL_HEADER.size + name_length + extra_length
+        if len(self._buffer) < end:
+            return False
+        name = self._buffer[self.LOCAL_HEADER.size:end - extra_length].decode(
+            'utf-8' if flags & 0x800 else 'cp437')
+        zip64 = self._zip64_compressed_size(self._buffer[end - extra_length:end], compressed)
+        if zip64 is not None:
+            compressed = zip64
+        # the end of a stored member is unknown without its size, other methods cannot be decompressed here
+        if (method == 0 and flags & 0x08) or (method not in (0, 8) and (flags & 0x08 or self._matches(name))):
+            self._unstreamable = name
+            self._state = 'done'
+            self._buffer = b''
+            return False
+        self._buffer = self._buffer[end:]
+        self._member = {
+            'name': name,
+            'crc': crc,
+            # with bit 3 set the sizes and crc follow the data in a descriptor
+            'descriptor': bool(flags & 0x08),
+            'remaining': None if flags & 0x08 else compressed,
+            'consumed': 0,
+            'size': 0,
+            'zip64': zip64 is not None,
+            'decompressor': zlib.decompressobj(-zlib.MAX_WBITS) if method == 8 else None,
+            'output': self._open_member(name),
+            'actual_crc': 0,
+        }
+        self._state = 'data'
+        return True
+
+    @staticmethod
+    def _zip64_compressed_size(extra: bytes, compressed: int):
+        if compressed != 0xFFFFFFFF:
+            return None
+        while len(extra) >= 4:
+            header_id, size = struct.unpack_from('<2H', extra)
+            if header_id == 0x0001:
+                # uncompressed size then compressed size, both present as the header sizes are maxed out
+                return struct.unpack_from('<2Q', extra, 4)[1]
+            extra = extra[4 + size:]
+        return None
+
+    def _matches(self, name: str) -> bool:
+        return not name.endswith('/') and any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _open_member(self, name: str):
+        if not self._matches(name):
+            return None
+        root = os.path.abspath(self.extract_directory)
+        path = os.path.abspath(os.path.join(root, name))
+        if os.path.isabs(name) or not path.startswith(root + os.sep):
+            log.warning('Not extracting zip member outside of the extract directory: {}'.format(name))
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.extracted.append(path)
+        return open(path, 'wb')
+
+    def _read_data(self) -> bool:
+        member = self._member
+        data = self._buffer
+        if member['remaining'] is not None:
+            data = data[:member['remaining']]
+            member['remaining'] -= len(data)
+        self._buffer = self._buffer[len(data):]
+        member['consumed'] += len(data)
+        decompressor = member['decompressor']
+        if decompressor is None:
+            self._write(data)
+        else:
+            while data and not decompressor.eof:
+                self._write(decompressor.decompress(data, self.chunk_size))
+                data = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # what follows the deflate stream is the descriptor or the next member. It is
+                # all in unused_data, unconsumed_tail may still hold a stale copy of it
+                self._buffer = decompressor.unused_data + self._buffer
+                member['consumed'] -= len(decompressor.unused_data)
+                member['remaining'] = 0
+        if member['remaining'] is None or member['remaining'] > 0:
+            return False
+        if member['descriptor']:
+            self._state = 'descriptor'
+        else:
+            self._finish_member(member['crc'])
+        return True
+
+    def _read_descriptor(self) -> bool:
+        member = self._member
+        if len(self._buffer) < 4:
+            return False
+        start = 4 if self._buffer[:4] == self.DESCRIPTOR_SIGNATURE else 0
+        zip64 = member['zip64'] or max(member['consumed'], member['size']) > 0xFFFFFFFF
+        end = start + (20 if zip64 else 12)
+        if len(self._buffer) < end:
+            return False
+        crc = struct.unpack_from('<L', self._buffer, start)[0]
+        self._buffer = self._buffer[end:]
+        self._finish_member(crc)
+        return True
+
+    def _write(self, data: bytes):
+        member = self._member
+        member['size'] += len(data)
+        if member['output'] is not None and data:
+            member['actual_crc'] = zlib.crc32(data, member['actual_crc'])
+            member['output'].write(data)
+
+    def _finish_member(self, crc: int):
+        member = self._member
+        self._state = 'header'
+        self._streamed.add(member['name'])
+        if member['output'] is None:
+            return
+        member['output'].close()
+        if member['actual_crc'] & 0xFFFFFFFF != crc:
+            raise ValueError('CRC mismatch in extracted zip member {}'.format(member['name']))
+
 
 class Diagnostics(ARNodeApiClientMixin, RetryCommonHttpErrorsMixin, ApiClientSession):
     """ Specialized session client for diagnostics service that is aware of the cluster agents
@@ -44,9 +279,7 @@ class Diagnostics(ARNodeApiClientMixin, RetryCommonHttpErrorsMixin, ApiClientSes
             all_slaves: list,
             session=None,
             use_legacy_api=False):
-        super().__init__(default_url)
-        if session is not None:
-            self.session = session
+        super().__init__(default_url, session=session)
         self.masters = masters
         self.all_slaves = all_slaves
         self.use_legacy_api = use_legacy_api
@@ -74,8 +307,8 @@ class Diagnostics(ARNodeApiClientMixin, RetryCommonHttpErrorsMixin, ApiClientSes
 
     # stop_max_delay set to 20 minutes to provide enough time for bundle to be
     # created. See DCOS-41819
-    @retrying.retry(wait_fixed=2000, stop_max_delay=1200000,
-                    retry_on_result=lambda x: x is False)
+    @poll('diagnostics.wait_for_diagnostics_job', timeout=1200, max_interval=2,
+          retry_on_result=lambda x: x is False)
     def wait_for_diagnostics_job(self, last_datapoint: dict):
         """
         initial value of last_datapoint should be
@@ -154,45 +387,177 @@ class Diagnostics(ARNodeApiClientMixin, RetryCommonHttpErrorsMixin, ApiClientSes
                 bundles += map(lambda s: os.path.basename(s['file_name']), bundle_list)
         return bundles
 
-    @retrying.retry(stop_max_delay=50000, wait_fixed=2000, retry_on_result=lambda x: x == [])
+    @poll('diagnostics.wait_for_diagnostics_reports', timeout=50, max_interval=2, retry_on_result=lambda x: x == [])
     def wait_for_diagnostics_reports(self):
         """ Sometimes it may take extra few seconds to list bundles after the job is finished.
         This method will retry until the reports are non empty or 50 seconds has elapsed
         """
         return self.get_diagnostics_reports()
 
-    def download_diagnostics_reports(self, diagnostics_bundles, download_directory=None, master=None):
+    def download_diagnostics_reports(
+            self,
+            diagnostics_bundles,
+            download_directory=None,
+            master=None,
+            chunk_size=DOWNLOAD_CHUNK_SIZE,
+            max_workers=4,
+            segments=1,
+            resume=True,
+            progress=None,
+            checksum=None,
+            extract=None,
+            extract_directory=None):
         """ Given diagnostics bundle names, this method will download them
 
+        Bundles are downloaded concurrently, each to a '.part' file which is renamed
+        once complete. If a '.part' file is left over from an interrupted download,
+        the download resumes where it stopped using an HTTP Range request. The request
+        carries the ETag (or Last-Modified date) the bundle was first served with, kept in
+        a '.part.validator' file, as If-Range, so that the server sends the whole bundle
+        again if it changed since. Without a validator, or if the server does not honor
+        the Range request, the download starts over. With segments > 1, a
+        bundle is split into that many byte ranges which are downloaded in parallel.
+
+        A checksum of each bundle and the extraction of selected zip members can be
+        done while the bytes arrive, so that the bundle is not read again afterwards.
+        This needs the bytes in order and therefore cannot be combined with segments.
+
         Args:
             diagnostics_bundles (List[str]): list of bundle names to download. Result of self.get_diagnostics_reports
             download_directory (str): path, defaults to home directory
+            chunk_size (int): bytes to read and write at a time
+            max_workers (int): number of bundles to download at the same time
+            segments (int): number of byte ranges to download in parallel per bundle
+            resume (bool): resume partial downloads rather than starting over
+            progress (callable): called with the bundle name, the bytes downloaded so
+                far and the bundle size (None if unknown) whenever a chunk was written
+            checksum (str): hashlib algorithm, e.g. 'sha256', to compute the digest of each bundle with
+            extract (List[str]): fnmatch patterns of zip member names to extract,
+                e.g. ['*/dcos-diagnostics-health.json']
+            extract_directory (str): where members are extracted to, in a directory per bundle.
+                Defaults to the download directory
+
+        Returns:
+            dict of bundle name to DownloadResult(path, size, seconds, resumed_from, checksum, extracted)
         """
+        if (checksum or extract) and segments > 1:
+            raise ValueError('checksum and extract need the bundle in order and cannot be used with segments')
         if download_directory is None:
             download_directory = os.path.join(os.path.expanduser('~'))
+        if extract_directory is None:
+            extract_directory = download_directory
         if master is None:
             master = self.masters[0]
+        results = collections.OrderedDict()
+        if not diagnostics_bundles:
+            return results
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(diagnostics_bundles))) as executor:
+            futures = [executor.submit(
+                self._download_bundle, bundle, os.path.join(download_directory, bundle), master,
+                chunk_size, segments, resume, _DownloadProgress(bundle, progress),
+                _BundlePipeline(checksum, extract, _bundle_extract_directory(extract_directory, bundle), chunk_size))
+                for bundle in diagnostics_bundles]
+            for bundle, future in zip(diagnostics_bundles, futures):
+                results[bundle] = future.result()
+        return results
+
+    def _bundle_file_path(self, bundle: str) -> str:
         if self.use_legacy_api:
-            return self._legacy_download_diagnostics_reports(diagnostics_bundles, download_directory, master)
-        return self._download_diagnostics_reports(diagnostics_bundles, download_directory, master)
-
-    def _download_diagnostics_reports(self, diagnostics_bundles, download_directory, master):
-        for bundle in diagnostics_bundles:
-            log.info('Downloading {}'.format(bundle))
-            r = self.get(os.path.join('/diagnostics/', bundle, 'file'), stream=True, node=master)
-            bundle_path = os.path.join(download_directory, bundle)
-            with open(bundle_path, 'wb') as f:
-                for chunk in r.iter_content(1024):
+            return os.path.join('/report/diagnostics/serve', bundle)
+        return os.path.join('/diagnostics/', bundle, 'file')
+
+    def _download_bundle(self, bundle, bundle_path, master, chunk_size, segments, resume, progress, pipeline):
+        log.info('Downloading {}'.format(bundle))
+        start = time.monotonic()
+        part_path = bundle_path + '.part'
+        validator = _read_validator(part_path) if resume and os.path.exists(part_path) else None
+        # without a validator the part may be of another version of the bundle
+        offset = os.path.getsize(part_path) if validator is not None else 0
+        resumed_from = 0
+        if segments > 1 and offset == 0:
+            _write_validator(part_path, None)
+            size = self._download_segments(bundle, part_path, master, chunk_size, segments, progress)
+        else:
+            size, resumed_from = self._download_stream(
+                bundle, part_path, master, chunk_size, offset, progress, pipeline, validator)
+        digest, extracted = pipeline.close(part_path)
+        os.replace(part_path, bundle_path)
+        _write_validator(part_path, None)
+        seconds = time.monotonic() - start
+        log.info('Downloaded {}: {:.1f} MB in {:.1f}s ({:.1f} MB/s)'.format(
+            bundle, size / 2 ** 20, seconds, (size - resumed_from) / 2 ** 20 / max(seconds, 1e-6)))
+        return DownloadResult(bundle_path, size, seconds, resumed_from, digest, extracted)
+
+    def _download_stream(self, bundle, part_path, master, chunk_size, offset, progress, pipeline=None,
+                         validator=None):
+        """ Downloads the bundle into part_path in a single request, appending from offset
+        if the server honors the Range request and the bundle still matches validator, and
+        passes the bytes to the pipeline in order. Returns the size and the offset used
+        """
+        headers = {'Range': 'bytes={}-'.format(offset), 'If-Range': validator} if offset else {}
+        r = self.get(self._bundle_file_path(bundle), stream=True, node=master, headers=headers)
+        if offset and r.status_code == 416:
+            # the range starts past the end, e.g. because the part is complete or stale
+            r.close()
+            offset = 0
+            r = self.get(self._bundle_file_path(bundle), stream=True, node=master)
+        r.raise_for_status()
+        if offset and r.status_code != 206:
+            log.info('Bundle {} changed or the server ignored the Range request, downloading it again'.format(
+                bundle))
+            offset = 0
+        if not offset:
+            _write_validator(part_path, _response_validator(r))
+        if offset:
+            log.info('Resuming download of {} at byte {}'.format(bundle, offset))
+        total = _content_range_total(r.headers.get('Content-Range'))
+        if total is None and 'Content-Length' in r.headers:
+            total = offset + int(r.headers['Content-Length'])
+        progress.total = total
+        progress.add(offset)
+        if pipeline is not None and offset:
+            # the resumed part is read once to catch up, the rest is processed as it arrives
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(min(chunk_size, offset - f.tell())), b''):
+                    pipeline.feed(chunk)
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            for chunk in r.iter_content(chunk_size):
+                f.write(chunk)
+                if pipeline is not None:
+                    pipeline.feed(chunk)
+                progress.add(len(chunk))
+        return progress.downloaded, offset
+
+    def _download_segments(self, bundle, part_path, master, chunk_size, segments, progress):
+        """ Downloads the bundle into part_path as byte ranges fetched in parallel.
+        Falls back to a single stream if the server does not support ranges
+        """
+        r = self.get(self._bundle_file_path(bundle), node=master, headers={'Range': 'bytes=0-0'})
+        r.raise_for_status()
+        size = _content_range_total(r.headers.get('Content-Range'))
+        if r.status_code != 206 or size is None:
+            log.info('Server does not support Range requests for {}, downloading it in one piece'.format(bundle))
+            return self._download_stream(bundle, part_path, master, chunk_size, 0, progress)[0]
+        progress.total = size
+        segment_size = -(-size // segments)
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+
+        def download_segment(first):
+            last = min(first + segment_size, size) - 1
+            r = self.get(self._bundle_file_path(bundle), stream=True, node=master,
+                         headers={'Range': 'bytes={}-{}'.format(first, last)})
+            r.raise_for_status()
+            assert r.status_code == 206, 'Expected a partial response for {}, got {}'.format(bundle, r.status_code)
+            with open(part_path, 'r+b') as f:
+                f.seek(first)
+                for chunk in r.iter_content(chunk_size):
                     f.write(chunk)
+                    progress.add(len(chunk))
 
-    def _legacy_download_diagnostics_reports(self, diagnostics_bundles, download_directory, master):
-        for bundle in diagnostics_bundles:
-            log.info('Downloading {}'.format(bundle))
-            r = self.get(os.path.join('/report/diagnostics/serve', bundle), stream=True, node=master)
-            bundle_path = os.path.join(download_directory, bundle)
-            with open(bundle_path, 'wb') as f:
-                for chunk in r.iter_content(1024):
-                    f.write(chunk)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=segments) as executor:
+            list(executor.map(download_segment, range(0, size, segment_size)))
+        return size
 
     def delete_bundle(self, diagnostics_bundle: str):
         """ Given diagnostics bundle name, this method will delete it
@@ -203,3 +568,47 @@ class Diagnostics(ARNodeApiClientMixin, RetryCommonHttpErrorsMixin, ApiClientSes
         if self.use_legacy_api:
             self.post('/report/diagnostics/delete/' + diagnostics_bundle)
         self.delete('/diagnostics/' + diagnostics_bundle)
+
+
+def _content_range_total(content_range):
+    """ Returns the complete length from a 'Content-Range: bytes 0-99/1234' header, if known
+    """
+    match = re.match(r'bytes \S+/(\d+)$', content_range or '')
+    return int(match.group(1)) if match else None
+
+
+def _response_validator(response):
+    """ Returns the strong ETag or else the Last-Modified date of a response, which a
+    later If-Range request can use to check the resource is unchanged, or None
+    """
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _read_validator(part_path: str):
+    """ Returns the validator stored next to a part file, or None
+    """
+    try:
+        with open(part_path + '.validator') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_validator(part_path: str, validator) -> None:
+    """ Stores the validator of the bundle being downloaded to part_path, or removes it if None
+    """
+    if validator is None:
+        if os.path.exists(part_path + '.validator'):
+            os.remove(part_path + '.validator')
+        return
+    with open(part_path + '.validator', 'w') as f:
+        f.write(validator)
+
+
+def _bundle_extract_directory(extract_directory: str, bundle: str) -> str:
+    """ Members of a bundle are extracted next to the other bundles' in a directory named after it
+    """
+    return os.path.join(extract_directory, os.path.splitext(bundle)[0] + '-extracted')
@@ -83,12 +83,14 @@ class EnterpriseApiSession(MesosNodeClientMixin, dcos_api.DcosApiSession):
         return api
 
     @property
+    @dcos_api.cached_client
     def iam(self):
         """ Property which generates a new client for :class:`~dcos_test_utils.iam.Iam`
         """
         return iam.Iam(self.default_url.copy(path='acs/api/v1'), session=self.copy().session)
 
     @property
+    @dcos_api.cached_client
     def secrets(self):
         """ Property which generates a new client where all paths are prepended with /secrets/v1
         """
@@ -97,6 +99,7 @@ class EnterpriseApiSession(MesosNodeClientMixin, dcos_api.DcosApiSession):
         return new
 
     @property
+    @dcos_api.cached_client
     def ca(self):
         """ Property which generates a new client where all paths are prepended with /ca/api/v2
         """
@@ -142,11 +145,15 @@ class EnterpriseApiSession(MesosNodeClientMixin, dcos_api.DcosApiSession):
         for o in r.json()['array']:
             self.initial_resource_ids.append(o['rid'])
 
-    def wait_for_dcos(self):
+    def wait_for_dcos(self) -> dict:
         """ This method will wait for basic DC/OS services to be running. Once basic endpoints are up,
         this method will set the custom CA cert and authenticate with the cluster
+
+        :returns: readiness probe timings, see :func:`~dcos_test_utils.dcos_api.DcosApiSession.wait_for_dcos`
+        :rtype: dict
         """
         if self.ssl_enabled:
             self.set_ca_cert()
-        super().wait_for_dcos()
+        timings = super().wait_for_dcos()
         self.set_initial_resource_ids()
+        return timings
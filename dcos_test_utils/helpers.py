@@ -1,11 +1,23 @@
 """Various helpers for test runners and integration testing directly
 """
+import asyncio
 import atexit
+import concurrent.futures
+import copy
+import datetime
+import email.utils
+import functools
 import logging
 import os
+import random
+import socket
 import tempfile
-from collections import namedtuple
-from typing import Union
+import threading
+import time
+import weakref
+from collections import Counter, namedtuple, OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Union
 from urllib.parse import urlsplit, urlunsplit
 
 import requests
@@ -16,6 +28,9 @@ SshInfo = namedtuple('SshInfo', ['user', 'home_dir'])
 
 log = logging.getLogger(__name__)
 
+# Matches the requests/urllib3 default of 10 connections per host.
+DEFAULT_POOL_SIZE = 10
+
 
 # Token valid until 2036 for user albert@bekstil.net
 #    {
@@ -103,6 +118,157 @@ class Url:
             port if port is not None else self.port)
 
 
+class ConnectionPoolConfig:
+    """ HTTP connection pool settings for the adapters of an :class:`ApiClientSession`
+
+    :param pool_connections: number of per-host connection pools to keep
+    :type pool_connections: int
+    :param pool_maxsize: number of connections to keep alive per host
+    :type pool_maxsize: int
+    :param pool_block: if True, requests wait for a free connection once pool_maxsize
+        connections to a host are in use instead of opening a connection that is thrown away afterwards
+    :type pool_block: bool
+    :param keep_alive: if False, servers are asked to close the connection after every request
+    :type keep_alive: bool
+    :param tcp_keepalive: if True, enable TCP keepalive probes (SO_KEEPALIVE) on new connections
+    :type tcp_keepalive: bool
+    :param socket_options: (level, option, value) tuples to set on new connections.
+        Defaults to urllib3's defaults (TCP_NODELAY)
+    :type socket_options: list
+    """
+    def __init__(
+            self,
+            pool_connections: int=DEFAULT_POOL_SIZE,
+            pool_maxsize: int=DEFAULT_POOL_SIZE,
+            pool_block: bool=False,
+            keep_alive: bool=True,
+            tcp_keepalive: bool=False,
+            socket_options: Optional[list]=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.tcp_keepalive = tcp_keepalive
+        self.socket_options = socket_options
+
+    @classmethod
+    def from_env(cls) -> Optional['ConnectionPoolConfig']:
+        """ Creates a config from environment variables, or returns None if none of them are set
+
+        Environment Variables:
+
+        * **DCOS_HTTP_POOL_CONNECTIONS**: number of per-host connection pools to keep
+        * **DCOS_HTTP_POOL_MAXSIZE**: number of connections to keep alive per host
+        * **DCOS_HTTP_POOL_BLOCK**: 'true' to wait for a free connection when a pool is exhausted
+        * **DCOS_HTTP_KEEP_ALIVE**: 'false' to close connections after every request
+        * **DCOS_HTTP_TCP_KEEPALIVE**: 'true' to enable TCP keepalive probes
+        """
+        env = {k: os.environ[k] for k in (
+            'DCOS_HTTP_POOL_CONNECTIONS',
+            'DCOS_HTTP_POOL_MAXSIZE',
+            'DCOS_HTTP_POOL_BLOCK',
+            'DCOS_HTTP_KEEP_ALIVE',
+            'DCOS_HTTP_TCP_KEEPALIVE') if k in os.environ}
+        if not env:
+            return None
+        return cls(
+            pool_connections=int(env.get('DCOS_HTTP_POOL_CONNECTIONS', DEFAULT_POOL_SIZE)),
+            pool_maxsize=int(env.get('DCOS_HTTP_POOL_MAXSIZE', DEFAULT_POOL_SIZE)),
+            pool_block=env.get('DCOS_HTTP_POOL_BLOCK', 'false') == 'true',
+            keep_alive=env.get('DCOS_HTTP_KEEP_ALIVE', 'true') == 'true',
+            tcp_keepalive=env.get('DCOS_HTTP_TCP_KEEPALIVE', 'false') == 'true')
+
+    def copy(self, **kwargs) -> 'ConnectionPoolConfig':
+        """ return new ConnectionPoolConfig with any setting replaced
+        """
+        settings = dict(self.__dict__)
+        settings.update(kwargs)
+        return ConnectionPoolConfig(**settings)
+
+    def all_socket_options(self) -> list:
+        """ Returns the socket options to set on new connections
+        """
+        if self.socket_options is not None:
+            options = list(self.socket_options)
+        else:
+            options = list(requests.packages.urllib3.connection.HTTPConnection.default_socket_options)
+        if self.tcp_keepalive:
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        return options
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """ HTTPAdapter configured from a :class:`ConnectionPoolConfig` which also keeps
+    track of how often requests reused a pooled connection
+
+    :param pool_config: connection pool settings
+    :type pool_config: ConnectionPoolConfig
+    """
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + ['pool_config']
+
+    def __init__(self, pool_config: ConnectionPoolConfig):
+        self.pool_config = pool_config
+        super().__init__(
+            pool_connections=pool_config.pool_connections,
+            pool_maxsize=pool_config.pool_maxsize,
+            pool_block=pool_config.pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs['socket_options'] = self.pool_config.all_socket_options()
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        # keep the counters of pools that are evicted or closed
+        self._retired_requests = 0
+        self._retired_connections = 0
+        dispose = self.poolmanager.pools.dispose_func
+
+        def retire(pool):
+            self._retired_requests += pool.num_requests
+            self._retired_connections += pool.num_connections
+            if dispose is not None:
+                dispose(pool)
+        self.poolmanager.pools.dispose_func = retire
+
+    def pool_stats(self) -> dict:
+        """ Returns connection pool usage of this adapter. A request which reused a
+        kept-alive connection is a pool hit, one which had to open a new connection a miss
+
+        :returns: dict with the number of requests, pool_hits, pool_misses and open pools
+        :rtype: dict
+        """
+        num_requests = self._retired_requests
+        num_connections = self._retired_connections
+        pools = self.poolmanager.pools
+        open_pools = 0
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            open_pools += 1
+            num_requests += pool.num_requests
+            num_connections += pool.num_connections
+        return {
+            'requests': num_requests,
+            'pool_hits': max(num_requests - num_connections, 0),
+            'pool_misses': num_connections,
+            'pools': open_pools}
+
+
+def configure_connection_pool(session: requests.Session, pool_config: ConnectionPoolConfig) -> None:
+    """ Mounts a :class:`PooledHTTPAdapter` for HTTP and HTTPS on session
+
+    :param session: session whose adapters will be replaced
+    :type session: requests.Session
+    :param pool_config: connection pool settings
+    :type pool_config: ConnectionPoolConfig
+    """
+    adapter = PooledHTTPAdapter(pool_config)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not pool_config.keep_alive:
+        session.headers['Connection'] = 'close'
+
+
 class ApiClientSession:
     """This class functions like the requests.session interface but adds
     a default Url and a request wrapper. This class only differs from requests.Session
@@ -111,10 +277,20 @@ class ApiClientSession:
 
     :param default_url: The base URL to which all requests will be appended to
     :type default_url: Url
+    :param session: optional session to bootstrap this session with (a new one is created otherwise)
+    :type session: requests.Session
+    :param pool_config: optional connection pool settings to apply to the session
+    :type pool_config: ConnectionPoolConfig
     """
-    def __init__(self, default_url: Url):
+    def __init__(
+            self,
+            default_url: Url,
+            session: Optional[requests.Session]=None,
+            pool_config: Optional[ConnectionPoolConfig]=None):
         self.default_url = default_url
-        self.session = requests.Session()
+        self.session = session if session is not None else requests.Session()
+        if pool_config is not None:
+            configure_connection_pool(self.session, pool_config)
 
     def api_request(self, method, path_extension, *, scheme=None, host=None, query=None,
                     fragment=None, port=None, **kwargs) -> requests.Response:
@@ -156,6 +332,21 @@ class ApiClientSession:
         self.session.cookies.clear()
         return r
 
+    def connection_pool_stats(self) -> dict:
+        """ Returns the combined usage of the connection pools of this session's
+        adapters, see :func:`PooledHTTPAdapter.pool_stats`. Only adapters configured
+        through a :class:`ConnectionPoolConfig` are accounted for
+
+        :returns: dict with the number of requests, pool_hits, pool_misses and open pools
+        :rtype: dict
+        """
+        stats = {'requests': 0, 'pool_hits': 0, 'pool_misses': 0, 'pools': 0}
+        adapters = {id(a): a for a in self.session.adapters.values() if hasattr(a, 'pool_stats')}
+        for adapter in adapters.values():
+            for k, v in adapter.pool_stats().items():
+                stats[k] += v
+        return stats
+
     def get(self, *args, **kwargs):
         """ GET method for :func:`~dcos_test_utils.helpers.ApiClientSession.api_request` method
         """
@@ -192,6 +383,131 @@ class ApiClientSession:
         return self.api_request('OPTIONS', *args, **kwargs)
 
 
+def derive_session(session: requests.Session) -> requests.Session:
+    """ Creates a session which shares the connection pools (adapters), auth and TLS
+    settings of session, but has its own copy of the headers, params, proxies and hooks
+    and an empty cookie jar. This is much cheaper than deep copying a session and keeps
+    its warm keep-alive connections in use
+
+    :param session: session to derive from
+    :type session: requests.Session
+
+    :returns: the derived session
+    :rtype: requests.Session
+    """
+    new = copy.copy(session)
+    new.headers = session.headers.copy()
+    new.cookies = requests.cookies.RequestsCookieJar()
+    new.proxies = dict(session.proxies)
+    new.hooks = {event: list(hooks) for event, hooks in session.hooks.items()}
+    new.params = dict(session.params)
+    # mounting an adapter on the new session must not affect the original
+    new.adapters = OrderedDict(session.adapters)
+    return new
+
+
+class AsyncApiClientSession:
+    """ Asyncio counterpart of :class:`ApiClientSession` with the same request surface.
+    Requests are delegated to the wrapped client, so its Url composition and any
+    mixins it was built with (retries, AR node routing, etc.) apply unchanged. Each
+    request runs on a worker thread of a pool sized to match the connection pool of
+    a session derived from the client's, so many requests can be awaited concurrently
+    from one event loop without changing the connection pools of the client itself:
+
+        async with AsyncApiClientSession(dcos_api_session, pool_size=50) as api:
+            responses = await asyncio.gather(
+                *[api.get('/system/health/v1', node=n) for n in dcos_api_session.all_slaves])
+
+    The worker threads are released by :meth:`close`, which `async with` calls. If it is
+    not called, they are released when the object is garbage collected or at exit.
+
+    :param client: session through which all requests are made
+    :type client: ApiClientSession
+    :param pool_size: maximum number of requests in flight and connections kept per host.
+        Other connection pool settings of the client are kept
+    :type pool_size: int
+    """
+    def __init__(self, client: ApiClientSession, pool_size: int=DEFAULT_POOL_SIZE):
+        self.client = copy.copy(client)
+        self.client.session = derive_session(client.session)
+        self.pool_size = pool_size
+        pool_config = getattr(client.session.get_adapter(str(client.default_url)), 'pool_config', None)
+        if pool_config is None:
+            pool_config = ConnectionPoolConfig()
+        configure_connection_pool(self.client.session, pool_config.copy(pool_maxsize=pool_size))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+        self._release_workers = weakref.finalize(self, self._executor.shutdown, wait=False)
+
+    @property
+    def default_url(self) -> Url:
+        """ Property which returns the default Url of the wrapped client
+        """
+        return self.client.default_url
+
+    async def api_request(self, method, path_extension, **kwargs) -> requests.Response:
+        """ Awaitable wrapper for the wrapped client's api_request method
+
+        :param method: the HTTP verb
+        :type method: str
+        :param path_extension: the extension to the path that is set as the default Url
+        :type path_extension: str
+        :param **kwargs: anything that can be passed to the wrapped client's api_request
+
+        :returns: requests.Response -- response object from the request
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self.client.api_request, method, path_extension, **kwargs))
+
+    async def get(self, *args, **kwargs):
+        """ GET method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('GET', *args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        """ POST method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('POST', *args, **kwargs)
+
+    async def put(self, *args, **kwargs):
+        """ PUT method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('PUT', *args, **kwargs)
+
+    async def patch(self, *args, **kwargs):
+        """ PATCH method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('PATCH', *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        """ DELETE method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('DELETE', *args, **kwargs)
+
+    async def head(self, *args, **kwargs):
+        """ HEAD method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('HEAD', *args, **kwargs)
+
+    async def options(self, *args, **kwargs):
+        """ OPTIONS method for :func:`~dcos_test_utils.helpers.AsyncApiClientSession.api_request` method
+        """
+        return await self.api_request('OPTIONS', *args, **kwargs)
+
+    def close(self) -> None:
+        """ Waits for in-flight requests and releases the worker threads
+        """
+        self._release_workers.detach()
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
 def is_retryable_exception(exception: Exception) -> bool:
     """ Helper method to catch HTTP errors that are likely safe to retry.
     Args:
@@ -204,11 +520,167 @@ def is_retryable_exception(exception: Exception) -> bool:
     return False
 
 
+class RetryPolicy:
+    """ Decides if and when :class:`RetryCommonHttpErrorsMixin` retries a request.
+    Waits grow exponentially from initial_wait up to max_wait between attempts and,
+    with jitter, a random wait between zero and that value is used ("full jitter") so
+    that many clients recovering from the same outage do not retry in lockstep.
+    A policy may be shared between sessions, in which case they share its retry budget
+    and counters
+
+    :param initial_wait: seconds to wait before the first retry
+    :type initial_wait: float
+    :param max_wait: ceiling in seconds for the wait between two attempts
+    :type max_wait: float
+    :param multiplier: factor by which the wait grows after every attempt
+    :type multiplier: float
+    :param jitter: if True, wait a random time between zero and the backoff
+    :type jitter: bool
+    :param retry_statuses: HTTP status codes which are retried like connection
+        errors, e.g. (502, 503). The last response is returned once retries run out
+    :type retry_statuses: tuple
+    :param respect_retry_after: if True, wait as long as the Retry-After header of
+        a retried response asks for (up to the retry timeout)
+    :type respect_retry_after: bool
+    :param retry_budget: total number of retries this policy grants across all
+        requests, or None for no limit
+    :type retry_budget: int
+    """
+    def __init__(
+            self,
+            initial_wait: float=0.5,
+            max_wait: float=10,
+            multiplier: float=2,
+            jitter: bool=True,
+            retry_statuses: tuple=(),
+            respect_retry_after: bool=True,
+            retry_budget: Optional[int]=None):
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+        self.retry_budget = retry_budget
+        self._retry_counts = Counter()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # locks cannot be copied or pickled; the copy gets its own in __setstate__
+        state = self.__dict__.copy()
+        del state['_lock']
+        with self._lock:
+            state['_retry_counts'] = Counter(self._retry_counts)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def retry_counts(self) -> dict:
+        """ Property which returns the number of retries consumed per endpoint ('METHOD /path')
+        """
+        with self._lock:
+            return dict(self._retry_counts)
+
+    @property
+    def retries_remaining(self) -> Optional[int]:
+        """ Property which returns how many retries are left in the budget (None if unlimited)
+        """
+        if self.retry_budget is None:
+            return None
+        with self._lock:
+            return max(self.retry_budget - sum(self._retry_counts.values()), 0)
+
+    def backoff(self, attempt: int) -> float:
+        """ Returns the seconds to wait after the given (zero-based) failed attempt
+        """
+        wait = min(self.max_wait, self.initial_wait * self.multiplier ** attempt)
+        return random.uniform(0, wait) if self.jitter else wait
+
+    def wait_time(self, attempt: int, response: Optional[requests.Response]=None) -> float:
+        """ Returns the seconds to wait before retrying, honoring Retry-After if
+        response asks for a longer wait than the backoff
+        """
+        wait = self.backoff(attempt)
+        if self.respect_retry_after and response is not None:
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                wait = max(wait, retry_after)
+        return wait
+
+    def _consume_retry(self, endpoint: str) -> bool:
+        with self._lock:
+            if self.retry_budget is not None and sum(self._retry_counts.values()) >= self.retry_budget:
+                return False
+            self._retry_counts[endpoint] += 1
+            return True
+
+    def call(self, request: callable, endpoint: str, retry_timeout: float) -> requests.Response:
+        """ Calls request until it succeeds, fails with an error that should not be
+        retried, the retry timeout elapses or the retry budget is used up. In the latter
+        two cases the last exception is raised or the last response returned
+
+        :param request: function making the request and returning a response
+        :type request: callable
+        :param endpoint: name under which retries are counted
+        :type endpoint: str
+        :param retry_timeout: seconds to keep retrying after the first failed attempt
+        :type retry_timeout: float
+        """
+        deadline = None
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = request()
+            except Exception as e:
+                if not is_retryable_exception(e):
+                    raise
+                failure = e
+            else:
+                if not self.retry_statuses or response.status_code not in self.retry_statuses:
+                    return response
+                failure = None
+                log.debug('Retrying HTTP status {} from {}'.format(response.status_code, endpoint))
+
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + retry_timeout
+            wait = self.wait_time(attempt, response)
+            if now + wait > deadline or not self._consume_retry(endpoint):
+                if failure is not None:
+                    raise failure
+                return response
+            time.sleep(wait)
+            attempt += 1
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """ Returns the seconds a Retry-After header value (delay seconds or HTTP date) asks to wait
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+
 class RetryCommonHttpErrorsMixin:
     """ Mixin for ApiClientSession so that random disconnects from network
     instability do not derail entire scripts. This functionality is configured
-    through the retry_timeout keyword
+    through the retry_timeout keyword and the retry_policy attribute (a default
+    :class:`RetryPolicy` is created on first use)
     """
+    retry_policy = None
+
     def api_request(self, *args, retry_timeout: int=60, **kwargs) -> requests.Response:
         """ Adds 'retry_timeout' keyword to API requests.
         Args:
@@ -217,14 +689,14 @@ class RetryCommonHttpErrorsMixin:
             retry_timeout: total number of seconds to keep retrying after
                 the initial exception was raised
         """
-        @retrying.retry(
-            wait_fixed=1000,
-            stop_max_delay=retry_timeout * 1000,
-            retry_on_exception=is_retryable_exception)
-        def retry_errors():
+        if self.retry_policy is None:
+            self.retry_policy = RetryPolicy()
+        endpoint = '{} {}'.format(args[0], self.default_url.path + args[1]) if len(args) >= 2 else repr(args)
+
+        def request():
             return super(RetryCommonHttpErrorsMixin, self).api_request(*args, **kwargs)
 
-        return retry_errors()
+        return self.retry_policy.call(request, endpoint, retry_timeout)
 
 
 class ARNodeApiClientMixin:
@@ -259,6 +731,390 @@ class ARNodeApiClientMixin:
                                    query=query, fragment=fragment, port=port, **kwargs)
 
 
+PollStats = namedtuple('PollStats', ['waits', 'attempts', 'seconds', 'max_seconds', 'timeouts'])
+
+
+class PollTimeout(retrying.RetryError):
+    """ Raised by :class:`Poller` when the condition is not met in time. This is a
+    retrying.RetryError so that code written against the retrying based waiters
+    keeps working
+    """
+    def __init__(self, name: str, attempts: int, seconds: float, last_result=None):
+        super().__init__(retrying.Attempt(last_result, attempts, False))
+        self.name = name
+        self.seconds = seconds
+
+    def __str__(self):
+        return '{} was not satisfied after {} attempts in {:.1f} seconds'.format(
+            self.name, self.last_attempt.attempt_number, self.seconds)
+
+
+class PollCancelled(Exception):
+    """ Raised by :class:`Poller` when the wait was cancelled
+    """
+
+
+class PollTelemetry:
+    """ Collects how long each named waiter took and how many attempts it needed
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name: str, attempts: int, seconds: float, timed_out: bool=False) -> None:
+        with self._lock:
+            stats = self._stats.get(name, PollStats(0, 0, 0.0, 0.0, 0))
+            self._stats[name] = PollStats(
+                stats.waits + 1,
+                stats.attempts + attempts,
+                stats.seconds + seconds,
+                max(stats.max_seconds, seconds),
+                stats.timeouts + int(timed_out))
+
+    def snapshot(self) -> dict:
+        """ Returns a dict of waiter name to :class:`PollStats`
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# Timings of all waiters that poll through Poller
+poll_telemetry = PollTelemetry()
+
+
+class Poller:
+    """ Calls a function until its result (or exception) says the awaited condition
+    is met. It polls quickly at first so that typical waits end shortly after the
+    condition is met, backing off to max_interval so that long waits do not hammer
+    the polled service. Sleeps never extend past the deadline; one last attempt is
+    made right at it. The conditions mirror those of retrying.retry: results are
+    not retried and exceptions are, unless configured otherwise
+
+    :param name: name under which the waiter's timings are recorded in poll_telemetry
+    :type name: str
+    :param timeout: seconds to keep polling, or None to poll indefinitely
+    :type timeout: float
+    :param initial_interval: seconds to wait after the first attempt
+    :type initial_interval: float
+    :param max_interval: ceiling for the seconds between two attempts
+    :type max_interval: float
+    :param multiplier: factor by which the interval grows after every attempt
+    :type multiplier: float
+    :param retry_on_result: predicate for results which mean the condition is not met yet
+    :type retry_on_result: callable
+    :param retry_on_exception: predicate for exceptions which mean the condition is not met yet
+    :type retry_on_exception: callable
+    :param max_attempts: maximum number of attempts, or None for no limit
+    :type max_attempts: int
+    :param cancel_event: event which cancels the wait when set, see :func:`Poller.cancel`.
+        Defaults to the event of the enclosing :func:`cancel_polls` block, if any
+    :type cancel_event: threading.Event
+    """
+    def __init__(
+            self,
+            name: str,
+            timeout: Optional[float]=None,
+            initial_interval: float=0.2,
+            max_interval: float=5,
+            multiplier: float=1.5,
+            retry_on_result: Optional[callable]=None,
+            retry_on_exception: Optional[callable]=None,
+            max_attempts: Optional[int]=None,
+            cancel_event: Optional[threading.Event]=None):
+        self.name = name
+        self.timeout = timeout
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.retry_on_result = retry_on_result or (lambda result: False)
+        self.retry_on_exception = retry_on_exception or (lambda exception: True)
+        self.max_attempts = max_attempts
+        self.cancel_event = cancel_event or getattr(_poll_scope, 'cancel_event', None) or threading.Event()
+
+    def cancel(self) -> None:
+        """ Cancels the wait, which raises PollCancelled at the next attempt or sleep
+        """
+        self.cancel_event.set()
+
+    def intervals(self):
+        """ Generates the seconds to wait after each attempt
+        """
+        interval = self.initial_interval
+        while True:
+            yield min(interval, self.max_interval)
+            interval *= self.multiplier
+
+    def poll(self, fn: callable, *args, **kwargs):
+        """ Calls fn(*args, **kwargs) until the condition is met and returns its result.
+        If polling stops because of the timeout or max_attempts, the last exception
+        is raised if the last attempt raised one, else PollTimeout
+        """
+        start = time.monotonic()
+        deadline = None if self.timeout is None else start + self.timeout
+        attempts = 0
+        intervals = self.intervals()
+        while True:
+            if self.cancel_event.is_set():
+                raise PollCancelled('{} was cancelled'.format(self.name))
+            attempts += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self.retry_on_exception(e):
+                    poll_telemetry.record(self.name, attempts, time.monotonic() - start)
+                    raise
+                failure, result = e, None
+            else:
+                if not self.retry_on_result(result):
+                    poll_telemetry.record(self.name, attempts, time.monotonic() - start)
+                    return result
+                failure = None
+
+            now = time.monotonic()
+            remaining = None if deadline is None else deadline - now
+            if (remaining is not None and remaining <= 0) or attempts == self.max_attempts:
+                poll_telemetry.record(self.name, attempts, now - start, timed_out=True)
+                if failure is not None:
+                    raise failure
+                raise PollTimeout(self.name, attempts, now - start, result)
+            interval = next(intervals)
+            if remaining is not None:
+                interval = min(interval, remaining)
+            log.debug('{}: condition not met after attempt {}, polling again in {:.2f}s'.format(
+                self.name, attempts, interval))
+            self._sleep(interval)
+
+    def _sleep(self, seconds: float) -> None:
+        if self.cancel_event.wait(seconds):
+            raise PollCancelled('{} was cancelled'.format(self.name))
+
+
+_poll_scope = threading.local()
+
+
+@contextmanager
+def cancel_polls(cancel_event: threading.Event):
+    """ Context manager within which every :class:`Poller` created on this thread without
+    its own cancel_event is cancelled by cancel_event, including the ones of functions
+    decorated with :func:`poll`. Lets a caller stop waits it does not construct itself
+
+    :param cancel_event: event which cancels the waits when set
+    :type cancel_event: threading.Event
+    """
+    previous = getattr(_poll_scope, 'cancel_event', None)
+    _poll_scope.cancel_event = cancel_event
+    try:
+        yield cancel_event
+    finally:
+        _poll_scope.cancel_event = previous
+
+
+def poll(name: Optional[str]=None, **poller_kwargs):
+    """ Decorator which polls the decorated function with a :class:`Poller`, in the
+    manner of retrying.retry. The name defaults to the function's qualified name
+
+    :param name: name under which the waiter's timings are recorded
+    :type name: str
+    :param **poller_kwargs: anything that can be passed to :class:`Poller`
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return Poller(name or fn.__qualname__, **poller_kwargs).poll(fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _CollectionWaiter:
+    def __init__(self, condition: callable):
+        self.condition = condition
+        self.done = threading.Event()
+        self.attempts = 0
+        self.result = None
+        self.exception = None
+
+    def resolve(self, result=None, exception: Optional[Exception]=None) -> None:
+        self.result = result
+        self.exception = exception
+        self.done.set()
+
+
+class CollectionPoller:
+    """ Coalesces concurrent waits against the same collection endpoint. Instead of
+    every waiter polling on its own, a single background thread fetches the
+    collection once per tick and hands it to the condition of every pending waiter,
+    so that e.g. 50 app waiters cost one /v2/apps request per tick instead of 50.
+    The thread only runs while there are waiters. If max_interval is given, the
+    interval backs off from interval to max_interval, starting over whenever a new
+    waiter arrives
+
+    :param name: name under which the waits are recorded in poll_telemetry
+    :type name: str
+    :param fetch: function returning the current state of the collection
+    :type fetch: callable
+    :param interval: seconds between two fetches
+    :type interval: float
+    :param max_interval: ceiling for the seconds between two fetches, or None to not back off
+    :type max_interval: float
+    :param multiplier: factor by which the interval grows after every fetch
+    :type multiplier: float
+    """
+    def __init__(self, name: str, fetch: callable, interval: float=1, max_interval: Optional[float]=None,
+                 multiplier: float=1.5):
+        self.name = name
+        self.fetch = fetch
+        self.interval = interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.fetch_count = 0
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._thread = None
+        self._next_interval = interval
+
+    def __getstate__(self) -> dict:
+        # a copy starts out idle, without the waiters and the thread of this poller
+        state = self.__dict__.copy()
+        for attr in ('_lock', '_waiters', '_thread'):
+            del state[attr]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._thread = None
+
+    def wait(self, condition: callable, timeout: Optional[float]=None):
+        """ Blocks until condition(collection) returns a truthy value for a fetched
+        collection and returns that value. Exceptions raised by the condition are
+        re-raised here, as are errors fetching the collection that should not be
+        retried. Raises PollTimeout if the condition is not met in time
+
+        :param condition: predicate over the fetched collection
+        :type condition: callable
+        :param timeout: seconds to wait, or None to wait indefinitely
+        :type timeout: float
+        """
+        start = time.monotonic()
+        waiter = _CollectionWaiter(condition)
+        with self._lock:
+            self._waiters.append(waiter)
+            self._next_interval = self.interval
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        if not waiter.done.wait(timeout):
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if not waiter.done.is_set():
+                seconds = time.monotonic() - start
+                poll_telemetry.record(self.name, waiter.attempts, seconds, timed_out=True)
+                raise PollTimeout(self.name, waiter.attempts, seconds)
+        poll_telemetry.record(self.name, waiter.attempts, time.monotonic() - start)
+        if waiter.exception is not None:
+            raise waiter.exception
+        return waiter.result
+
+    def _run(self):
+        while True:
+            with self._lock:
+                waiters = list(self._waiters)
+                if not waiters:
+                    self._thread = None
+                    return
+            try:
+                collection = self.fetch()
+                self.fetch_count += 1
+            except Exception as e:
+                if not is_retryable_exception(e):
+                    for waiter in waiters:
+                        waiter.resolve(exception=e)
+                waiters = []
+            for waiter in waiters:
+                waiter.attempts += 1
+                try:
+                    result = waiter.condition(collection)
+                except Exception as e:
+                    waiter.resolve(exception=e)
+                else:
+                    if result:
+                        waiter.resolve(result)
+            with self._lock:
+                self._waiters = [w for w in self._waiters if not w.done.is_set()]
+                if not self._waiters:
+                    self._thread = None
+                    return
+                interval = self._next_interval
+                if self.max_interval is not None:
+                    self._next_interval = min(interval * self.multiplier, self.max_interval)
+            log.debug('{}: {} waiters pending'.format(self.name, len(self._waiters)))
+            time.sleep(interval)
+
+
+class SharedPollers:
+    """ Registry of the pollers (e.g. :class:`CollectionPoller`) of the clients derived
+    from one session, so that waits coalesce across all of those clients rather than
+    only within one client object. Pollers are created on first use. Copies of the
+    registry share it, as the pollers it holds may have threads running
+    """
+    def __init__(self):
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self) -> dict:
+        return {}
+
+    def __setstate__(self, state: dict):
+        self.__init__()
+
+    def get(self, key: tuple, factory: callable):
+        """ Returns the poller registered under key, creating it with factory() if there is none yet
+
+        :param key: key identifying the poller
+        :type key: tuple
+        :param factory: function returning a new poller
+        :type factory: callable
+        """
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = self._pollers[key] = factory()
+            return poller
+
+
+class SharedPollersMixin:
+    """ Mixin for ApiClientSession which shares pollers between all clients with the
+    same default Url and auth through the shared_pollers attribute (a
+    :class:`SharedPollers` of their own is created on first use). DcosApiSession hands
+    its registry to every client derived from it
+    """
+    shared_pollers = None
+
+    def shared_poller(self, name: str, factory: callable):
+        """ Returns the poller called name shared with the other clients of this registry,
+        creating it with factory() on first use
+
+        :param name: name of the poller
+        :type name: str
+        :param factory: function returning a new poller for this client
+        :type factory: callable
+        """
+        if self.shared_pollers is None:
+            self.shared_pollers = SharedPollers()
+        # auth objects need not be hashable; the poller keeps its client's auth alive
+        key = (name, str(self.default_url), id(getattr(self.session, 'auth', None)))
+        return self.shared_pollers.get(key, factory)
+
+
 def session_tempfile(data):
     """Writes bytes to a named temp file and returns its path
     the temp file will be removed when the interpreter exits
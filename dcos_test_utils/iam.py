@@ -18,9 +18,7 @@ class Iam(helpers.ApiClientSession):
     """
 
     def __init__(self, default_url: helpers.Url, session=None):
-        super().__init__(default_url)
-        if session:
-            self.session = session
+        super().__init__(default_url, session=session)
 
     def create_service(self, uid: str, pubkey: str, description: str):
         """ creates a service user
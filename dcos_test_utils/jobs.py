@@ -1,17 +1,70 @@
 """ Utilities for integration testing metronome in a deployed DC/OS cluster
 """
+import concurrent.futures
 import logging
+import threading
 
-import retrying
 import requests
 
 from dcos_test_utils import helpers
 
 REQUIRED_HEADERS = {'Accept': 'application/json, text/plain, */*'}
+# Seconds between two fetches of the shared state of all jobs
+JOBS_POLL_INTERVAL = 1
 log = logging.getLogger(__name__)
 
 
-class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
+class JobHistory:
+    """Index of the finished runs of a job, which answers whether a run has
+    finished and whether it succeeded in O(1).
+
+    The index is fed with job details that embed the history. Runs already
+    indexed are kept, so only runs that are new since the last update are
+    added, and feeding the same details again is a no-op.
+    """
+
+    def __init__(self):
+        self.job = None
+        self._outcomes = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def update(self, job: dict):
+        """Index the finished runs in the embedded history of the job.
+
+        :param job: Job details with embedded history
+        :type job: dict
+        """
+        with self._lock:
+            if job is self.job:
+                return
+            self.job = job
+            history = job.get('history', {})
+            for field in ('successfulFinishedRuns', 'failedFinishedRuns'):
+                success = field == 'successfulFinishedRuns'
+                for job_run in history.get(field, []):
+                    if job_run['id'] not in self._outcomes:
+                        self._outcomes[job_run['id']] = (success, job_run)
+
+    def outcome(self, run_id: str):
+        """Return a tuple of success and the history entry of the run, or
+        None if the run is not known to have finished.
+
+        :param run_id: Run ID
+        :type run_id: str
+        """
+        return self._outcomes.get(run_id)
+
+
+class Jobs(helpers.SharedPollersMixin, helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
     """ Specialized client for interacting with DC/OS jobs functionality
 
     :param default_url: URL of the jobs service to bind to
@@ -20,11 +73,64 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
     :type session: requests.Session
     """
     def __init__(self, default_url: helpers.Url, session: requests.Session=None):
-        super().__init__(default_url)
-        if session is not None:
-            self.session = session
+        super().__init__(default_url, session=session)
         self.session.headers.update(REQUIRED_HEADERS)
         self._api_version = '/v1'
+        self._histories = {}
+        self._histories_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_histories_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._histories_lock = threading.Lock()
+
+    @property
+    def jobs_poller(self) -> helpers.CollectionPoller:
+        """Return the poller through which waits with coalesce=True share one
+        /v1/jobs request per tick with all Jobs clients derived from the same
+        session.
+        """
+        return self.shared_poller('jobs.jobs', lambda: helpers.CollectionPoller(
+            'jobs.jobs', self._fetch_jobs, interval=JOBS_POLL_INTERVAL))
+
+    def history(self, job_id: str, run_id: str=None) -> JobHistory:
+        """Return the history index of a job. The history is fetched only
+        if the index does not know `run_id` (or any run if None) yet.
+
+        :param job_id: Job ID
+        :type job_id: str
+        :param run_id: Run ID that should be indexed
+        :type run_id: str
+        :return: History index of the job
+        :rtype: JobHistory
+        """
+        with self._histories_lock:
+            history = self._histories.setdefault(job_id, JobHistory())
+        if history.job is None or (run_id is not None and history.outcome(run_id) is None):
+            history.update(self.details(job_id, history=True))
+        return history
+
+    def _run_finished(self, job: dict, run_id: str) -> bool:
+        """Return True if the job, as returned with embedded active runs and
+        history, shows the run as finished.
+        """
+        if job is None or any(run['id'] == run_id for run in job.get('activeRuns', [])):
+            return False
+        with self._histories_lock:
+            history = self._histories.setdefault(job['id'], JobHistory())
+        history.update(job)
+        return history.outcome(run_id) is not None
+
+    def _fetch_jobs(self) -> dict:
+        """ Returns all jobs with their active runs and history, keyed by job ID
+        """
+        url = '{api}/jobs'.format(api=self._api_version)
+        jobs = self._http_req_json(self.get, url, params=(('embed', 'activeRuns'), ('embed', 'history')))
+        return {job['id']: job for job in jobs}
 
     def _http_req_json(self, fn: callable,
                        *args: list,
@@ -54,16 +160,9 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
         """ When job run is finished, history might not be available right ahead.
             This method returns true if run of given id is already present in the history endpoint.
         """
-        result = self.details(job_id, history=True)
-        history = result['history']
-        for field in ('successfulFinishedRuns', 'failedFinishedRuns'):
-            for result in history[field]:
-                if result['id'] == run_id:
-                    return True
-
-        return False
+        return self.history(job_id, run_id).outcome(run_id) is not None
 
-    def wait_for_run(self, job_id: str, run_id: str, timeout=600):
+    def wait_for_run(self, job_id: str, run_id: str, timeout=600, coalesce=False):
         """Wait for a given run to complete or timeout seconds to
         elapse.
 
@@ -73,13 +172,24 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
         :type run_id: str
         :param timeout: Time in seconds to wait before giving up
         :type timeout: int
+        :param coalesce: If True, check the run with the state of all jobs
+            fetched once per tick for all concurrent waiters of this session
+            (see jobs_poller) instead of polling the run on its own
+        :type coalesce: bool
         :return: None
 
         """
-
-        @retrying.retry(wait_fixed=1000, stop_max_delay=timeout * 1000,
-                        retry_on_result=lambda ret: ret is False,
-                        retry_on_exception=lambda x: False)
+        if coalesce:
+            try:
+                self.jobs_poller.wait(lambda jobs: self._run_finished(jobs.get(job_id), run_id), timeout=timeout)
+            except helpers.PollTimeout as ex:
+                raise Exception("Job run failed - operation was not "
+                                "completed in {} seconds.".format(timeout)) from ex
+            return
+
+        @helpers.poll('jobs.wait_for_run', timeout=timeout, max_interval=1,
+                      retry_on_result=lambda ret: ret is False,
+                      retry_on_exception=lambda x: False)
         def _wait_for_run_completion(j_id: str, r_id: str) -> bool:
             try:
                 # 200 means the run is still in progress
@@ -110,7 +220,7 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
             # wait for the run to complete and then return the
             # run's result
             _wait_for_run_completion(job_id, run_id)
-        except retrying.RetryError as ex:
+        except helpers.PollTimeout as ex:
             raise Exception("Job run failed - operation was not "
                             "completed in {} seconds.".format(timeout)) from ex
 
@@ -172,7 +282,7 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
         log.info("Started job {}, run id {}".format(job_id, r_json['id']))
         return r_json
 
-    def run(self, job_id: str, timeout=600) -> (bool, dict, dict):
+    def run(self, job_id: str, timeout=600, coalesce=False) -> (bool, dict, dict):
         """Create a run, wait for it to finish, and return whether it was
         successful and the run itself.
 
@@ -183,23 +293,61 @@ class Jobs(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
         :type job_id: str
         :param timeout: Timeout in seconds
         :type timeout: int
+        :param coalesce: If True, wait for the run through jobs_poller,
+            see wait_for_run
+        :type coalesce: bool
         :return: tuple of success, Run details, Job details
         :rtype: bool, dict, dict
         """
         run_json = self.start(job_id)
         run_id = run_json['id']
-        self.wait_for_run(job_id, run_id, timeout)
+        self.wait_for_run(job_id, run_id, timeout, coalesce=coalesce)
 
-        result = self.details(job_id, history=True)
-        history = result['history']
+        history = self.history(job_id, run_id)
+        outcome = history.outcome(run_id)
+        if outcome is not None:
+            return outcome[0], outcome[1], history.job
 
-        for field in ('successfulFinishedRuns', 'failedFinishedRuns'):
-            success = field == 'successfulFinishedRuns'
-            for job_run in history[field]:
-                if job_run['id'] == run_id:
-                    return success, job_run, result
+        return False, None, history.job
 
-        return False, None, result
+    def start_many(self, job_ids: list, max_in_flight: int=10) -> list:
+        """Create a run for each of the given jobs, starting up to
+        `max_in_flight` runs concurrently.
+
+        :param job_ids: Job IDs, a job may be listed more than once
+        :type job_ids: list
+        :param max_in_flight: Maximum number of concurrent requests
+        :type max_in_flight: int
+        :return: Run creation responses, in the order of `job_ids`
+        :rtype: list
+        """
+        if not job_ids:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_in_flight, len(job_ids))) as executor:
+            return list(executor.map(self.start, job_ids))
+
+    def run_many(self, job_ids: list, max_in_flight: int=10, timeout=600) -> list:
+        """Run many jobs at once and wait for all runs to finish.
+
+        Up to `max_in_flight` runs are in flight at any time; further runs
+        start as earlier ones finish. Runs are waited for through
+        jobs_poller, so instead of polling every run on its own, all runs
+        in flight are resolved with a single
+        `/v1/jobs?embed=activeRuns&embed=history` request per tick.
+
+        :param job_ids: Job IDs, a job may be listed more than once
+        :type job_ids: list
+        :param max_in_flight: Maximum number of unfinished runs
+        :type max_in_flight: int
+        :param timeout: Time in seconds each run may take after it was started
+        :type timeout: int
+        :return: tuples of success, Run details, Job details, in the order of `job_ids`
+        :rtype: list
+        """
+        if not job_ids:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_in_flight, len(job_ids))) as executor:
+            return list(executor.map(lambda job_id: self.run(job_id, timeout, coalesce=True), job_ids))
 
     def run_details(self, job_id: str, run_id: str) -> dict:
         """Return details about the given Run ID.
@@ -1,19 +1,38 @@
 """ Utilities for integration testing marathon in a deployed DC/OS cluster
 """
 import collections
+import concurrent.futures
 import contextlib
 import enum
+import json
 import logging
+import queue
+import socket
+import threading
+import time
 import typing
 
-import retrying
-
-from dcos_test_utils.helpers import (ApiClientSession,
-                                     RetryCommonHttpErrorsMixin, path_join)
+from dcos_test_utils.helpers import (ApiClientSession, CollectionPoller, Poller, PollTimeout,
+                                     RetryCommonHttpErrorsMixin, SharedPollersMixin, path_join)
 
 REQUIRED_HEADERS = {'Accept': 'application/json, text/plain, */*'}
 FORCE_PARAMS = {'force': 'true'}
 Endpoint = collections.namedtuple("Endpoint", ["host", "port", "ip"])
+Event = collections.namedtuple("Event", ["type", "data"])
+DeploymentResult = collections.namedtuple("DeploymentResult", ["endpoints", "data", "seconds"])
+# Event bus events which may signal progress of an app deployment
+DEPLOYMENT_EVENT_TYPES = (
+    'deployment_success',
+    'deployment_failed',
+    'status_update_event',
+    'health_status_changed_event',
+    'instance_health_changed_event')
+# Seconds between safety re-checks of an app while waiting for events
+EVENT_RECHECK_INTERVAL = 30
+# Seconds between two fetches of the shared state of all apps
+APPS_POLL_INTERVAL = 1
+# Seconds between two fetches of the shared status of all pods
+PODS_POLL_INTERVAL = 1
 log = logging.getLogger(__name__)
 
 
@@ -41,7 +60,193 @@ class Healthcheck(enum.Enum):
     MESOS_HTTP = 'MESOS_HTTP'
 
 
-class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
+def iter_sse_events(chunks: typing.Iterable[bytes]) -> typing.Generator[Event, None, None]:
+    """ Parses a stream of server-sent events (text/event-stream) and yields an
+    :class:`Event` for each complete event, with the data decoded from JSON
+
+    :param chunks: the raw stream in chunks of bytes
+    :type chunks: iterable
+    """
+    buffer = b''
+    event_type = 'message'
+    data = []
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line = line.rstrip(b'\r').decode('UTF-8')
+            if not line:
+                if data:
+                    yield Event(event_type, json.loads('\n'.join(data)))
+                event_type = 'message'
+                data = []
+                continue
+            if line.startswith(':'):
+                # comment, used as a keep-alive
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'event':
+                event_type = value
+            elif field == 'data':
+                data.append(value)
+
+
+class MarathonEventStream:
+    """ Subscribes to the Marathon event bus (/v2/events) and collects events on a
+    background thread, so that callers can react to them as soon as they arrive
+
+    :param marathon: client to open the event stream with
+    :type marathon: Marathon
+    :param event_types: names of the events to subscribe to, or None for all events
+    :type event_types: tuple
+    """
+    def __init__(self, marathon, event_types: typing.Optional[tuple]=DEPLOYMENT_EVENT_TYPES):
+        self.marathon = marathon
+        self.event_types = event_types
+        self.events = queue.Queue()
+        self._response = None
+        self._thread = None
+        self._ended = threading.Event()
+
+    @property
+    def connected(self) -> bool:
+        """ Property which returns True while the stream is open
+        """
+        return self._response is not None and not self._ended.is_set()
+
+    def start(self, timeout: int=10) -> bool:
+        """ Opens the event stream and starts collecting events. Returns False if
+        the stream could not be opened, in which case callers should fall back to polling
+
+        :param timeout: seconds to wait for Marathon to accept the subscription
+        :type timeout: int
+        """
+        params = [('event_type', t) for t in self.event_types or ()]
+        try:
+            r = self.marathon.get(
+                '/v2/events', params=params, headers={'Accept': 'text/event-stream'},
+                stream=True, timeout=(timeout, None), retry_timeout=timeout)
+            r.raise_for_status()
+        except Exception as e:
+            log.warning('Could not subscribe to the Marathon event bus: {}'.format(repr(e)))
+            self._ended.set()
+            return False
+        self._response = r
+        self._thread = threading.Thread(target=self._run, name='marathon-events', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        try:
+            for event in iter_sse_events(self._response.iter_content(chunk_size=None)):
+                self.events.put(event)
+        except Exception as e:
+            if not self._ended.is_set():
+                log.warning('Marathon event stream failed: {}'.format(repr(e)))
+        finally:
+            if not self._ended.is_set():
+                log.info('Marathon event stream ended')
+            self._ended.set()
+            # wake up any waiter
+            self.events.put(None)
+
+    def next_events(self, timeout: float) -> typing.List[Event]:
+        """ Waits up to timeout seconds for events and returns all events received
+        so far, or an empty list if none arrived or the stream ended
+        """
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        events = [event]
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return [e for e in events if e is not None]
+
+    def close(self):
+        """ Closes the event stream
+        """
+        self._ended.set()
+        if self._response is None:
+            return
+        # Shut the socket down first: closing the response alone would block until
+        # the reader thread receives the next event
+        raw = self._response.raw
+        connection = getattr(raw, 'connection', None) or getattr(raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DeploymentTracker:
+    """ Tracks which Marathon deployments are in flight for any number of waiters.
+    The IDs of all deployments in progress are fetched from /v2/deployments once per
+    tick and indexed in a set, against which every waiter checks its own deployment
+    IDs. Polls every 0.5 seconds at first, backing off to every 5 seconds
+
+    :param marathon: client to fetch the deployments with
+    :type marathon: Marathon
+    """
+    def __init__(self, marathon, interval: float=0.5, max_interval: float=5):
+        self.marathon = marathon
+        self.poller = CollectionPoller(
+            'marathon.deployments', self.in_flight, interval=interval, max_interval=max_interval)
+
+    def in_flight(self) -> typing.FrozenSet[str]:
+        """ Returns the IDs of all deployments currently in progress
+        """
+        r = self.marathon.get('/v2/deployments')
+        r.raise_for_status()
+        return frozenset(deployment['id'] for deployment in r.json())
+
+    def wait(self, deployment_ids: typing.Iterable[str], timeout: typing.Optional[float]=None) -> None:
+        """ Blocks until none of the given deployments is in progress anymore
+
+        :param deployment_ids: IDs of the deployments to wait for
+        :type deployment_ids: iterable
+        :param timeout: seconds to wait, or None to wait indefinitely
+        :type timeout: float
+        """
+        pending = set(deployment_ids)
+
+        def finished(in_flight):
+            pending.intersection_update(in_flight)
+            if pending:
+                log.info('{} deployments in progress, continuing to wait...'.format(len(pending)))
+            return not pending
+
+        if pending:
+            self.poller.wait(finished, timeout=timeout)
+
+
+def _event_app_id(event: Event) -> str:
+    """ Returns the ID (without leading slash) of the app an event is about, or '' if
+    it is not about an app. Instance events name it runSpecId, the others appId
+    """
+    return (event.data.get('appId') or event.data.get('runSpecId') or '').strip('/')
+
+
+def _is_pod(definition: dict) -> bool:
+    """ Returns True if the definition is a pod rather than an app definition
+    """
+    return 'containers' in definition
+
+
+class Marathon(SharedPollersMixin, RetryCommonHttpErrorsMixin, ApiClientSession):
     """ Specialized client for interacting with Marathon (DC/OS Services) functionality
 
     :param default_url: URL of the jobs service to bind to
@@ -50,11 +255,50 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
     :type session: requests.Session
     """
     def __init__(self, default_url, session=None):
-        super().__init__(default_url)
-        if session is not None:
-            self.session = session
+        super().__init__(default_url, session=session)
         self.session.headers.update(REQUIRED_HEADERS)
 
+    @property
+    def apps_poller(self) -> CollectionPoller:
+        """ Property which returns the poller through which waits with coalesce=True share
+        one /v2/apps request per tick with all Marathon clients derived from the same session
+        """
+        return self.shared_poller(
+            'marathon.apps', lambda: CollectionPoller('marathon.apps', self._fetch_apps, interval=APPS_POLL_INTERVAL))
+
+    @property
+    def pods_poller(self) -> CollectionPoller:
+        """ Property which returns the poller through which pod waits share one
+        /v2/pods/::status request per tick with all Marathon clients derived from the same session
+        """
+        return self.shared_poller(
+            'marathon.pods', lambda: CollectionPoller('marathon.pods', self._fetch_pods, interval=PODS_POLL_INTERVAL))
+
+    @property
+    def deployment_tracker(self) -> DeploymentTracker:
+        """ Property which returns the :class:`DeploymentTracker` through which all deployment
+        waits share one /v2/deployments request per tick with all Marathon clients derived
+        from the same session
+        """
+        return self.shared_poller('marathon.deployments', lambda: DeploymentTracker(self))
+
+    def _fetch_apps(self) -> dict:
+        """ Returns the state of all apps (embedding counts, tasks and the last task
+        failure) keyed by app ID without leading slash
+        """
+        r = self.get('/v2/apps', params=(('embed', 'apps.counts'),
+                                         ('embed', 'apps.tasks'),
+                                         ('embed', 'apps.lastTaskFailure')))
+        r.raise_for_status()
+        return {app['id'].strip('/'): app for app in r.json()['apps']}
+
+    def _fetch_pods(self) -> dict:
+        """ Returns the status of all pods keyed by pod ID without leading slash
+        """
+        r = self.get('/v2/pods/::status')
+        r.raise_for_status()
+        return {pod['id'].strip('/'): pod for pod in r.json()}
+
     def check_app_instances(
             self,
             app_id: str,
@@ -80,16 +324,22 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
 
         data = r.json()
         log.debug('Current application state data: {}'.format(repr(data)))
+        return self._app_instances_ready(data['app'], app_instances, check_health, ignore_failed_tasks)
 
-        if 'lastTaskFailure' in data['app']:
-            message = data['app']['lastTaskFailure']['message']
+    @staticmethod
+    def _app_instances_ready(app: dict, app_instances: int, check_health: bool, ignore_failed_tasks: bool) -> bool:
+        """ Returns True if the app state as returned by the Marathon API (embedding
+        apps.counts and apps.lastTaskFailure) shows all instances running (and healthy)
+        """
+        if 'lastTaskFailure' in app:
+            message = app['lastTaskFailure']['message']
             if not ignore_failed_tasks:
                 raise AssertionError('Application deployment failed, reason: {}'.format(message))
             else:
                 log.warn('Task failure detected: {}'.format(message))
 
-        check_tasks_running = (data['app']['tasksRunning'] == app_instances)
-        check_tasks_healthy = (not check_health or data['app']['tasksHealthy'] == app_instances)
+        check_tasks_running = (app['tasksRunning'] == app_instances)
+        check_tasks_healthy = (not check_health or app['tasksHealthy'] == app_instances)
 
         if check_tasks_running and check_tasks_healthy:
             log.info('Application deployed!')
@@ -109,21 +359,25 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
         """
         r = self.get(path_join('/v2/apps', app_id))
         r.raise_for_status()
-        data = r.json()
-        res = [Endpoint(t['host'], t['ports'][0], t['ipAddresses'][0]['ipAddress'])
-               if len(t['ports']) != 0
-               else Endpoint(t['host'], 0, t['ipAddresses'][0]['ipAddress'])
-               for t in data['app']['tasks']]
+        res = self._app_endpoints(r.json()['app'])
         log.info('Application deployed, running on {}'.format(res))
         return res
 
+    @staticmethod
+    def _app_endpoints(app: dict) -> typing.List[Endpoint]:
+        return [Endpoint(t['host'], t['ports'][0], t['ipAddresses'][0]['ipAddress'])
+                if len(t['ports']) != 0
+                else Endpoint(t['host'], 0, t['ipAddresses'][0]['ipAddress'])
+                for t in app['tasks']]
+
     def wait_for_app_deployment(
             self,
             app_id: str,
             app_instances: int,
             check_health: bool,
             ignore_failed_tasks: bool,
-            timeout: int):
+            timeout: int,
+            coalesce: bool=False):
         """ Retries the check_app_instance function for a limited time
         Args:
             app_id: ID of the marathon app to check
@@ -131,18 +385,87 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
             check_health: if True, health checks must pass before unblocking
             ignore_failed_tasks: if False, then failed tasks will raise an exception
             timeout: time (in seconds) to wait before raising an exception
+            coalesce: if True, check the app with the state of all apps fetched once
+                      per tick for all concurrent waiters of this session (see apps_poller)
         """
-
-        @retrying.retry(
-            wait_fixed=5000,
-            stop_max_delay=timeout*1000,
+        if coalesce:
+            def deployed(apps):
+                app = apps.get(app_id.strip('/'))
+                return app is not None and self._app_instances_ready(
+                    app, app_instances, check_health, ignore_failed_tasks)
+            self.apps_poller.wait(deployed, timeout=timeout)
+            return
+
+        Poller(
+            'marathon.wait_for_app_deployment',
+            timeout=timeout,
+            max_interval=5,
             retry_on_result=lambda res: res is False,
-            retry_on_exception=lambda ex: False)
-        def wait():
-            return self.check_app_instances(app_id, app_instances, check_health, ignore_failed_tasks)
-        wait()
+            retry_on_exception=lambda ex: False).poll(
+                self.check_app_instances, app_id, app_instances, check_health, ignore_failed_tasks)
 
-    def deploy_app(self, app_definition, check_health=True, ignore_failed_tasks=False, timeout=180):
+    def wait_for_app_deployment_events(
+            self,
+            event_stream: MarathonEventStream,
+            app_id: str,
+            app_instances: int,
+            check_health: bool,
+            ignore_failed_tasks: bool,
+            timeout: int,
+            deployment_ids: typing.Iterable[str]=()):
+        """ Like :func:`Marathon.wait_for_app_deployment` but re-checks the app only when
+        the event bus reports progress on it (or every EVENT_RECHECK_INTERVAL seconds), so
+        that the wait ends as soon as the deployment does. Falls back to polling for the
+        remaining time if the event stream drops
+
+        Args:
+            event_stream: a started event stream, subscribed before the app was deployed
+            app_id: ID of the marathon app to check
+            app_instances: expected number of instances
+            check_health: if True, health checks must pass before unblocking
+            ignore_failed_tasks: if False, then failed tasks will raise an exception
+            timeout: time (in seconds) to wait before raising an exception
+            deployment_ids: IDs of the deployments started for the app
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        deployment_ids = set(deployment_ids)
+        attempts = 1
+        while not self.check_app_instances(app_id, app_instances, check_health, ignore_failed_tasks):
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PollTimeout('marathon.wait_for_app_deployment_events', attempts, time.monotonic() - start)
+                if not event_stream.connected:
+                    log.info('Falling back to polling for application {}'.format(app_id))
+                    return self.wait_for_app_deployment(
+                        app_id, app_instances, check_health, ignore_failed_tasks, remaining)
+                events = event_stream.next_events(min(remaining, EVENT_RECHECK_INTERVAL))
+                if not events and event_stream.connected:
+                    # safety re-check in case an event was missed
+                    break
+                relevant = False
+                for event in events:
+                    if event.type in ('deployment_success', 'deployment_failed'):
+                        if event.data.get('id') not in deployment_ids:
+                            continue
+                        if event.type == 'deployment_failed':
+                            raise AssertionError('Application deployment {} failed'.format(event.data['id']))
+                        relevant = True
+                    elif _event_app_id(event) == app_id.strip('/'):
+                        relevant = True
+                if relevant:
+                    break
+            attempts += 1
+
+    def deploy_app(
+            self,
+            app_definition,
+            check_health=True,
+            ignore_failed_tasks=False,
+            timeout=180,
+            use_event_stream=False,
+            coalesce=False):
         """Deploy an app to marathon
 
         This function deploys an an application and then waits for marathon to
@@ -157,24 +480,124 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
                             Marathon API (https://mesosphere.github.io/marathon/docs/rest-api.html#post-v2-apps)
             check_health: wait until Marathon reports tasks as healthy before
                           returning
+            use_event_stream: if True, wait on the Marathon event bus instead of
+                              polling the app every 5 seconds
+            coalesce: if True, poll the app together with all other apps being waited
+                      for through this client, see :func:`Marathon.wait_for_app_deployment`
 
         Returns:
             A list of named tuples which represent service points of deployed
             applications. I.E:
                 [Endpoint(host='172.17.10.202', port=10464), Endpoint(host='172.17.10.201', port=1630)]
         """
-        r = self.post('/v2/apps', json=app_definition)
-        log.info('Response from marathon: {}'.format(repr(r.json())))
-        r.raise_for_status()
+        with contextlib.ExitStack() as stack:
+            event_stream = None
+            if use_event_stream:
+                # subscribe before deploying so that no event is missed
+                event_stream = stack.enter_context(MarathonEventStream(self))
+                event_stream.start()
+
+            r = self.post('/v2/apps', json=app_definition)
+            log.info('Response from marathon: {}'.format(repr(r.json())))
+            r.raise_for_status()
+
+            try:
+                if event_stream is not None and event_stream.connected:
+                    return self.wait_for_app_deployment_events(
+                        event_stream,
+                        app_definition['id'],
+                        app_definition['instances'],
+                        check_health, ignore_failed_tasks, timeout,
+                        deployment_ids=[d['id'] for d in r.json().get('deployments', [])])
+                return self.wait_for_app_deployment(
+                        app_definition['id'],
+                        app_definition['instances'],
+                        check_health, ignore_failed_tasks, timeout, coalesce=coalesce)
+            except PollTimeout:
+                raise Exception("Application deployment failed - operation was not "
+                                "completed in {} seconds.".format(timeout))
+
+    def deploy_apps(
+            self,
+            definitions: typing.List[dict],
+            max_in_flight: int=10,
+            check_health: bool=True,
+            ignore_failed_tasks: bool=False,
+            timeout: int=180) -> typing.Dict[str, DeploymentResult]:
+        """ Deploys many apps and pods, keeping up to max_in_flight deployments going
+        at once. Deployments are waited for through apps_poller and pods_poller, so
+        instead of checking each deployment separately, the state of all apps in flight
+        is fetched with a single /v2/apps request (and that of all pods with a single
+        /v2/pods/::status request) per tick
+
+        Definitions with a 'containers' list are deployed as pods, all others as apps.
+        An app is deployed once all its instances are running (and healthy if
+        check_health is set), a pod once its status is STABLE.
+
+        Args:
+            definitions: app and pod definitions as specified in the Marathon API
+            max_in_flight: maximum number of deployments which have been submitted
+                           but are not yet finished
+            check_health: wait until Marathon reports app tasks as healthy
+            ignore_failed_tasks: if False, any failed app task raises an exception
+            timeout: seconds each deployment may take after it was submitted
+
+        Returns:
+            A dict mapping the ID of every definition to a DeploymentResult of the
+            endpoints of the app (an empty list for pods), the app state or pod status
+            data and the seconds from submission until the deployment finished
+        """
+        ids = collections.Counter(d['id'].strip('/') for d in definitions)
+        duplicates = sorted(i for i, count in ids.items() if count > 1)
+        if duplicates:
+            raise ValueError('Duplicate app or pod IDs: {}'.format(', '.join(duplicates)))
+        if not definitions:
+            return collections.OrderedDict()
+
+        def deploy(definition):
+            return self._deploy_and_wait(definition, check_health, ignore_failed_tasks, timeout)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_in_flight, len(definitions))) as executor:
+            return collections.OrderedDict(zip((d['id'] for d in definitions), executor.map(deploy, definitions)))
+
+    def _deploy_and_wait(
+            self,
+            definition: dict,
+            check_health: bool,
+            ignore_failed_tasks: bool,
+            timeout: int) -> DeploymentResult:
+        """ Submits an app or pod and waits for it through the shared apps_poller or pods_poller
+        """
+        deployment_id = definition['id'].strip('/')
+        submitted = time.monotonic()
+        r = self.post('/v2/pods' if _is_pod(definition) else '/v2/apps', json=definition)
+        assert r.ok, 'status_code: {} content: {}'.format(r.status_code, r.content)
+        log.info('Submitted {} to marathon'.format(definition['id']))
+
+        if _is_pod(definition):
+            poller = self.pods_poller
+
+            def deployed(pods):
+                pod = pods.get(deployment_id)
+                return pod if pod is not None and pod.get('status') == 'STABLE' else None
+        else:
+            poller = self.apps_poller
+
+            def deployed(apps):
+                app = apps.get(deployment_id)
+                if app is not None and self._app_instances_ready(
+                        app, definition.get('instances', 1), check_health, ignore_failed_tasks):
+                    return app
+                return None
 
         try:
-            return self.wait_for_app_deployment(
-                    app_definition['id'],
-                    app_definition['instances'],
-                    check_health, ignore_failed_tasks, timeout)
-        except retrying.RetryError:
-            raise Exception("Application deployment failed - operation was not "
-                            "completed in {} seconds.".format(timeout))
+            data = poller.wait(deployed, timeout=timeout)
+        except PollTimeout as ex:
+            raise Exception('Deployment of {} was not completed in {} seconds.'.format(
+                definition['id'], timeout)) from ex
+        seconds = time.monotonic() - submitted
+        log.info('{} deployed in {:.1f} seconds'.format(definition['id'], seconds))
+        return DeploymentResult([] if _is_pod(definition) else self._app_endpoints(data), data, seconds)
 
     def deploy_pod(self, pod_definition, timeout=180):
         """Deploy a pod to marathon
@@ -183,6 +606,8 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
         acknowledge it's successful creation or fails the test.
 
         It waits until all the instances reach tasksRunning and then tasksHealthy state.
+        The deployment started by Marathon is awaited through the shared deployment
+        tracker first, so the pod status is usually only fetched once.
 
         Args:
             pod_definition: a dict with pod definition as specified in
@@ -194,10 +619,8 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
         r = self.post('/v2/pods', json=pod_definition)
         assert r.ok, 'status_code: {} content: {}'.format(r.status_code, r.content)
         log.info('Response from marathon: {}'.format(repr(r.json())))
+        deadline = time.monotonic() + timeout
 
-        @retrying.retry(wait_fixed=5000, stop_max_delay=timeout * 1000,
-                        retry_on_result=lambda ret: ret is False,
-                        retry_on_exception=lambda x: False)
         def _wait_for_pod_deployment(pod_id):
             # In the context of the `deploy_pod` function, simply waiting for
             # the pod's status to become STABLE is sufficient. In the future,
@@ -214,8 +637,15 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
             return False
 
         try:
-            return _wait_for_pod_deployment(pod_definition['id'])
-        except retrying.RetryError as ex:
+            if 'Marathon-Deployment-Id' in r.headers:
+                self.deployment_tracker.wait([r.headers['Marathon-Deployment-Id']], timeout=timeout)
+            return Poller(
+                'marathon.deploy_pod',
+                timeout=max(deadline - time.monotonic(), 0),
+                max_interval=5,
+                retry_on_result=lambda ret: ret is False,
+                retry_on_exception=lambda x: False).poll(_wait_for_pod_deployment, pod_definition['id'])
+        except PollTimeout as ex:
             raise Exception("Pod deployment failed - operation was not "
                             "completed in {} seconds.".format(timeout)) from ex
 
@@ -228,26 +658,14 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
             pod_id: id of the pod to remove
             timeout: seconds to wait for destruction before failing test
         """
-        @retrying.retry(wait_fixed=5000, stop_max_delay=timeout * 1000,
-                        retry_on_result=lambda ret: not ret,
-                        retry_on_exception=lambda x: False)
-        def _destroy_pod_complete(deployment_id):
-            r = self.get('/v2/deployments')
-            assert r.ok, 'status_code: {} content: {}'.format(r.status_code, r.content)
-
-            for deployment in r.json():
-                if deployment_id == deployment.get('id'):
-                    log.info('Waiting for pod to be destroyed')
-                    return False
-            log.info('Pod destroyed')
-            return True
-
         r = self.delete('/v2/pods' + pod_id, params=FORCE_PARAMS)
         assert r.ok, 'status_code: {} content: {}'.format(r.status_code, r.content)
 
         try:
-            _destroy_pod_complete(r.headers['Marathon-Deployment-Id'])
-        except retrying.RetryError as ex:
+            log.info('Waiting for pod to be destroyed')
+            self.deployment_tracker.wait([r.headers['Marathon-Deployment-Id']], timeout=timeout)
+            log.info('Pod destroyed')
+        except PollTimeout as ex:
             raise Exception("Pod destroy failed - operation was not "
                             "completed in {} seconds.".format(timeout)) from ex
 
@@ -260,37 +678,27 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
             app_name: name of the application to remove
             timeout: seconds to wait for destruction before failing test
         """
-        @retrying.retry(wait_fixed=5000, stop_max_delay=timeout * 1000,
-                        retry_on_result=lambda ret: not ret,
-                        retry_on_exception=lambda x: False)
-        def _destroy_complete(deployment_id):
-            r = self.get('/v2/deployments')
-            r.raise_for_status()
-
-            for deployment in r.json():
-                if deployment_id == deployment.get('id'):
-                    log.info('Waiting for application to be destroyed')
-                    return False
-            log.info('Application destroyed')
-            return True
-
         r = self.delete(path_join('/v2/apps', app_name))
         r.raise_for_status()
 
         try:
-            _destroy_complete(r.json()['deploymentId'])
-        except retrying.RetryError:
+            log.info('Waiting for application to be destroyed')
+            self.deployment_tracker.wait([r.json()['deploymentId']], timeout=timeout)
+            log.info('Application destroyed')
+        except PollTimeout:
             raise Exception("Application destroy failed - operation was not "
                             "completed in {} seconds.".format(timeout))
 
     @contextlib.contextmanager
-    def deploy_and_cleanup(self, app_definition, timeout=180, check_health=True, ignore_failed_tasks=True):
+    def deploy_and_cleanup(self, app_definition, timeout=180, check_health=True, ignore_failed_tasks=True,
+                           use_event_stream=False):
         """ This context manager works just like :func:`Marathon.deploy_app` but will always destroy
         the app once the context is left
         """
         try:
             yield self.deploy_app(
-                app_definition, check_health, ignore_failed_tasks, timeout=timeout)
+                app_definition, check_health, ignore_failed_tasks, timeout=timeout,
+                use_event_stream=use_event_stream)
         finally:
             self.destroy_app(app_definition['id'], timeout)
 
@@ -304,32 +712,92 @@ class Marathon(RetryCommonHttpErrorsMixin, ApiClientSession):
         finally:
             self.destroy_pod(pod_definition['id'], timeout)
 
-    def purge(self):
-        """ Force deletes all applications, all pods, and then waits
-        indefinitely for any deployments to finish
+    def purge(self, single_request: bool=False, max_workers: int=10, timeout: typing.Optional[int]=None) -> dict:
+        """ Force deletes all applications, all pods, and then waits for the
+        resulting deployments to finish
+
+        The apps and pods are deleted concurrently and only the deployments started
+        by the deletions are waited for, see :func:`Marathon.wait_for_deployments`.
+        With single_request, everything is removed with one forced delete of the
+        root group instead, which is safe on Marathon versions that remove apps and
+        pods along with their groups
+
+        :param single_request: remove everything with a single root group delete
+        :type single_request: bool
+        :param max_workers: maximum number of concurrent delete requests
+        :type max_workers: int
+        :param timeout: seconds to wait for the deployments, or None to wait indefinitely
+        :type timeout: int
+
+        :returns: dict -- seconds taken by each phase ('list', 'delete' and 'wait')
         """
-        apps_response = self.get('/v2/apps')
-        apps_response.raise_for_status()
-        for app in apps_response.json()['apps']:
-            log.info('Purging application: {}'.format(app['id']))
-            self.delete('/v2/apps' + app['id'], params=FORCE_PARAMS)
-        pods_response = self.get('/v2/pods')
-        pods_response.raise_for_status()
-        for pod in pods_response.json():
-            log.info('Deleting pod: {}'.format(pod['id']))
-            self.delete('/v2/pods' + pod['id'], params=FORCE_PARAMS)
+        timings = collections.OrderedDict()
+        start = time.monotonic()
+        if single_request:
+            paths = []
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                apps_future = executor.submit(self.get, '/v2/apps')
+                pods_future = executor.submit(self.get, '/v2/pods')
+                apps_response, pods_response = apps_future.result(), pods_future.result()
+            apps_response.raise_for_status()
+            pods_response.raise_for_status()
+            paths = ['/v2/apps' + app['id'] for app in apps_response.json()['apps']]
+            paths += ['/v2/pods' + pod['id'] for pod in pods_response.json()]
+        timings['list'] = time.monotonic() - start
+
+        start = time.monotonic()
+        deployment_ids = []
+        if paths:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(max_workers, len(paths)), 1)) as executor:
+                deployment_ids += [i for i in executor.map(self._purge_path, paths) if i]
         log.info('Deleting groups')
-        self.delete('/v2/groups/', params=FORCE_PARAMS)
-        self.wait_for_deployments_complete()
+        deployment_ids.append(self._purge_path('/v2/groups/'))
+        deployment_ids = [i for i in deployment_ids if i]
+        timings['delete'] = time.monotonic() - start
+
+        start = time.monotonic()
+        self.wait_for_deployments(deployment_ids, timeout=timeout)
+        timings['wait'] = time.monotonic() - start
+        log.info('Purged {} apps and pods, phase timings: {}'.format(len(paths), dict(timings)))
+        return timings
+
+    def _purge_path(self, path: str) -> typing.Optional[str]:
+        """ Force deletes an app, pod or group and returns the ID of the resulting deployment
+        """
+        log.info('Purging {}'.format(path))
+        r = self.delete(path, params=FORCE_PARAMS)
+        if not r.ok:
+            log.warning('Failed to delete {}: {} {}'.format(path, r.status_code, r.content))
+            return None
+        if 'Marathon-Deployment-Id' in r.headers:
+            return r.headers['Marathon-Deployment-Id']
+        try:
+            return r.json().get('deploymentId')
+        except ValueError:
+            return None
+
+    def wait_for_deployments(self, deployment_ids: typing.Iterable[str], timeout: typing.Optional[int]=None):
+        """ Blocks until none of the given deployments is in progress anymore, see
+        :class:`DeploymentTracker`
+
+        :param deployment_ids: IDs of the deployments to wait for
+        :type deployment_ids: iterable
+        :param timeout: seconds to wait, or None to wait indefinitely
+        :type timeout: int
+        """
+        deployment_ids = list(deployment_ids)
+        try:
+            self.deployment_tracker.wait(deployment_ids, timeout=timeout)
+        except PollTimeout as ex:
+            raise Exception('Deployments {} were not completed in {} seconds.'.format(
+                ', '.join(sorted(deployment_ids)), timeout)) from ex
 
-    @retrying.retry(
-        wait_fixed=10 * 1000,
-        retry_on_result=lambda res: res is False,
-        retry_on_exception=lambda ex: False)
     def wait_for_deployments_complete(self):
         """ This simple helper will block until there are no more deployments in progress
         """
-        if not self.get('/v2/deployments').json():
-            return True
-        log.info('Deployments in progress, continuing to wait...')
-        return False
+        def complete(in_flight):
+            if in_flight:
+                log.info('Deployments in progress, continuing to wait...')
+            return not in_flight
+        return self.deployment_tracker.poller.wait(complete)
@@ -17,9 +17,7 @@ class Cosmos(helpers.RetryCommonHttpErrorsMixin, helpers.ApiClientSession):
     :type session: requests.Session
     """
     def __init__(self, default_url: helpers.Url, session=None):
-        super().__init__(default_url)
-        if session is not None:
-            self.session = session
+        super().__init__(default_url, session=session)
 
     def _update_headers(self, endpoint, request_version='1', response_version='1'):
         """Set the Content-type and Accept headers
@@ -17,6 +17,9 @@ other "Record-IO" implementations use a fixed-size
 header of 4 bytes to directly encode an unsigned 32 bit
 length.
 """
+import itertools
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
 
 
 class Encoder():
@@ -44,6 +47,16 @@ class Encoder():
     def __init__(self, serialize):
         self.serialize = serialize
 
+    def _frame(self, message):
+        """Serialize a message and return its 'RecordIO' header and payload.
+        """
+        s = self.serialize(message)
+
+        if not isinstance(s, bytes):
+            raise Exception("Calling 'serialize(message)' must return a 'bytes' object")
+
+        return b'%d\n' % len(s), s
+
     def encode(self, message):
         """Encode a message into 'RecordIO' format.
 
@@ -54,12 +67,57 @@ class Encoder():
         :rtype: bytes
         """
 
-        s = self.serialize(message)
+        header, payload = self._frame(message)
+        return header + payload
 
-        if not isinstance(s, bytes):
-            raise Exception("Calling 'serialize(message)' must return a 'bytes' object")
+    def encode_many(self, messages):
+        """Encode a sequence of messages into 'RecordIO' format.
+
+        Unlike 'encode()', headers and payloads are not concatenated
+        into a new bytes object per message. Instead a flat list of
+        buffers alternating between header and payload is returned,
+        which can be handed to 'writelines()'/'os.writev()' directly
+        or joined with a single 'b"".join()'.
+
+        :param messages: messages to serialize and wrap in 'RecordIO' frames
+        :type messages: iterable
+        :returns: a list of header and payload buffers
+        :rtype: list
+        """
+
+        buffers = []
+        for message in messages:
+            buffers.extend(self._frame(message))
+        return buffers
+
+    def write_to(self, fileobj, messages, batch_size=1024):
+        """Encode a sequence of messages and write them to a file object.
+
+        Messages are encoded 'batch_size' at a time with 'encode_many()'
+        so that memory stays bounded for arbitrarily long sequences.
+
+        :param fileobj: a binary file-like object (use 'socket.makefile("wb")'
+                        for sockets)
+        :type fileobj: object
+        :param messages: messages to serialize and wrap in 'RecordIO' frames
+        :type messages: iterable
+        :param batch_size: number of messages to encode per write
+        :type batch_size: int
+        :returns: the number of bytes written
+        :rtype: int
+        """
 
-        return bytes(str(len(s)) + "\n", "UTF-8") + s
+        written = 0
+        messages = iter(messages)
+        while True:
+            buffers = self.encode_many(itertools.islice(messages, batch_size))
+            if not buffers:
+                return written
+            if hasattr(fileobj, 'writelines'):
+                fileobj.writelines(buffers)
+            else:
+                fileobj.write(b''.join(buffers))
+            written += sum(len(b) for b in buffers)
 
 
 class Decoder():
@@ -92,12 +150,17 @@ class Decoder():
     def __init__(self, deserialize):
         self.deserialize = deserialize
         self.state = self.HEADER
-        self.buffer = bytes("", "UTF-8")
+        self.buffer = bytearray()
         self.length = 0
 
     def decode(self, data):
         """Decode a 'RecordIO' formatted message to its original type.
 
+        Headers are located with 'bytes.find' and whole records are
+        sliced out of the input at once, so decoding is linear in the
+        size of the input. Only the trailing partial record (if any) is
+        kept in 'self.buffer' between calls.
+
         :param data: an array of 'UTF-8' encoded bytes that make up a
                       partial 'RecordIO' message. Subsequent calls to this
                       function maintain state to build up a full 'RecordIO'
@@ -113,39 +176,100 @@ class Decoder():
         if self.state == self.FAILED:
             raise Exception("Decoder is in a FAILED state")
 
-        records = []
+        # When nothing is left over from a previous call, work directly on
+        # the input and only copy its unconsumed tail. Otherwise grow the
+        # buffer in place (amortized O(1)) and consume from its front.
+        if self.buffer:
+            self.buffer += data
+            data = self.buffer
 
-        for c in data:
-            if self.state == self.HEADER:
-                if c != ord('\n'):
-                    self.buffer += bytes([c])
-                    continue
-
-                try:
-                    self.length = int(self.buffer.decode("UTF-8"))
-                    assert self.length >= 0, "Negative record length '{length}'".format(length=self.length)
-                except Exception as exception:
-                    self.state = self.FAILED
-                    raise Exception("Failed to decode length '{buffer}': {error}"
-                                    .format(buffer=self.buffer, error=exception)) from exception
-
-                self.buffer = bytes("", "UTF-8")
-                self.state = self.RECORD
-
-                # Note that for 0 length records, we immediately decode.
-                if self.length == 0:
-                    records.append(self.deserialize(self.buffer))
+        records = []
+        position = 0
+        end = len(data)
+
+        with memoryview(data) as view:
+            while True:
+                if self.state == self.HEADER:
+                    newline = data.find(b'\n', position)
+                    if newline == -1:
+                        break
+
+                    header = view[position:newline].tobytes()
+                    try:
+                        self.length = int(header.decode("UTF-8"))
+                        assert self.length >= 0, "Negative record length '{length}'".format(length=self.length)
+                    except Exception as exception:
+                        self.state = self.FAILED
+                        raise Exception("Failed to decode length '{buffer}': {error}"
+                                        .format(buffer=header, error=exception)) from exception
+
+                    position = newline + 1
+                    self.state = self.RECORD
+
+                if self.state == self.RECORD:
+                    record_end = position + self.length
+                    if record_end > end:
+                        break
+
+                    # Note that for 0 length records, we immediately decode.
+                    records.append(self.deserialize(view[position:record_end].tobytes()))
+                    position = record_end
                     self.state = self.HEADER
 
-            elif self.state == self.RECORD:
-                assert self.length
-                assert len(self.buffer) < self.length
+        if data is self.buffer:
+            del self.buffer[:position]
+        else:
+            self.buffer = bytearray(data[position:])
+
+        return records
 
-                self.buffer += bytes([c])
 
-                if len(self.buffer) == self.length:
-                    records.append(self.deserialize(self.buffer))
-                    self.buffer = bytes("", "UTF-8")
-                    self.state = self.HEADER
+def _iter_chunks(source, chunk_size):
+    """Yield successive chunks of bytes from 'source'.
+    """
+    if hasattr(source, 'iter_content'):
+        # A requests.Response opened with 'stream=True'. Chunked responses
+        # (such as Mesos event streams) yield data as soon as it arrives.
+        yield from source.iter_content(chunk_size)
+    elif hasattr(source, 'read1') or hasattr(source, 'read'):
+        # Prefer 'read1()' on buffered readers so that we return whatever
+        # is available rather than blocking until 'chunk_size' is filled.
+        read = source.read1 if hasattr(source, 'read1') else source.read
+        yield from iter(lambda: read(chunk_size), b'')
+    elif hasattr(source, 'recv'):
+        yield from iter(lambda: source.recv(chunk_size), b'')
+    else:
+        yield from source
+
+
+def iter_records(source, deserialize, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lazily decode 'RecordIO' messages from a stream.
+
+       The stream is consumed 'chunk_size' bytes at a time and every
+       record is yielded as soon as it is complete, so memory use is
+       bounded by the chunk size and the largest record regardless of
+       how long the stream runs for. For example, to tail a Mesos
+       operator API event stream:
+
+           r = session.post('/mesos/api/v1', json={'type': 'SUBSCRIBE'}, stream=True)
+           for event in iter_records(r, lambda d: json.loads(d.decode('UTF-8'))):
+               ...
+
+       :param source: a requests.Response opened with 'stream=True', a
+                      file-like object, a socket or any iterable of
+                      'bytes' chunks
+       :type source: object
+       :param deserialize: a function to deserialize a single record
+       :type deserialize: function
+       :param chunk_size: number of bytes to read from 'source' at a time
+       :type chunk_size: int
+       :returns: a generator of deserialized messages
+       :rtype: generator
+    """
+    decoder = Decoder(deserialize)
 
-        return records
+    for chunk in _iter_chunks(source, chunk_size):
+        yield from decoder.decode(bytes(chunk))
+
+    if decoder.state == decoder.RECORD or decoder.buffer:
+        raise Exception("Stream ended in the middle of a 'RecordIO' message")
@@ -1,12 +1,20 @@
 """ Simple, robust SSH client(s) for basic I/O with remote hosts
 """
 import asyncio
+import atexit
+import collections
+import hashlib
 import logging
 import os
 import pty
+import re
+import shlex
+import shutil
 import stat
 import subprocess
 import tempfile
+import threading
+import time
 import typing
 from contextlib import contextmanager
 
@@ -25,6 +33,20 @@ SHARED_SSH_OPTS = [
         '-oBatchMode=yes',
         '-oPasswordAuthentication=no']
 
+# seconds a pooled SSH tunnel may stay unused before it is closed
+TUNNEL_IDLE_TIMEOUT = 60
+# bytes read from the output of a streamed command at a time, also the longest line yielded whole
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# hosts a host (or the test runner) copies a distributed file to at the same time
+DISTRIBUTION_FANOUT = 3
+
+COPY_METHODS = ('scp', 'tar', 'rsync')
+
+OutputEvent = collections.namedtuple('OutputEvent', ['host', 'stream', 'data'])
+TransferStats = collections.namedtuple('TransferStats', ['method', 'bytes_total', 'bytes_sent', 'bytes_skipped',
+                                                         'seconds'])
+
 
 class Tunnelled():
     """ Abstraction of an already instantiated SSH-tunnel
@@ -56,16 +78,43 @@ class Tunnelled():
             return subprocess.run(run_cmd, **kwargs, check=True, env={"PATH": os.environ["PATH"]},
                                   stdout=subprocess.PIPE).stdout
 
-    def copy_file(self, src: str, dst: str, to_remote=True) -> None:
+    def copy_file(self, src: str, dst: str, to_remote=True, method: str='scp', compress: bool=None) -> TransferStats:
         """ Copy a path from localhost to target. If path is a local directory, then
         recursive copy will be used.
 
+        Like with scp, the copy of src is placed inside dst if dst is an existing
+        directory, otherwise it is created as dst. The transfer methods are:
+
+        - 'scp': copies everything
+        - 'tar': streams a (by default gzip compressed) tar archive through the tunnel
+        - 'rsync': only sends the parts of files which differ from those already at the
+          destination. Falls back to 'tar' if rsync is not installed on both ends
+
         Args:
             src: local or remote representing source data
             dst: local or remote destination path
             to_remote: Whether copying from remote->local or local->remote
+            method: 'scp', 'tar' or 'rsync'
+            compress: compress the data sent, defaults to True for tar and False otherwise
+
+        Returns:
+            TransferStats of the method used, the bytes copied, the bytes sent through the
+            tunnel and the bytes rsync found already at the destination and skipped
         """
-        copy_command = []
+        if method not in COPY_METHODS:
+            raise ValueError('Unknown copy method {}, expected one of {}'.format(method, ', '.join(COPY_METHODS)))
+        if method == 'rsync' and not self._has_rsync():
+            log.info('rsync is not available on both localhost and {}, copying with tar'.format(self.target))
+            method = 'tar'
+        if compress is None:
+            compress = method == 'tar'
+        log.debug('Copying {} to {} with {}'.format(src, dst, method))
+        start = time.monotonic()
+        total, sent, skipped = getattr(self, '_copy_with_' + method)(src, dst, to_remote, compress)
+        return TransferStats(method, total, sent, skipped, time.monotonic() - start)
+
+    def _copy_with_scp(self, src: str, dst: str, to_remote: bool, compress: bool) -> (int, int, int):
+        copy_command = ['-C'] if compress else []
         if to_remote:
             if os.path.isdir(src):
                 copy_command.append('-r')
@@ -75,9 +124,112 @@ class Tunnelled():
             remote_full_path = '{}:{}'.format(self.target, src)
             copy_command += [remote_full_path, dst]
         cmd = ['scp'] + self.opt_list + ['-P', str(self.port)] + copy_command
-        log.debug('Copying {} to {}'.format(*copy_command[-2:]))
         log.debug('scp command: {}'.format(cmd))
         subprocess.run(cmd, check=True, env={"PATH": os.environ["PATH"]})
+        if to_remote:
+            total = _path_size(src)
+        else:
+            total = _path_size(os.path.join(dst, os.path.basename(src)) if os.path.isdir(dst) else dst)
+        return total, total, 0
+
+    def _copy_with_tar(self, src: str, dst: str, to_remote: bool, compress: bool) -> (int, int, int):
+        z = 'z' if compress else ''
+        name = os.path.basename(src.rstrip('/'))
+        if to_remote:
+            create = ['tar', '-c' + z + 'f', '-', '-C', os.path.dirname(os.path.abspath(src)), name]
+            # unpacked next to the destination and moved into place, as scp would place it
+            extract = [(
+                'if [ -d {dst} ]; then target={dst}/{name}; else target={dst}; fi; '
+                'tmp=$(mktemp -d "$(dirname "$target")/.copy.XXXXXX") && '
+                'tar -x{z}f - -C "$tmp" && rm -rf "$target" && mv "$tmp"/{name} "$target"; '
+                'status=$?; rm -rf "$tmp"; exit $status').format(dst=shlex.quote(dst), name=shlex.quote(name), z=z)]
+            sent = self._pipe(create, self._ssh_command(extract))
+            return _path_size(src), sent, 0
+        target = os.path.join(dst, name) if os.path.isdir(dst) else dst
+        tmp = tempfile.mkdtemp(prefix='.copy.', dir=os.path.dirname(os.path.abspath(target)))
+        try:
+            create = self._ssh_command([' '.join(shlex.quote(arg) for arg in [
+                'tar', '-c' + z + 'f', '-', '-C', os.path.dirname(src.rstrip('/')) or '.', name])])
+            sent = self._pipe(create, ['tar', '-x' + z + 'f', '-', '-C', tmp])
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.replace(os.path.join(tmp, name), target)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return _path_size(target), sent, 0
+
+    def _copy_with_rsync(self, src: str, dst: str, to_remote: bool, compress: bool) -> (int, int, int):
+        # rsync copies the contents of src/ into dst, so the target is resolved as scp would
+        name = os.path.basename(src.rstrip('/'))
+        if to_remote:
+            is_dir = os.path.isdir(src)
+            dst_is_dir = subprocess.run(
+                self._ssh_command(['test', '-d', shlex.quote(dst)]), env={"PATH": os.environ["PATH"]}).returncode == 0
+        else:
+            is_dir = subprocess.run(
+                self._ssh_command(['test', '-d', shlex.quote(src)]), env={"PATH": os.environ["PATH"]}).returncode == 0
+            dst_is_dir = os.path.isdir(dst)
+        target = os.path.join(dst, name) if dst_is_dir else dst
+        source = src.rstrip('/') + '/' if is_dir else src
+        if to_remote:
+            source, target = source, '{}:{}'.format(self.target, target)
+        else:
+            source, target = '{}:{}'.format(self.target, source), target
+        rsh = ' '.join(shlex.quote(arg) for arg in ['ssh', '-p', str(self.port)] + self.opt_list)
+        cmd = ['rsync', '-a', '--stats', '-e', rsh] + (['-z'] if compress else []) + [source, target]
+        log.debug('rsync command: {}'.format(cmd))
+        output = subprocess.run(cmd, check=True, env={"PATH": os.environ["PATH"]}, stdout=subprocess.PIPE).stdout
+        stats = _parse_rsync_stats(output.decode())
+        sent = stats['Total bytes sent'] if to_remote else stats['Total bytes received']
+        return stats['Total file size'], sent, stats['Total file size'] - stats['Literal data']
+
+    def _has_rsync(self) -> bool:
+        if shutil.which('rsync') is None:
+            return False
+        try:
+            self.command(['command', '-v', 'rsync'], stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def _ssh_command(self, cmd: list) -> list:
+        return ['ssh', '-p', str(self.port)] + self.opt_list + [self.target] + cmd
+
+    @staticmethod
+    def _pipe(producer: list, consumer: list) -> int:
+        """ Runs producer | consumer and returns the number of bytes which went through the pipe
+        """
+        log.debug('Running {} | {}'.format(' '.join(producer), ' '.join(consumer)))
+        env = {"PATH": os.environ["PATH"]}
+        source = subprocess.Popen(producer, stdout=subprocess.PIPE, env=env)
+        sink = subprocess.Popen(consumer, stdin=subprocess.PIPE, env=env)
+        sent = 0
+        try:
+            for chunk in iter(lambda: source.stdout.read(STREAM_CHUNK_SIZE), b''):
+                sink.stdin.write(chunk)
+                sent += len(chunk)
+        finally:
+            sink.stdin.close()
+            source.stdout.close()
+            for process, cmd in ((source, producer), (sink, consumer)):
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, cmd)
+        return sent
+
+
+def _path_size(path: str) -> int:
+    """ Returns the size of a file or the total size of the files in a directory
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _parse_rsync_stats(output: str) -> dict:
+    """ Returns the byte counts of the output of rsync --stats, e.g. {'Total file size': 1234, ...}
+    """
+    return {name: int(value.replace(',', '')) for name, value in
+            re.findall(r'^([A-Z][\w ]+): ([\d,]+)', output, re.MULTILINE)}
 
 
 def temp_ssh_key(key: str) -> str:
@@ -88,14 +240,14 @@ def temp_ssh_key(key: str) -> str:
     return key_path
 
 
-@contextmanager
-def open_tunnel(
+def start_tunnel(
         user: str,
         host: str,
         port: int,
         control_path: str,
         key_path: str) -> Tunnelled:
-    """ Provides clean setup/tear down for an SSH tunnel
+    """ Starts a ControlMaster SSH connection in the background which commands
+    using the returned Tunnelled are multiplexed over
 
     Args:
         user: SSH user
@@ -103,24 +255,271 @@ def open_tunnel(
         host: string containing target host
         port: target's SSH port
     """
+    start, tunnel = _start_tunnel_command(user, host, port, control_path, key_path)
+    subprocess.run(start, check=True, env={"PATH": os.environ["PATH"]})
+    log.debug('SSH Tunnel established!')
+    return tunnel
+
+
+def close_tunnel(tunnel: Tunnelled) -> None:
+    """ Stops the ControlMaster connection of a tunnel from :func:`start_tunnel`
+    """
+    # after we are done using the tunnel, we do not care about its output
+    subprocess.run(_close_tunnel_command(tunnel), check=True, env={"PATH": os.environ["PATH"]},
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def start_tunnel_async(
+        user: str,
+        host: str,
+        port: int,
+        control_path: str,
+        key_path: str) -> Tunnelled:
+    """ Coroutine version of :func:`start_tunnel` which does not block the event loop
+    while the SSH connection is established
+    """
+    start, tunnel = _start_tunnel_command(user, host, port, control_path, key_path)
+    await _check_call_async(start)
+    log.debug('SSH Tunnel established!')
+    return tunnel
+
+
+async def close_tunnel_async(tunnel: Tunnelled) -> None:
+    """ Coroutine version of :func:`close_tunnel`
+    """
+    await _check_call_async(_close_tunnel_command(tunnel), stdout=asyncio.subprocess.DEVNULL,
+                            stderr=asyncio.subprocess.DEVNULL)
+
+
+def _start_tunnel_command(user: str, host: str, port: int, control_path: str, key_path: str) -> (list, Tunnelled):
     target = user + '@' + host
     opt_list = SHARED_SSH_OPTS + [
         '-oControlPath=' + control_path,
         '-oControlMaster=auto']
-    base_cmd = ['ssh', '-p', str(port)] + opt_list
+    start = ['ssh', '-p', str(port)] + opt_list + ['-fnN', '-i', key_path, target]
+    log.debug('Starting SSH tunnel: ' + ' '.join(start))
+    return start, Tunnelled(opt_list, target, port)
 
-    start_tunnel = base_cmd + ['-fnN', '-i', key_path, target]
-    log.debug('Starting SSH tunnel: ' + ' '.join(start_tunnel))
-    subprocess.run(start_tunnel, check=True, env={"PATH": os.environ["PATH"]})
-    log.debug('SSH Tunnel established!')
 
-    yield Tunnelled(opt_list, target, port)
+def _close_tunnel_command(tunnel: Tunnelled) -> list:
+    close = ['ssh', '-p', str(tunnel.port)] + tunnel.opt_list + ['-O', 'exit', tunnel.target]
+    log.debug('Closing SSH Tunnel: ' + ' '.join(close))
+    return close
 
-    close_tunnel = base_cmd + ['-O', 'exit', target]
-    log.debug('Closing SSH Tunnel: ' + ' '.join(close_tunnel))
-    # after we are done using the tunnel, we do not care about its output
-    subprocess.run(close_tunnel, check=True, env={"PATH": os.environ["PATH"]}, stdout=subprocess.DEVNULL,
-                   stderr=subprocess.DEVNULL)
+
+async def _check_call_async(cmd: list, **kwargs) -> None:
+    process = await asyncio.create_subprocess_exec(*cmd, env={"PATH": os.environ["PATH"]}, **kwargs)
+    returncode = await process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+class _AsyncContext:
+    """ Async context manager from an enter coroutine function returning the value of
+    the context and a state, and an exit coroutine function which is passed the state
+    """
+    def __init__(self, enter, exit):
+        self._enter = enter
+        self._exit = exit
+
+    async def __aenter__(self):
+        value, self._state = await self._enter()
+        return value
+
+    async def __aexit__(self, *exc_info):
+        await self._exit(self._state)
+
+
+@contextmanager
+def open_tunnel(
+        user: str,
+        host: str,
+        port: int,
+        control_path: str,
+        key_path: str) -> Tunnelled:
+    """ Provides clean setup/tear down for an SSH tunnel
+
+    Args:
+        user: SSH user
+        key_path: path to a private SSH key
+        host: string containing target host
+        port: target's SSH port
+    """
+    tunnel = start_tunnel(user, host, port, control_path, key_path)
+    yield tunnel
+    close_tunnel(tunnel)
+
+
+class _PooledTunnel:
+    def __init__(self, tunnel: Tunnelled):
+        self.tunnel = tunnel
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class TunnelPool:
+    """ Keeps SSH ControlMaster tunnels open and reuses them for every command to the
+    same (user, host, port), so that only the first command to a host pays for the
+    SSH handshake. Tunnels which have not been used for idle_timeout seconds are
+    closed when the pool is next used, and all of them are closed at interpreter exit
+
+    :param key_path: path to the private SSH key the tunnels are opened with
+    :type key_path: str
+    :param idle_timeout: seconds an unused tunnel is kept open
+    :type idle_timeout: float
+    """
+    def __init__(self, key_path: str, idle_timeout: float=TUNNEL_IDLE_TIMEOUT):
+        self.key_path = key_path
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self._tunnels = {}
+        self._opening = {}
+        self._opening_async = {}
+        self._lock = threading.Lock()
+        # control sockets need a short path, see the ControlPath section of ssh_config(5)
+        self._control_dir = tempfile.mkdtemp(prefix='ssh')
+        atexit.register(self.close)
+
+    def __deepcopy__(self, memo):
+        # the pool manages live processes: copies of a client share it
+        return self
+
+    def __len__(self):
+        return len(self._tunnels)
+
+    @contextmanager
+    def tunnel(self, user: str, host: str, port: int=22) -> typing.Generator[Tunnelled, None, None]:
+        """ Context manager providing an open tunnel to the host, which stays open afterwards
+
+        :param user: SSH user
+        :type user: str
+        :param host: host IP to open the tunnel to
+        :type host: str
+        :param port: SSH port of the host (defaults to 22)
+        :type port: int
+        """
+        pooled = self._acquire((user, host, port))
+        try:
+            yield pooled.tunnel
+        finally:
+            self._release(pooled)
+
+    def _acquire(self, key: tuple) -> _PooledTunnel:
+        self.evict_idle()
+        with self._lock:
+            opening = self._opening.setdefault(key, threading.Lock())
+        # tunnels to different hosts are opened concurrently, to the same host only once
+        with opening:
+            with self._lock:
+                pooled = self._tunnels.get(key)
+                if pooled is not None:
+                    pooled.users += 1
+                    return pooled
+            with self._lock:
+                self.opened += 1
+                control_path = os.path.join(self._control_dir, str(self.opened))
+            user, host, port = key
+            return self._add(key, start_tunnel(user, host, port, control_path, self.key_path))
+
+    def tunnel_async(self, user: str, host: str, port: int=22):
+        """ Async context manager version of :meth:`tunnel`, which opens tunnels without
+        blocking the event loop so that tunnels to many hosts are set up in parallel
+        """
+        async def enter():
+            pooled = await self._acquire_async((user, host, port))
+            return pooled.tunnel, pooled
+
+        async def exit(pooled):
+            self._release(pooled)
+
+        return _AsyncContext(enter, exit)
+
+    async def _acquire_async(self, key: tuple) -> _PooledTunnel:
+        await asyncio.gather(*[close_tunnel_async(pooled.tunnel) for pooled in self._pop_idle()],
+                             return_exceptions=True)
+        while True:
+            with self._lock:
+                pooled = self._tunnels.get(key)
+                if pooled is not None:
+                    pooled.users += 1
+                    return pooled
+                opening = self._opening_async.get(key)
+                if opening is None:
+                    opening = self._opening_async[key] = asyncio.Future()
+                    self.opened += 1
+                    control_path = os.path.join(self._control_dir, str(self.opened))
+                    break
+            # another coroutine is opening this tunnel, use it once it is open
+            await asyncio.shield(opening)
+        user, host, port = key
+        try:
+            tunnel = await start_tunnel_async(user, host, port, control_path, self.key_path)
+        except BaseException as e:
+            with self._lock:
+                del self._opening_async[key]
+            opening.set_exception(e)
+            # only raised to the waiters, if any
+            opening.exception()
+            raise
+        pooled = self._add(key, tunnel)
+        with self._lock:
+            del self._opening_async[key]
+        opening.set_result(None)
+        return pooled
+
+    def _add(self, key: tuple, tunnel: Tunnelled) -> _PooledTunnel:
+        """ Adds a newly opened tunnel to the pool and returns it acquired. If a tunnel to the
+        same host was added meanwhile by a synchronous and an asynchronous caller racing,
+        that one is used and the new one closed
+        """
+        with self._lock:
+            pooled = self._tunnels.get(key)
+            if pooled is None:
+                pooled = self._tunnels[key] = _PooledTunnel(tunnel)
+                tunnel = None
+            pooled.users += 1
+        if tunnel is not None:
+            self._close(_PooledTunnel(tunnel))
+        return pooled
+
+    def _release(self, pooled: _PooledTunnel):
+        with self._lock:
+            pooled.users -= 1
+            pooled.last_used = time.monotonic()
+
+    def evict_idle(self) -> None:
+        """ Closes the tunnels which are not in use and have been idle longer than the idle timeout
+        """
+        for pooled in self._pop_idle():
+            self._close(pooled)
+
+    def _pop_idle(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, pooled in self._tunnels.items()
+                    if pooled.users == 0 and now - pooled.last_used >= self.idle_timeout]
+            evicted = [self._tunnels.pop(key) for key in idle]
+        for pooled in evicted:
+            log.debug('Closing SSH tunnel to {} after being idle'.format(pooled.tunnel.target))
+        return evicted
+
+    def close(self) -> None:
+        """ Closes all tunnels of the pool
+        """
+        with self._lock:
+            tunnels = list(self._tunnels.values())
+            self._tunnels.clear()
+        for pooled in tunnels:
+            self._close(pooled)
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+
+    @staticmethod
+    def _close(pooled: _PooledTunnel) -> None:
+        try:
+            close_tunnel(pooled.tunnel)
+        except subprocess.CalledProcessError:
+            # the master connection is already gone, e.g. because the host rebooted
+            log.debug('SSH tunnel to {} was already closed'.format(pooled.tunnel.target))
 
 
 class SshClient:
@@ -130,25 +529,60 @@ class SshClient:
     :type user: str
     :param key: SSH private key for user to connect with
     :type key: str
+    :param reuse_tunnels: keep tunnels open in a :class:`TunnelPool` and run all commands
+        to a host over the same one instead of opening a tunnel per command
+    :type reuse_tunnels: bool
+    :param tunnel_idle_timeout: seconds an unused pooled tunnel is kept open
+    :type tunnel_idle_timeout: float
     """
-    def __init__(self, user: str, key: str):
+    def __init__(self, user: str, key: str, reuse_tunnels: bool=True, tunnel_idle_timeout: float=TUNNEL_IDLE_TIMEOUT):
         self.user = user
         self.key = key
         self.key_path = temp_ssh_key(key)
+        self.tunnel_pool = TunnelPool(self.key_path, tunnel_idle_timeout) if reuse_tunnels else None
 
     def tunnel(self, host: str, port: int=22) -> typing.Generator[Tunnelled, None, None]:
-        """ wrapper for the :func:`open_tunnel` context manager
+        """ wrapper for the :func:`open_tunnel` context manager, or for :meth:`TunnelPool.tunnel`
+        if tunnels are reused
 
         :param host: host IP to open the tunnel to
         :type host: str
         :param port: SSH port of the host (defaults to 22)
         :type port: int
         """
+        if self.tunnel_pool is not None:
+            return self.tunnel_pool.tunnel(self.user, host, port)
         with tempfile.NamedTemporaryFile() as f:
             return open_tunnel(self.user, host, port, f.name, self.key_path)
 
+    def tunnel_async(self, host: str, port: int=22):
+        """ Async context manager version of :meth:`tunnel`, which does not block the event
+        loop while the tunnel is opened or closed
+
+        :param host: host IP to open the tunnel to
+        :type host: str
+        :param port: SSH port of the host (defaults to 22)
+        :type port: int
+        """
+        if self.tunnel_pool is not None:
+            return self.tunnel_pool.tunnel_async(self.user, host, port)
+
+        async def enter():
+            with tempfile.NamedTemporaryFile() as f:
+                control_path = f.name
+            tunnel = await start_tunnel_async(self.user, host, port, control_path, self.key_path)
+            return tunnel, tunnel
+
+        return _AsyncContext(enter, close_tunnel_async)
+
+    def close(self) -> None:
+        """ Closes the pooled tunnels. They are also closed at interpreter exit
+        """
+        if self.tunnel_pool is not None:
+            self.tunnel_pool.close()
+
     def command(self, host: str, cmd: list, port: int=22, **kwargs) -> bytes:
-        """ Opens a tunnel and runs a single command
+        """ Runs a single command over a pooled or a newly opened tunnel
 
         :param host: host IP to open the tunnel to
         :type host: str
@@ -193,6 +627,23 @@ class SshClient:
         self.command(host, ['sudo', 'usermod', '-aG', 'docker', self.user], port=port)
 
 
+@contextmanager
+def ssh_agent(key_path: str) -> typing.Generator[dict, None, None]:
+    """ Runs an ssh-agent holding the key for the duration of the context, so that
+    connections with agent forwarding can authenticate onwards from the remote host
+    without the key being copied there. Yields the environment variables pointing to it
+    """
+    env = {'PATH': os.environ['PATH']}
+    output = subprocess.run(['ssh-agent', '-s'], check=True, env=env, stdout=subprocess.PIPE).stdout.decode()
+    env.update(re.findall(r'(SSH_AUTH_SOCK|SSH_AGENT_PID)=([^;]+);', output))
+    try:
+        subprocess.run(['ssh-add', key_path], check=True, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        yield {'SSH_AUTH_SOCK': env['SSH_AUTH_SOCK']}
+    finally:
+        subprocess.run(['ssh-agent', '-k'], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 @contextmanager
 def _make_slave_pty():
     master_pty, slave_pty = pty.openpty()
@@ -201,6 +652,14 @@ def _make_slave_pty():
     os.close(master_pty)
 
 
+def _file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
 def parse_ip(ip: str) -> (str, int):
     """  takes an IP string and either a hostname and either the given port or
     the default ssh port of 22
@@ -217,6 +676,175 @@ def parse_ip(ip: str) -> (str, int):
             "colon in it. NOTE: IPv6 is not supported at this time. Got: {}".format(ip))
 
 
+class _HostOutput:
+    """ Output accounting of one host of an :class:`OutputStream`
+    """
+    def __init__(self, host: str):
+        self.host = host
+        self.yielded = 0
+        self.dropped = 0
+        self.spill_files = {}
+
+
+class OutputStream:
+    """ Async iterator of the output of a command run on many hosts, as it arrives.
+
+    Yields OutputEvent(host, stream, data) tuples, where stream is 'stdout' or 'stderr'
+    and data a line (or a chunk of at most chunk_size bytes, for lines that are longer
+    or with lines=False), and finally one OutputEvent(host, 'exit', result) per host,
+    where result is a dict of the command, returncode, pid, the number of bytes dropped
+    and the files output was spilled to. Memory stays bounded: hosts wait for the
+    consumer when queue_size events are pending, and output beyond max_output bytes
+    per host is written to spill_directory (or dropped if there is none).
+
+    Use it with `async for`, and `async with` (or :meth:`aclose`) if the iteration
+    may stop early, so that the remaining commands are killed. See :meth:`AsyncSshClient.stream`
+    """
+    def __init__(
+            self,
+            client,
+            hosts: list,
+            cmd: list,
+            sem: asyncio.Semaphore,
+            max_output: int=None,
+            spill_directory: str=None,
+            lines: bool=True,
+            chunk_size: int=STREAM_CHUNK_SIZE,
+            queue_size: int=100):
+        self.client = client
+        self.hosts = hosts
+        self.cmd = cmd
+        self.sem = sem
+        self.max_output = max_output
+        self.spill_directory = spill_directory
+        self.lines = lines
+        self.chunk_size = chunk_size
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = None
+        self._exited = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> OutputEvent:
+        if self._tasks is None:
+            self._tasks = [asyncio.ensure_future(self._run_host(host)) for host in self.hosts]
+        if self._exited == len(self._tasks):
+            raise StopAsyncIteration
+        event = await self._queue.get()
+        if event.stream == 'exit':
+            self._exited += 1
+            if isinstance(event.data, BaseException):
+                await self.aclose()
+                raise event.data
+        return event
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """ Stops the commands which are still running
+        """
+        for task in self._tasks or []:
+            task.cancel()
+        await asyncio.gather(*(self._tasks or []), return_exceptions=True)
+
+    async def _run_host(self, host: str) -> None:
+        output = _HostOutput(host)
+        try:
+            result = await self._stream_host(output)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = e
+        finally:
+            for f in output.spill_files.values():
+                f.close()
+        await self._queue.put(OutputEvent(host, 'exit', result))
+
+    async def _stream_host(self, output: _HostOutput) -> dict:
+        hostname, port = parse_ip(output.host)
+        async with self.sem:
+            log.debug('Starting streamed command on {}'.format(output.host))
+            async with self.client.tunnel_async(hostname, port) as t:
+                cmd = ['ssh', '-p', str(t.port)] + t.opt_list + [t.target] + self.cmd
+                with _make_slave_pty() as slave_pty:
+                    process = await asyncio.create_subprocess_exec(
+                        *cmd, stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE,
+                        stdin=slave_pty,
+                        env={'TERM': 'linux', 'PATH': os.environ['PATH']})
+                    tasks = [
+                        asyncio.ensure_future(self._pump(output, 'stdout', process.stdout)),
+                        asyncio.ensure_future(self._pump(output, 'stderr', process.stderr)),
+                        asyncio.ensure_future(process.wait())]
+                    try:
+                        done, pending = await asyncio.wait(tasks, timeout=self.client.process_timeout)
+                        if pending:
+                            log.error('timeout of {} sec reached. PID {} killed'.format(
+                                self.client.process_timeout, process.pid))
+                        for task in done:
+                            task.result()
+                    finally:
+                        for task in tasks:
+                            task.cancel()
+                        if process.returncode is None:
+                            try:
+                                process.terminate()
+                            except ProcessLookupError:
+                                log.info('process with pid {} not found'.format(process.pid))
+                            await process.wait()
+        return {
+            'cmd': cmd,
+            'returncode': process.returncode,
+            'pid': process.pid,
+            'dropped': output.dropped,
+            'spill_files': {stream: f.name for stream, f in output.spill_files.items()},
+        }
+
+    async def _pump(self, output: _HostOutput, stream: str, reader: asyncio.StreamReader) -> None:
+        pending = b''
+        while True:
+            data = await reader.read(self.chunk_size)
+            if not data:
+                break
+            if not self.lines:
+                await self._emit(output, stream, data)
+                continue
+            pending += data
+            complete = pending.split(b'\n')
+            pending = complete.pop()
+            for line in complete:
+                await self._emit(output, stream, line + b'\n')
+            if len(pending) >= self.chunk_size:
+                await self._emit(output, stream, pending)
+                pending = b''
+        if pending:
+            await self._emit(output, stream, pending)
+
+    async def _emit(self, output: _HostOutput, stream: str, data: bytes) -> None:
+        if self.max_output is not None:
+            allowed = max(0, self.max_output - output.yielded)
+            data, rest = data[:allowed], data[allowed:]
+            if rest:
+                self._spill(output, stream, rest)
+        if data:
+            output.yielded += len(data)
+            await self._queue.put(OutputEvent(output.host, stream, data))
+
+    def _spill(self, output: _HostOutput, stream: str, data: bytes) -> None:
+        if self.spill_directory is None:
+            output.dropped += len(data)
+            return
+        if stream not in output.spill_files:
+            path = os.path.join(self.spill_directory, '{}.{}'.format(output.host.replace(':', '_'), stream))
+            output.spill_files[stream] = open(path, 'wb')
+        output.spill_files[stream].write(data)
+
+
 class AsyncSshClient(SshClient):
     """ SshClient for running against a set of hosts in parallel
 
@@ -227,6 +855,7 @@ class AsyncSshClient(SshClient):
         process_timeout (optional): how many seconds any given process can run for
         parallelism (optional): how many processes to run at the same time. Rarely is
             a SSH command CPU bound, so this number can be greater than CPU concurrency
+        **kwargs: tunnel reuse options of :class:`SshClient`
     """
     def __init__(
             self,
@@ -234,17 +863,19 @@ class AsyncSshClient(SshClient):
             key: str,
             targets: list,
             process_timeout=120,
-            parallelism=10):
-        super().__init__(user, key)
+            parallelism=10,
+            **kwargs):
+        super().__init__(user, key, **kwargs)
         self.process_timeout = process_timeout
         self.__targets = targets
         self.__parallelism = parallelism
 
-    async def _run_cmd_return_dict_async(self, cmd: list) -> dict:
+    async def _run_cmd_return_dict_async(self, cmd: list, env: dict=None) -> dict:
         """ Runs an arbitrary command as an asynchronous subprocess
 
         Args:
             cmd: list or argument to initialize the process
+            env (optional): environment variables to set in addition to TERM and PATH
 
         Returns:
             dict of the command args, output, returncode, and pid
@@ -255,7 +886,7 @@ class AsyncSshClient(SshClient):
                 *cmd, stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 stdin=slave_pty,
-                env={'TERM': 'linux'})
+                env=dict(env or {}, TERM='linux', PATH=os.environ['PATH']))
             stdout = b''
             stderr = b''
             try:
@@ -289,7 +920,7 @@ class AsyncSshClient(SshClient):
         hostname, port = parse_ip(host)
         async with sem:
             log.debug('Starting run command on {}'.format(host))
-            with self.tunnel(hostname, port) as t:
+            async with self.tunnel_async(hostname, port) as t:
                 full_cmd = ['ssh', '-p', str(t.port)] + t.opt_list + [t.target] + cmd
                 result = await self._run_cmd_return_dict_async(full_cmd)
         result['host'] = host
@@ -302,7 +933,7 @@ class AsyncSshClient(SshClient):
             local_path: str,
             remote_path: str,
             recursive: bool) -> dict:
-        """ uses SCP to copy files to remote host
+        """ uses SCP to copy files to remote host, over a pooled tunnel if tunnels are reused
 
         Args:
             sem: semaphore for concurrency control
@@ -322,12 +953,160 @@ class AsyncSshClient(SshClient):
                 copy_command.append('-r')
             remote_full_path = '{}@{}:{}'.format(self.user, hostname, remote_path)
             copy_command += [local_path, remote_full_path]
-            full_cmd = ['scp'] + SHARED_SSH_OPTS + ['-P', str(port), '-i', self.key_path] + copy_command
-            log.debug('copy with command {}'.format(full_cmd))
-            result = await self._run_cmd_return_dict_async(full_cmd)
+            if self.tunnel_pool is None:
+                full_cmd = ['scp'] + SHARED_SSH_OPTS + ['-P', str(port), '-i', self.key_path] + copy_command
+                log.debug('copy with command {}'.format(full_cmd))
+                result = await self._run_cmd_return_dict_async(full_cmd)
+            else:
+                async with self.tunnel_async(hostname, port) as t:
+                    full_cmd = ['scp'] + t.opt_list + ['-P', str(port)] + copy_command
+                    log.debug('copy with command {}'.format(full_cmd))
+                    result = await self._run_cmd_return_dict_async(full_cmd)
+        result['host'] = host
+        return result
+
+    def distribute(
+            self,
+            local_path: str,
+            remote_path: str,
+            fanout: int=DISTRIBUTION_FANOUT,
+            verify: bool=True) -> list:
+        """ Copies a file to all hosts, uploading it from here only to the first hosts and
+        having every host which received it relay it to further hosts. The number of
+        hosts with the file grows geometrically, so the time taken grows with the
+        logarithm of the number of hosts rather than linearly, and the file crosses the
+        uplink of the test runner only a few times.
+
+        Hosts authenticate to each other with the key of this client through a temporary
+        ssh-agent and agent forwarding, and connect to each other with the same addresses.
+
+        Args:
+            local_path: file that will be copied
+            remote_path: where the file will be copied to on every host
+            fanout (optional): number of copies any host, or the test runner, sends at the same time
+            verify (optional): compare the sha256 of every copy to the local file. Hosts whose
+                copy does not match do not relay it
+
+        Returns:
+            list of copy result dicts (see _run_cmd_return_dict_async) in the order of the
+            targets, with the host it was copied from as 'source' (None for this host) and,
+            if verify is set, the outcome of the verification as 'verified'
+        """
+        if os.path.isdir(local_path):
+            raise ValueError('Only files can be distributed, {} is a directory'.format(local_path))
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            with ssh_agent(self.key_path) as agent_env:
+                results = loop.run_until_complete(
+                    self.distribute_async(local_path, remote_path, agent_env, fanout, verify))
+        finally:
+            loop.close()
+        return results
+
+    async def distribute_async(
+            self,
+            local_path: str,
+            remote_path: str,
+            agent_env: dict,
+            fanout: int=DISTRIBUTION_FANOUT,
+            verify: bool=True) -> list:
+        """ Coroutine of :meth:`distribute`, agent_env is the environment of the
+        :func:`ssh_agent` holding the key of this client
+        """
+        checksum = _file_sha256(local_path) if verify else None
+        pending = collections.deque(self.__targets)
+        # one item per copy a source may send, None being this host
+        senders = asyncio.Queue()
+        for _ in range(fanout):
+            senders.put_nowait(None)
+        results = {}
+        unlimited = asyncio.Semaphore(len(pending) or 1)
+
+        async def send(source, host):
+            try:
+                if source is None:
+                    result = await self.copy(unlimited, host, local_path, remote_path, False)
+                else:
+                    result = await self._relay(source, host, remote_path, agent_env)
+                result['source'] = source
+                if verify and result['returncode'] == 0:
+                    result['verified'] = await self._verify(host, remote_path, checksum)
+                results[host] = result
+            finally:
+                senders.put_nowait(source)
+            if result['returncode'] == 0 and result.get('verified', True):
+                for _ in range(fanout):
+                    senders.put_nowait(host)
+
+        tasks = []
+        while pending:
+            source = await senders.get()
+            host = pending.popleft()
+            log.debug('Distributing {} to {} from {}'.format(remote_path, host, source or 'localhost'))
+            tasks.append(asyncio.ensure_future(send(source, host)))
+        if tasks:
+            await asyncio.wait(tasks)
+        for task in tasks:
+            task.result()
+        return [results[host] for host in self.__targets]
+
+    async def _relay(self, source: str, host: str, remote_path: str, agent_env: dict) -> dict:
+        """ Copies remote_path from the source host to the host over an ssh connection to the
+        source with agent forwarding
+        """
+        source_hostname, source_port = parse_ip(source)
+        hostname, port = parse_ip(host)
+        relay_cmd = ['scp'] + SHARED_SSH_OPTS + ['-P', str(port), remote_path,
+                                                 '{}@{}:{}'.format(self.user, hostname, remote_path)]
+        full_cmd = ['ssh', '-p', str(source_port)] + SHARED_SSH_OPTS + [
+            '-oForwardAgent=yes', '-i', self.key_path, '{}@{}'.format(self.user, source_hostname),
+            ' '.join(shlex.quote(arg) for arg in relay_cmd)]
+        log.debug('relay with command {}'.format(full_cmd))
+        result = await self._run_cmd_return_dict_async(full_cmd, env=agent_env)
         result['host'] = host
         return result
 
+    async def _verify(self, host: str, remote_path: str, checksum: str) -> bool:
+        result = await self.run(asyncio.Semaphore(), host, ['sha256sum', shlex.quote(remote_path)])
+        remote_checksum = result['stdout'].decode().split(' ', 1)[0] if result['returncode'] == 0 else None
+        if remote_checksum != checksum:
+            log.error('Checksum of {} on {} is {}, expected {}'.format(remote_path, host, remote_checksum, checksum))
+            return False
+        return True
+
+    def stream(
+            self,
+            cmd: list,
+            max_output: int=None,
+            spill_directory: str=None,
+            lines: bool=True,
+            chunk_size: int=STREAM_CHUNK_SIZE,
+            sem: asyncio.Semaphore=None) -> OutputStream:
+        """ Runs a command on all hosts and streams its output as it arrives instead of
+        buffering it, e.g.::
+
+            async with client.stream(['journalctl', '-u', 'dcos-mesos-slave'], max_output=2 ** 20) as output:
+                async for host, stream, data in output:
+                    ...
+
+        Args:
+            cmd: argument list to be executed on the remote hosts
+            max_output (optional): bytes of output yielded per host, the rest is spilled or dropped
+            spill_directory (optional): directory output beyond max_output is written to,
+                in a <host>.<stream> file per host and stream
+            lines (optional): yield whole lines rather than chunks as they are read
+            chunk_size (optional): bytes read at a time
+            sem (optional): semaphore for controlling concurrency. If not supplied, a semaphore
+                of the default parallelism will be created
+
+        Returns:
+            OutputStream of OutputEvent(host, stream, data)
+        """
+        if not sem:
+            sem = asyncio.Semaphore(self.__parallelism)
+        return OutputStream(self, self.__targets, cmd, sem, max_output, spill_directory, lines, chunk_size)
+
     async def run_command_on_hosts(self, coroutine_name: str, *args, sem: asyncio.Semaphore=None) -> list:
         """ Starts and waits upon tasks running across all hosts
 
@@ -1,12 +1,18 @@
 """ Verifies basic interface for the test harness employed in
 DC/OS integration tests, see: packages/dcos-integration-tests/extra
 """
+import copy
+import json
+import threading
+import time
+
 import pytest
 import requests
+import responses
 
 from unittest.mock import MagicMock
 
-from dcos_test_utils import dcos_api, helpers
+from dcos_test_utils import dcos_api, helpers, recordio
 
 
 class MockResponse:
@@ -94,3 +100,219 @@ def test_api_client_session_path(monkeypatch):
     api.get(test_path)
     assert mock_request.call_args[0][0] == 'GET'
     assert mock_request.call_args[0][1] == access_url + test_path
+
+
+@responses.activate
+def test_mesos_operator_events():
+    events = [{'type': 'SUBSCRIBED'}, {'type': 'HEARTBEAT'}]
+    encoder = recordio.Encoder(lambda e: json.dumps(e).encode('UTF-8'))
+    responses.add(responses.POST, 'http://leader.mesos/mesos/api/v1',
+                  body=b''.join(encoder.encode(e) for e in events))
+    args = dcos_api.DcosApiSession.get_args_from_env()
+    args['auth_user'] = None
+    cluster = dcos_api.DcosApiSession(**args)
+    assert list(cluster.mesos_operator_events()) == events
+    assert json.loads(responses.calls[0].request.body) == {'type': 'SUBSCRIBE'}
+
+
+def test_run_readiness_probes_runs_independent_probes_concurrently():
+    started = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    def probe(name, wait=False):
+        def check():
+            started.append(name)
+            if wait:
+                # only passes if both independent probes are running at the same time
+                barrier.wait()
+        return check
+
+    timings = dcos_api.run_readiness_probes([
+        dcos_api.ReadinessProbe('login', probe('login'), ()),
+        dcos_api.ReadinessProbe('a', probe('a', wait=True), ('login',)),
+        dcos_api.ReadinessProbe('b', probe('b', wait=True), ('login',)),
+        dcos_api.ReadinessProbe('c', probe('c'), ('a', 'b'))])
+    assert set(timings) == {'login', 'a', 'b', 'c'}
+    assert started[0] == 'login'
+    assert started[-1] == 'c'
+
+
+def test_run_readiness_probes_failure():
+    def fail():
+        raise AssertionError('not ready')
+
+    ran = []
+    with pytest.raises(AssertionError, match='not ready'):
+        dcos_api.run_readiness_probes([
+            dcos_api.ReadinessProbe('a', fail, ()),
+            dcos_api.ReadinessProbe('b', lambda: ran.append('b'), ('a',))])
+    assert ran == []
+
+
+def test_run_readiness_probes_failure_cancels_running_polls():
+    stopped = threading.Event()
+
+    @helpers.poll('never_ready', initial_interval=0.05, max_interval=0.05, retry_on_result=lambda r: True)
+    def never_ready():
+        return False
+
+    def wait_forever():
+        try:
+            never_ready()
+        finally:
+            stopped.set()
+
+    def fail():
+        time.sleep(0.1)
+        raise AssertionError('not ready')
+
+    with pytest.raises(AssertionError, match='not ready'):
+        dcos_api.run_readiness_probes([
+            dcos_api.ReadinessProbe('a', fail, ()),
+            dcos_api.ReadinessProbe('b', wait_forever, ())])
+    # the thread of the probe without a timeout ends rather than keeping the process alive
+    assert stopped.wait(5)
+
+
+def test_run_readiness_probes_circular_dependency():
+    with pytest.raises(Exception, match='circular'):
+        dcos_api.run_readiness_probes([
+            dcos_api.ReadinessProbe('a', lambda: None, ('b',)),
+            dcos_api.ReadinessProbe('b', lambda: None, ('a',))])
+
+
+def test_wait_for_dcos_runs_all_probes(monkeypatch):
+    monkeypatch.setenv('WAIT_FOR_HOSTS', 'false')
+    cluster = dcos_api.DcosApiSession('http://mydcos.dcos', None, None, None, None)
+    called = []
+    for name in ('_wait_for_adminrouter_up', 'login_default_user', 'set_node_lists_if_unset',
+                 '_wait_for_marathon_up', '_wait_for_zk_quorum', '_wait_for_slaves_to_join',
+                 '_wait_for_srouter_slaves_endpoints', '_wait_for_metronome', '_wait_for_all_healthy_services'):
+        monkeypatch.setattr(cluster, name, lambda name=name: called.append(name))
+    timings = cluster.wait_for_dcos()
+    assert len(called) == 9
+    assert called[:3] == ['_wait_for_adminrouter_up', 'login_default_user', 'set_node_lists_if_unset']
+    assert called.index('_wait_for_srouter_slaves_endpoints') > called.index('_wait_for_slaves_to_join')
+    assert set(timings) == {'adminrouter', 'login', 'node_lists', 'marathon', 'zk_quorum', 'slaves_joined',
+                            'srouter_slaves_endpoints', 'metronome', 'healthy_services'}
+    assert cluster.readiness_timings == timings
+
+
+def test_wait_for_dcos_probes_use_sessions_of_their_own(monkeypatch):
+    monkeypatch.setenv('WAIT_FOR_HOSTS', 'false')
+    cluster = dcos_api.DcosApiSession('http://mydcos.dcos', None, None, None, None)
+    cluster.session.auth = dcos_api.DcosAuth('foo')
+    sessions = {}
+    for name in ('_wait_for_adminrouter_up', '_wait_for_marathon_up', '_wait_for_zk_quorum',
+                 '_wait_for_slaves_to_join', '_wait_for_srouter_slaves_endpoints', '_wait_for_metronome',
+                 '_wait_for_all_healthy_services'):
+        monkeypatch.setattr(dcos_api.DcosApiSession, name,
+                            lambda self, name=name: sessions.__setitem__(name, self.session))
+    monkeypatch.setattr(cluster, 'login_default_user', lambda: None)
+    monkeypatch.setattr(cluster, 'set_node_lists_if_unset', lambda: None)
+    cluster.wait_for_dcos()
+    assert len({id(session) for session in sessions.values()}) == 7
+    assert not any(session is cluster.session for session in sessions.values())
+    assert all(session.auth is cluster.session.auth for session in sessions.values())
+
+
+def test_wait_for_dcos_checks_host_lists_after_login(monkeypatch):
+    monkeypatch.setenv('WAIT_FOR_HOSTS', 'true')
+    cluster = dcos_api.DcosApiSession('http://mydcos.dcos', None, None, None, None)
+    called = []
+    for name in ('_wait_for_adminrouter_up', 'login_default_user', 'set_node_lists_if_unset'):
+        monkeypatch.setattr(cluster, name, lambda name=name: called.append(name))
+    with pytest.raises(Exception, match='not all host lists'):
+        cluster.wait_for_dcos()
+    assert called == ['_wait_for_adminrouter_up', 'login_default_user']
+
+
+@responses.activate
+def test_wait_for_srouter_slaves_endpoints_only_repolls_stragglers():
+    slaves = {'slaves': [{'id': 'agent-1', 'hostname': '10.0.0.1'},
+                         {'id': 'agent-2', 'hostname': '10.0.0.2'},
+                         {'id': 'unexpected', 'hostname': '10.0.0.3'}]}
+    responses.add(responses.GET, 'http://leader.mesos/mesos/master/slaves', json=slaves)
+    responses.add(responses.GET, 'http://leader.mesos/slave/agent-1/slave%281%29/state', json={'id': 'agent-1'})
+    responses.add(responses.GET, 'http://leader.mesos/slave/agent-2/slave%281%29/state', status=404)
+    responses.add(responses.GET, 'http://leader.mesos/slave/agent-2/slave%281%29/state', json={'id': 'agent-2'})
+    cluster = dcos_api.DcosApiSession('http://leader.mesos', [], ['10.0.0.1'], ['10.0.0.2'], None)
+
+    cluster._wait_for_srouter_slaves_endpoints()
+
+    requested = [c.request.url for c in responses.calls]
+    assert requested.count('http://leader.mesos/slave/agent-1/slave%281%29/state') == 1
+    assert requested.count('http://leader.mesos/slave/agent-2/slave%281%29/state') == 2
+    assert not any('unexpected' in url for url in requested)
+
+
+def test_copy_shares_connection_pools(mock_dcos_client):
+    mock_dcos_client.session.cookies.update({'dcos-acs-auth-cookie': 'foo'})
+    new = mock_dcos_client.copy()
+    assert new.session.get_adapter('http://mydcos.dcos') is mock_dcos_client.session.get_adapter('http://mydcos.dcos')
+    assert len(new.session.cookies.items()) == 0
+    new.session.headers['X-Test'] = 'copy'
+    assert 'X-Test' not in mock_dcos_client.session.headers
+    assert new.master_list == mock_dcos_client.master_list
+    assert new.master_list is not mock_dcos_client.master_list
+    marathon = mock_dcos_client.marathon
+    assert 'Accept' in marathon.session.headers
+    assert mock_dcos_client.session.headers['Accept'] == requests.utils.default_headers()['Accept']
+
+
+def test_cached_clients(monkeypatch):
+    monkeypatch.setattr(requests.Session, 'request', lambda *args, **kwargs: MockResponse())
+    cluster = dcos_api.DcosApiSession('http://mydcos.dcos', ['10.0.0.1'], [], [], None, cache_clients=True)
+    marathon = cluster.marathon
+    assert cluster.marathon is marathon
+    assert cluster.jobs is cluster.jobs
+    assert cluster.jobs is not marathon
+
+    # logging in replaces session.auth, which invalidates cached clients
+    cluster.auth_user = dcos_api.DcosUser({'foo': 'bar'})
+    cluster.login_default_user()
+    assert cluster.marathon is not marathon
+    assert cluster.marathon.session.auth.auth_token == 'bar'
+    marathon = cluster.marathon
+    assert cluster.marathon is marathon
+
+    cluster.default_url = helpers.Url.from_string('http://other.dcos')
+    assert cluster.marathon is not marathon
+    assert str(cluster.marathon.default_url) == 'http://other.dcos/marathon'
+
+    # so does changing a node list in place
+    marathon = cluster.marathon
+    cluster.master_list.append('10.0.0.2')
+    assert cluster.marathon is not marathon
+    marathon = cluster.marathon
+    assert cluster.marathon is marathon
+
+    # copies start with an empty cache
+    assert cluster.copy().marathon is not cluster.marathon
+
+
+def test_clients_not_cached_by_default(mock_dcos_client):
+    assert mock_dcos_client.marathon is not mock_dcos_client.marathon
+
+
+def test_derived_clients_share_pollers(mock_dcos_client):
+    assert mock_dcos_client.marathon.apps_poller is mock_dcos_client.marathon.apps_poller
+    assert mock_dcos_client.marathon.deployment_tracker is mock_dcos_client.marathon.deployment_tracker
+    assert mock_dcos_client.jobs.jobs_poller is mock_dcos_client.jobs.jobs_poller
+    assert mock_dcos_client.copy().marathon.apps_poller is mock_dcos_client.marathon.apps_poller
+    # clients of another user do not share the pollers
+    other = mock_dcos_client.copy()
+    other.session.auth = dcos_api.DcosAuth('other')
+    assert other.marathon.apps_poller is not mock_dcos_client.marathon.apps_poller
+
+
+def test_derived_clients_can_be_deep_copied(mock_dcos_client):
+    mock_dcos_client.session.auth = dcos_api.DcosAuth('foo')
+    marathon = mock_dcos_client.marathon
+    marathon.apps_poller
+    for client in (mock_dcos_client, marathon, mock_dcos_client.jobs):
+        assert str(copy.deepcopy(client).default_url) == str(client.default_url)
+    marathon_copy = copy.deepcopy(marathon)
+    assert marathon_copy.shared_pollers is marathon.shared_pollers
+    # the copy has its own auth object, so it does not poll through the original client
+    assert marathon_copy.apps_poller is not marathon.apps_poller
@@ -1,5 +1,10 @@
+import hashlib
+import io
 import os
+import struct
 import tempfile
+import zipfile
+import zlib
 from unittest import TestCase
 from unittest.mock import patch
 from uuid import UUID
@@ -185,3 +190,293 @@ def test_download_reports():
         diagnostics.download_diagnostics_reports(['f053c58c-b9ce-11e9-8c5b-38d54714bf36'], tmpdirname)
         with open(os.path.join(tmpdirname, 'f053c58c-b9ce-11e9-8c5b-38d54714bf36'), 'r') as f:
             assert f.read() == 'OK'
+
+
+BUNDLE_URL = 'http://leader.mesos/system/health/v1/diagnostics/{}/file'
+
+
+def _ranged_bundle(body, ranges=True, requests_log=None, etag='"v1"'):
+    """ responses callback serving body, honoring single 'bytes=a-b' Range headers if ranges is set
+    unless their If-Range does not match etag
+    """
+    def callback(request):
+        if requests_log is not None:
+            requests_log.append(request.headers.get('Range'))
+        if not ranges or 'Range' not in request.headers or request.headers.get('If-Range', etag) != etag:
+            return 200, {'Content-Length': str(len(body)), 'ETag': etag}, body
+        first, last = request.headers['Range'][len('bytes='):].split('-')
+        first, last = int(first), int(last or len(body) - 1)
+        if first >= len(body):
+            return 416, {'Content-Range': 'bytes */{}'.format(len(body))}, b''
+        return 206, {'Content-Range': 'bytes {}-{}/{}'.format(first, last, len(body)), 'ETag': etag}, \
+            body[first:last + 1]
+    return callback
+
+
+def _write_part(directory, data, validator='"v1"'):
+    """ Leaves a partial download of 'bundle' behind, as an interrupted download would
+    """
+    with open(os.path.join(directory, 'bundle.part'), 'wb') as f:
+        f.write(data)
+    if validator is not None:
+        with open(os.path.join(directory, 'bundle.part.validator'), 'w') as f:
+            f.write(validator)
+
+
+def _diagnostics():
+    args = dcos_api.DcosApiSession.get_args_from_env()
+    dcos_api_session = dcos_api.DcosApiSession(**args)
+    return Diagnostics(
+        default_url=dcos_api_session.default_url.copy(path='system/health/v1'),
+        masters=['leader.mesos'],
+        all_slaves=[],
+        session=dcos_api_session.copy().session,
+    )
+
+
+@responses.activate
+@pytest.mark.parametrize('ranges', [True, False])
+def test_download_reports_resumes_partial_download(ranges):
+    body = bytes(range(256)) * 40
+    sent_ranges = []
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'),
+                           callback=_ranged_bundle(body, ranges, sent_ranges))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        _write_part(tmpdirname, body[:1000])
+        results = _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname, chunk_size=100)
+        with open(os.path.join(tmpdirname, 'bundle'), 'rb') as f:
+            assert f.read() == body
+        assert os.listdir(tmpdirname) == ['bundle']
+
+    assert sent_ranges == ['bytes=1000-']
+    assert results['bundle'].size == len(body)
+    assert results['bundle'].resumed_from == (1000 if ranges else 0)
+
+
+@responses.activate
+@pytest.mark.parametrize('validator', ['"v0"', None])
+def test_download_reports_restarts_stale_partial_download(validator):
+    body = bytes(range(256)) * 40
+    sent_ranges = []
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'),
+                           callback=_ranged_bundle(body, requests_log=sent_ranges))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        # left over from a download of another version of the bundle
+        _write_part(tmpdirname, b'x' * 1000, validator)
+        results = _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname)
+        with open(os.path.join(tmpdirname, 'bundle'), 'rb') as f:
+            assert f.read() == body
+
+    assert sent_ranges == (['bytes=1000-'] if validator else [None])
+    assert results['bundle'].resumed_from == 0
+
+
+@responses.activate
+def test_download_reports_resumes_interrupted_download():
+    body = bytes(range(256)) * 40
+    sent_ranges = []
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'),
+                           callback=_ranged_bundle(body, requests_log=sent_ranges))
+
+    def interrupt(bundle, downloaded, total):
+        if downloaded >= 1000:
+            raise requests.exceptions.ChunkedEncodingError()
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname, chunk_size=500, progress=interrupt)
+        with open(os.path.join(tmpdirname, 'bundle.part.validator')) as f:
+            assert f.read() == '"v1"'
+        results = _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname, chunk_size=500)
+        with open(os.path.join(tmpdirname, 'bundle'), 'rb') as f:
+            assert f.read() == body
+        assert os.listdir(tmpdirname) == ['bundle']
+
+    assert sent_ranges == [None, 'bytes=1000-']
+    assert results['bundle'].resumed_from == 1000
+
+
+@responses.activate
+def test_download_reports_restarts_complete_partial_download():
+    body = b'0123456789'
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'), callback=_ranged_bundle(body))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        _write_part(tmpdirname, body)
+        _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname)
+        with open(os.path.join(tmpdirname, 'bundle'), 'rb') as f:
+            assert f.read() == body
+
+
+@responses.activate
+@pytest.mark.parametrize('ranges', [True, False])
+def test_download_reports_in_segments(ranges):
+    body = os.urandom(10000)
+    sent_ranges = []
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'),
+                           callback=_ranged_bundle(body, ranges, sent_ranges))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        results = _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname, segments=4, chunk_size=512)
+        with open(os.path.join(tmpdirname, 'bundle'), 'rb') as f:
+            assert f.read() == body
+
+    assert results['bundle'].size == len(body)
+    if ranges:
+        assert sorted(sent_ranges[1:]) == ['bytes=0-2499', 'bytes=2500-4999', 'bytes=5000-7499', 'bytes=7500-9999']
+    else:
+        assert sent_ranges == ['bytes=0-0', None]
+
+
+@responses.activate
+def test_download_reports_concurrently_with_progress():
+    bundles = {'bundle-{}'.format(i): os.urandom(1000 * (i + 1)) for i in range(5)}
+    for bundle, body in bundles.items():
+        responses.add_callback(responses.GET, BUNDLE_URL.format(bundle), callback=_ranged_bundle(body))
+    progress = {}
+
+    def report(bundle, downloaded, total):
+        progress.setdefault(bundle, []).append((downloaded, total))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        results = _diagnostics().download_diagnostics_reports(
+            sorted(bundles), tmpdirname, chunk_size=256, max_workers=3, progress=report)
+        for bundle, body in bundles.items():
+            with open(os.path.join(tmpdirname, bundle), 'rb') as f:
+                assert f.read() == body
+
+    assert list(results) == sorted(bundles)
+    for bundle, body in bundles.items():
+        assert progress[bundle][-1] == (len(body), len(body))
+        assert [d for d, _ in progress[bundle]] == sorted(d for d, _ in progress[bundle])
+
+
+def _bundle_zip(members, descriptor=False, zip64=False):
+    """ Writes members the way a streaming zip writer does: deflated, with the sizes
+    either in the local header or in a data descriptor after the data, and optionally
+    in zip64 form. The central directory is not read while streaming, so only the end
+    of central directory record is written after the members
+    """
+    out = io.BytesIO()
+    for name, data in members.items():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+        sizes = (0, 0) if descriptor else (len(compressed), len(data))
+        extra = b''
+        if zip64:
+            extra = struct.pack('<2H2Q', 1, 16, sizes[1], sizes[0])
+            sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+        out.write(struct.pack('<4s5H3L2H', b'PK\x03\x04', 45, 0x08 if descriptor else 0, 8, 0, 0,
+                              0 if descriptor else crc, sizes[0], sizes[1], len(name), len(extra)))
+        out.write(name.encode() + extra + compressed)
+        if descriptor:
+            out.write(struct.pack('<4sL2Q' if zip64 else '<4s3L', b'PK\x07\x08', crc, len(compressed), len(data)))
+    out.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, 0, 0, 0, out.tell(), 0))
+    return out.getvalue()
+
+
+BUNDLE_MEMBERS = {
+    'bundle/10.0.0.1_master/dcos-diagnostics-health.json': b'{"units": []}',
+    'bundle/10.0.0.1_master/dcos-mesos-master.service.gz': os.urandom(3000),
+    'bundle/10.0.0.2_agent/dcos-diagnostics-health.json': b'{"units": [1]}' * 1000,
+    'bundle/summaryReport.txt': b'',
+}
+
+
+@responses.activate
+@pytest.mark.parametrize('descriptor', [False, True])
+@pytest.mark.parametrize('zip64', [False, True])
+def test_download_reports_checksum_and_extract(descriptor, zip64):
+    body = _bundle_zip(BUNDLE_MEMBERS, descriptor, zip64)
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle.zip'), callback=_ranged_bundle(body))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        results = _diagnostics().download_diagnostics_reports(
+            ['bundle.zip'], tmpdirname, chunk_size=100, checksum='sha256',
+            extract=['*/dcos-diagnostics-health.json', '*/summaryReport.txt'])
+        extracted = {os.path.relpath(path, os.path.join(tmpdirname, 'bundle-extracted')): open(path, 'rb').read()
+                     for path in results['bundle.zip'].extracted}
+
+    assert results['bundle.zip'].checksum == hashlib.sha256(body).hexdigest()
+    assert extracted == {name: data for name, data in BUNDLE_MEMBERS.items() if not name.endswith('.gz')}
+
+
+@responses.activate
+def test_download_reports_checksum_of_resumed_download():
+    body = _bundle_zip(BUNDLE_MEMBERS, descriptor=True)
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle'), callback=_ranged_bundle(body))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        _write_part(tmpdirname, body[:2000])
+        results = _diagnostics().download_diagnostics_reports(
+            ['bundle'], tmpdirname, chunk_size=128, checksum='md5', extract=['*.gz'])
+        with open(results['bundle'].extracted[0], 'rb') as f:
+            assert f.read() == BUNDLE_MEMBERS['bundle/10.0.0.1_master/dcos-mesos-master.service.gz']
+
+    assert results['bundle'].resumed_from == 2000
+    assert results['bundle'].checksum == hashlib.md5(body).hexdigest()
+
+
+@responses.activate
+def test_download_reports_detects_corrupted_member():
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bundle/a.txt', b'a' * 100)
+    body = bytearray(out.getvalue())
+    # flip the stored crc of the member
+    body[14] ^= 0xFF
+    responses.add(responses.GET, BUNDLE_URL.format('bundle'), body=bytes(body))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with pytest.raises(ValueError, match='CRC mismatch in extracted zip member bundle/a.txt'):
+            _diagnostics().download_diagnostics_reports(['bundle'], tmpdirname, extract=['*'])
+
+
+class _Unseekable(io.RawIOBase):
+    """ Write-only stream which cannot seek, like a socket or a pipe
+    """
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.data.write(b)
+
+
+@responses.activate
+def test_download_reports_extract_members_which_cannot_be_streamed():
+    out = _Unseekable()
+    # written to a non-seekable stream, zipfile puts the sizes of every member after its data
+    with zipfile.ZipFile(out, 'w') as zf:
+        zf.writestr('bundle/first.json', b'{"first": 1}' * 100, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('bundle/stored.txt', b'not streamable' * 100, compress_type=zipfile.ZIP_STORED)
+        zf.writestr('bundle/skipped.log', b'skipped', compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('bundle/last.json', b'{"last": 1}' * 100, compress_type=zipfile.ZIP_DEFLATED)
+    body = out.data.getvalue()
+    responses.add_callback(responses.GET, BUNDLE_URL.format('bundle.zip'), callback=_ranged_bundle(body))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        results = _diagnostics().download_diagnostics_reports(
+            ['bundle.zip'], tmpdirname, chunk_size=100, checksum='sha256', extract=['*.json', '*.txt'])
+        extracted = {os.path.relpath(path, os.path.join(tmpdirname, 'bundle-extracted')): open(path, 'rb').read()
+                     for path in results['bundle.zip'].extracted}
+        with open(os.path.join(tmpdirname, 'bundle.zip'), 'rb') as f:
+            assert f.read() == body
+
+    assert results['bundle.zip'].checksum == hashlib.sha256(body).hexdigest()
+    assert extracted == {
+        'bundle/first.json': b'{"first": 1}' * 100,
+        'bundle/stored.txt': b'not streamable' * 100,
+        'bundle/last.json': b'{"last": 1}' * 100,
+    }
+    assert [os.path.basename(p) for p in results['bundle.zip'].extracted] == ['first.json', 'stored.txt', 'last.json']
+
+
+def test_download_reports_extract_needs_ordered_download():
+    with pytest.raises(ValueError):
+        _diagnostics().download_diagnostics_reports(['bundle'], segments=2, checksum='sha256')
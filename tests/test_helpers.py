@@ -1,8 +1,398 @@
 """Tests for dcos_test_utils.helpers."""
-from dcos_test_utils import helpers
+import asyncio
+import copy
+import gc
+import http.server
+import pickle
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+import requests
+import retrying
+
+from dcos_test_utils import dcos_api, helpers
 
 
 def test_marathon_app_id_to_mesos_dns_subdomain():
     assert helpers.marathon_app_id_to_mesos_dns_subdomain('/app-1') == 'app-1'
     assert helpers.marathon_app_id_to_mesos_dns_subdomain('app-1') == 'app-1'
     assert helpers.marathon_app_id_to_mesos_dns_subdomain('/group-1/app-1') == 'app-1-group-1'
+
+
+class SlowRequest:
+    """ Stand-in for requests.Session.request which records the URLs requested
+    and the highest number of requests that were in flight at the same time
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.urls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, **kwargs):
+        with self.lock:
+            self.urls.append(url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return url
+
+
+def test_async_api_client_session_fans_out(monkeypatch):
+    slow_request = SlowRequest(0.2)
+    monkeypatch.setattr(requests.Session, 'request', slow_request)
+    client = helpers.ApiClientSession(helpers.Url.from_string('http://leader.mesos/service'))
+    api = helpers.AsyncApiClientSession(client, pool_size=20)
+
+    async def fan_out():
+        async with api:
+            return await asyncio.gather(*[api.get('/{}'.format(i)) for i in range(40)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.time()
+        results = loop.run_until_complete(fan_out())
+        elapsed = time.time() - start
+    finally:
+        loop.close()
+
+    assert results == ['http://leader.mesos/service/{}'.format(i) for i in range(40)]
+    assert slow_request.max_in_flight == 20
+    # two waves of 20 requests rather than 40 serial round trips
+    assert elapsed < 40 * 0.2 / 2
+
+
+def test_async_api_client_session_keeps_mixins(monkeypatch):
+    slow_request = SlowRequest(0)
+    monkeypatch.setattr(requests.Session, 'request', slow_request)
+    cluster = dcos_api.DcosApiSession('http://leader.mesos', ['10.0.0.1'], ['10.0.0.2'], [], None)
+    adapter = cluster.session.get_adapter('http://leader.mesos')
+    api = helpers.AsyncApiClientSession(cluster, pool_size=30)
+    assert api.default_url is cluster.default_url
+    assert api.client.session.get_adapter('http://leader.mesos')._pool_maxsize == 30
+    # the pools of the wrapped session are left alone
+    assert cluster.session.get_adapter('http://leader.mesos') is adapter
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(api.get('/state', node='10.0.0.2'))
+    finally:
+        loop.close()
+        api.close()
+    assert slow_request.urls == ['http://10.0.0.2:61001/state']
+
+
+def test_async_api_client_session_releases_workers_when_collected(monkeypatch):
+    monkeypatch.setattr(requests.Session, 'request', SlowRequest(0))
+    api = helpers.AsyncApiClientSession(helpers.ApiClientSession(helpers.Url.from_string('http://leader.mesos')))
+    executor = api._executor
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(api.get('/'))
+    finally:
+        loop.close()
+    del api
+    gc.collect()
+    assert executor._shutdown
+
+
+def test_derive_session():
+    session = requests.Session()
+    session.headers['X-Test'] = 'parent'
+    session.auth = ('user', 'password')
+    session.verify = '/path/to/ca.crt'
+    session.cookies.set('dcos-acs-auth-cookie', 'foo')
+
+    derived = helpers.derive_session(session)
+
+    # connection pools, auth and TLS settings are shared
+    assert derived.get_adapter('https://leader.mesos') is session.get_adapter('https://leader.mesos')
+    assert derived.auth == session.auth
+    assert derived.verify == session.verify
+    # headers and cookies are isolated
+    assert len(derived.cookies) == 0
+    assert derived.headers['X-Test'] == 'parent'
+    derived.headers['X-Test'] = 'child'
+    assert session.headers['X-Test'] == 'parent'
+    derived.mount('http://', requests.adapters.HTTPAdapter())
+    assert derived.get_adapter('http://leader.mesos') is not session.get_adapter('http://leader.mesos')
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_http_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), KeepAliveHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_pool_stats(local_http_server):
+    config = helpers.ConnectionPoolConfig(pool_maxsize=4, pool_block=True, tcp_keepalive=True)
+    api = helpers.ApiClientSession(helpers.Url.from_string(local_http_server), pool_config=config)
+    adapter = api.session.get_adapter(local_http_server)
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block is True
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in adapter.poolmanager.connection_pool_kw['socket_options']
+
+    for _ in range(5):
+        api.get('/').raise_for_status()
+    assert api.connection_pool_stats() == {'requests': 5, 'pool_hits': 4, 'pool_misses': 1, 'pools': 1}
+
+    # counters survive pools being closed
+    api.session.close()
+    assert api.connection_pool_stats() == {'requests': 5, 'pool_hits': 4, 'pool_misses': 1, 'pools': 0}
+
+
+def test_connection_pool_config_without_keep_alive():
+    config = helpers.ConnectionPoolConfig(keep_alive=False)
+    api = helpers.ApiClientSession(helpers.Url.from_string('http://leader.mesos'), pool_config=config)
+    assert api.session.headers['Connection'] == 'close'
+    # the adapter can be copied like any other requests adapter
+    adapter = copy.deepcopy(api.session.get_adapter('http://leader.mesos'))
+    assert adapter.pool_config.keep_alive is False
+
+
+def test_connection_pool_config_from_env(monkeypatch):
+    assert helpers.ConnectionPoolConfig.from_env() is None
+    monkeypatch.setenv('DCOS_HTTP_POOL_MAXSIZE', '100')
+    monkeypatch.setenv('DCOS_HTTP_POOL_BLOCK', 'true')
+    config = helpers.ConnectionPoolConfig.from_env()
+    assert config.pool_maxsize == 100
+    assert config.pool_connections == helpers.DEFAULT_POOL_SIZE
+    assert config.pool_block is True
+    assert config.keep_alive is True
+    args = dcos_api.DcosApiSession.get_args_from_env()
+    cluster = dcos_api.DcosApiSession(**args)
+    assert cluster.session.get_adapter('http://leader.mesos')._pool_maxsize == 100
+
+
+class FlakyRequest:
+    """ Stand-in for a request function which fails with the given outcomes
+    (exceptions or status codes) before returning a 200 response
+    """
+    def __init__(self, *outcomes, retry_after=None):
+        self.outcomes = list(outcomes)
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        if self.retry_after is not None:
+            response.headers['Retry-After'] = self.retry_after
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waits = []
+    monkeypatch.setattr(helpers.time, 'sleep', waits.append)
+    return waits
+
+
+def test_retry_policy_exponential_backoff(sleeps):
+    policy = helpers.RetryPolicy(initial_wait=1, max_wait=5, jitter=False)
+    request = FlakyRequest(*[requests.exceptions.ConnectionError()] * 4)
+    assert policy.call(request, 'GET /', 60).status_code == 200
+    assert sleeps == [1, 2, 4, 5]
+    assert policy.retry_counts == {'GET /': 4}
+
+
+def test_retry_policy_jitter_stays_below_backoff():
+    policy = helpers.RetryPolicy(initial_wait=1, max_wait=8)
+    for attempt in range(6):
+        assert 0 <= policy.backoff(attempt) <= min(8, 2 ** attempt)
+
+
+def test_retry_policy_reraises_after_timeout(sleeps):
+    policy = helpers.RetryPolicy(initial_wait=10, jitter=False)
+    request = FlakyRequest(requests.exceptions.Timeout())
+    with pytest.raises(requests.exceptions.Timeout):
+        policy.call(request, 'GET /', 5)
+    assert request.calls == 1
+    assert sleeps == []
+
+
+def test_retry_policy_does_not_retry_other_errors(sleeps):
+    request = FlakyRequest(ValueError())
+    with pytest.raises(ValueError):
+        helpers.RetryPolicy().call(request, 'GET /', 60)
+    assert request.calls == 1
+
+
+def test_retry_policy_retry_statuses_honor_retry_after(sleeps):
+    policy = helpers.RetryPolicy(initial_wait=0.5, jitter=False, retry_statuses=(503,))
+    request = FlakyRequest(503, 503, retry_after='3')
+    assert policy.call(request, 'GET /', 60).status_code == 200
+    assert sleeps == [3, 3]
+    # statuses which are not configured are returned as they are
+    assert policy.call(FlakyRequest(500), 'GET /', 60).status_code == 500
+
+
+def test_retry_policy_budget(sleeps):
+    policy = helpers.RetryPolicy(initial_wait=0, jitter=False, retry_statuses=(503,), retry_budget=3)
+    assert policy.call(FlakyRequest(503, 503), 'GET /a', 60).status_code == 200
+    assert policy.retries_remaining == 1
+    assert policy.call(FlakyRequest(503, 503), 'GET /b', 60).status_code == 503
+    assert policy.retries_remaining == 0
+    assert policy.retry_counts == {'GET /a': 2, 'GET /b': 1}
+
+
+def test_parse_retry_after():
+    assert helpers._parse_retry_after(None) is None
+    assert helpers._parse_retry_after('120') == 120
+    assert helpers._parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert helpers._parse_retry_after('soon') is None
+
+
+def test_retry_policy_is_shared_with_derived_clients():
+    policy = helpers.RetryPolicy(retry_budget=10)
+    api = dcos_api.DcosApiSession(
+        'http://leader.mesos', ['10.0.0.1'], [], [], dcos_api.DcosUser({}), retry_policy=policy)
+    assert api.marathon.retry_policy is policy
+    assert api.jobs.retry_policy is policy
+
+
+def test_retry_policy_can_be_copied_and_pickled(sleeps):
+    policy = helpers.RetryPolicy(initial_wait=0, jitter=False, retry_statuses=(503,), retry_budget=3)
+    policy.call(FlakyRequest(503), 'GET /a', 60)
+    for clone in (copy.deepcopy(policy), pickle.loads(pickle.dumps(policy))):
+        assert clone.retry_counts == {'GET /a': 1}
+        clone.call(FlakyRequest(503), 'GET /b', 60)
+        assert clone.retries_remaining == 1
+    assert policy.retries_remaining == 2
+    api = dcos_api.DcosApiSession(
+        'http://leader.mesos', ['10.0.0.1'], [], [], dcos_api.DcosUser({}), retry_policy=policy)
+    assert copy.deepcopy(api).retry_policy.retry_counts == {'GET /a': 1}
+
+
+@pytest.fixture
+def poll_sleeps(monkeypatch):
+    waits = []
+    monkeypatch.setattr(helpers.Poller, '_sleep', lambda self, seconds: waits.append(seconds))
+    return waits
+
+
+def test_poller_backs_off_to_max_interval(poll_sleeps):
+    results = iter([False] * 6 + [True])
+    poller = helpers.Poller('test.backoff', initial_interval=0.2, max_interval=1, multiplier=2,
+                            retry_on_result=lambda r: r is False)
+    assert poller.poll(lambda: next(results)) is True
+    assert poll_sleeps == [0.2, 0.4, 0.8, 1, 1, 1]
+
+
+def test_poller_timeout(poll_sleeps, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(helpers.time, 'monotonic', lambda: next(clock))
+    poller = helpers.Poller('test.timeout', timeout=3, initial_interval=2, max_interval=2,
+                            retry_on_result=lambda r: r is False)
+    with pytest.raises(helpers.PollTimeout) as e:
+        poller.poll(lambda: False)
+    # the last sleep is cut short by the deadline
+    assert poll_sleeps == [2, 1]
+    assert isinstance(e.value, retrying.RetryError)
+    assert str(e.value) == 'test.timeout was not satisfied after 3 attempts in 3.0 seconds'
+
+
+def test_poller_reraises_last_exception(poll_sleeps):
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise ValueError(len(calls))
+
+    with pytest.raises(ValueError, match='3'):
+        helpers.Poller('test.exception', max_attempts=3).poll(fail)
+    with pytest.raises(ValueError, match='4'):
+        helpers.Poller('test.exception', retry_on_exception=lambda e: False).poll(fail)
+
+
+def test_poller_cancel():
+    poller = helpers.Poller('test.cancel', initial_interval=10, retry_on_result=lambda r: r is False)
+    threading.Timer(0.1, poller.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(helpers.PollCancelled):
+        poller.poll(lambda: False)
+    assert time.monotonic() - start < 5
+
+
+def test_poll_decorator_records_telemetry(poll_sleeps):
+    helpers.poll_telemetry.reset()
+    results = iter([[], [], ['bundle']])
+
+    @helpers.poll('test.telemetry', retry_on_result=lambda r: r == [])
+    def wait():
+        return next(results)
+
+    assert wait() == ['bundle']
+    stats = helpers.poll_telemetry.snapshot()['test.telemetry']
+    assert (stats.waits, stats.attempts, stats.timeouts) == (1, 3, 0)
+
+
+def test_collection_poller_coalesces_waiters():
+    ticks = []
+    fetched = threading.Event()
+
+    def fetch():
+        ticks.append(len(ticks))
+        fetched.set()
+        return len(ticks)
+
+    poller = helpers.CollectionPoller('test.collection', fetch, interval=0.05)
+    results = {}
+
+    def wait(i):
+        results[i] = poller.wait(lambda tick: tick >= i % 5 + 2 and (i, tick), timeout=10)
+
+    threads = [threading.Thread(target=wait, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == list(range(20))
+    assert all(tick >= i % 5 + 2 for i, tick in results.values())
+    # one fetch per tick served all 20 waiters
+    assert poller.fetch_count < 20
+    assert poller._thread is None
+
+
+def test_collection_poller_errors_and_timeout():
+    poller = helpers.CollectionPoller('test.collection_errors', lambda: {}, interval=0.01)
+    with pytest.raises(KeyError):
+        poller.wait(lambda collection: collection['missing'])
+    with pytest.raises(helpers.PollTimeout):
+        poller.wait(lambda collection: False, timeout=0.1)
+
+    def fail():
+        raise ValueError('bad response')
+
+    with pytest.raises(ValueError):
+        helpers.CollectionPoller('test.collection_errors', fail).wait(lambda collection: True, timeout=5)
@@ -1,9 +1,13 @@
+import threading
+
 import pytest
 import requests
+import responses
 from requests import HTTPError
 
+from dcos_test_utils import helpers
 from dcos_test_utils.helpers import Url
-from dcos_test_utils.jobs import Jobs
+from dcos_test_utils.jobs import JobHistory, Jobs
 
 
 class MockResponse:
@@ -179,7 +183,6 @@ def test_jobs_run(mock_url, replay_session):
         MockResponse({}, 200),
         MockResponse({}, 404),  # break the wait loop (run over)
         MockResponse(job_payload, 200),
-        MockResponse(job_payload, 200),
     ))
     replay_session.queue(mock_replay)
 
@@ -189,7 +192,8 @@ def test_jobs_run(mock_url, replay_session):
     assert success is True
     assert run == run_payload
     assert job == job_payload
-    assert len(replay_session.debug_cache) == 5
+    # the history fetched to confirm the run finished is not fetched again
+    assert len(replay_session.debug_cache) == 4
 
 
 def test_jobs_run_failed_run(mock_url, replay_session):
@@ -207,7 +211,6 @@ def test_jobs_run_failed_run(mock_url, replay_session):
         MockResponse(run_payload, 201),
         MockResponse({}, 404),
         MockResponse(job_payload, 200),
-        MockResponse(job_payload, 200),
     ))
     replay_session.queue(mock_replay)
 
@@ -217,35 +220,45 @@ def test_jobs_run_failed_run(mock_url, replay_session):
     assert success is False
     assert run == run_payload
     assert job == job_payload
-    assert len(replay_session.debug_cache) == 4
+    assert len(replay_session.debug_cache) == 3
+
+
+@pytest.fixture
+def poll_clock(monkeypatch):
+    """Makes polls sleep on a fake clock, so that their schedule does not
+    depend on how fast the test runs.
+    """
+    clock = [0.0]
+
+    def sleep(self, seconds):
+        clock[0] += seconds
 
+    monkeypatch.setattr(helpers.Poller, '_sleep', sleep)
+    monkeypatch.setattr(helpers.time, 'monotonic', lambda: clock[0])
+    return clock
 
-def test_jobs_run_timeout(mock_url, replay_session):
+
+def test_jobs_run_timeout(mock_url, replay_session, poll_clock):
     run_payload = {'id': 'myrun1'}
     job_payload = {'id':      'myjob',
                    'history': {'successfulFinishedRuns': [run_payload],
                                'failedFinishedRuns':     []}}
     # lots of responses, but only a few will trigger before timeout
-    mock_replay = list((
-        MockResponse(run_payload, 201),
-        MockResponse({}, 200),
-        MockResponse({}, 200),
-        MockResponse({}, 200),  # should timeout here
-        MockResponse({}, 200),
-        MockResponse({}, 200),
-        MockResponse({}, 404),
-        MockResponse(job_payload, 200),
-    ))
+    mock_replay = [MockResponse(run_payload, 201)]
+    mock_replay += [MockResponse({}, 200) for _ in range(20)]
+    mock_replay += [MockResponse({}, 404), MockResponse(job_payload, 200)]
     replay_session.queue(mock_replay)
 
     j = Jobs(default_url=mock_url)
     with pytest.raises(Exception):
         j.run('myapp1', timeout=2)
 
-    assert len(replay_session.debug_cache) == 4
+    # polls back off from 0.2 to 1 second: at 0, 0.2, 0.5, 0.95, 1.625 and the 2 second deadline
+    assert len(replay_session.debug_cache) == 7
+    assert poll_clock[0] == pytest.approx(2)
 
 
-def test_jobs_run_history_not_available(mock_url, replay_session):
+def test_jobs_run_history_not_available(mock_url, replay_session, poll_clock):
     run_payload = {'id': 'myrun1'}
     job_payload = {'id':      'myjob',
                    'history': {'successfulFinishedRuns': [],
@@ -253,17 +266,9 @@ def test_jobs_run_history_not_available(mock_url, replay_session):
     exp_err_msg = 'Job run failed - operation was not completed in 2 seconds.'
 
     # lots of responses, but only a few will trigger before timeout
-    mock_replay = list((
-        MockResponse(run_payload, 201),
-        MockResponse({}, 404),
-        MockResponse(job_payload, 200),
-        MockResponse({}, 404),
-        MockResponse(job_payload, 200),
-        MockResponse({}, 404),
-        MockResponse(job_payload, 200),
-        MockResponse({}, 404),
-        MockResponse(job_payload, 200)
-    ))
+    mock_replay = [MockResponse(run_payload, 201)]
+    for _ in range(10):
+        mock_replay += [MockResponse({}, 404), MockResponse(job_payload, 200)]
     replay_session.queue(mock_replay)
 
     j = Jobs(default_url=mock_url)
@@ -313,3 +318,83 @@ def test_jobs_run_stop(mock_url, replay_session):
     j.run_stop('myjob', 'myrun1')
     assert replay_session.debug_cache[0] == (
         (exp_method, exp_url), {})
+
+
+def test_jobs_wait_for_run_coalesced(mock_url, replay_session):
+    active = {'id': 'myjob', 'activeRuns': [{'id': 'run1'}, {'id': 'run2'}],
+              'history': {'successfulFinishedRuns': [], 'failedFinishedRuns': []}}
+    finished = {'id': 'myjob', 'activeRuns': [],
+                'history': {'successfulFinishedRuns': [{'id': 'run1'}], 'failedFinishedRuns': [{'id': 'run2'}]}}
+    replay_session.queue([MockResponse([active], 200), MockResponse([finished], 200), MockResponse([finished], 200)])
+
+    j = Jobs(default_url=mock_url)
+    j.jobs_poller.interval = 0.01
+    threads = [threading.Thread(target=j.wait_for_run, args=('myjob', run_id), kwargs={'coalesce': True})
+               for run_id in ('run1', 'run2')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # both waiters were served by the same fetches
+    assert j.jobs_poller.fetch_count <= 3
+    assert replay_session.debug_cache[0][1] == {'params': (('embed', 'activeRuns'), ('embed', 'history'))}
+
+
+@responses.activate
+def test_jobs_run_many():
+    base = 'https://localhost:443/service/metronome/v1/jobs'
+    for job_id in ('job-a', 'job-b', 'job-c'):
+        responses.add(responses.POST, '{}/{}/runs'.format(base, job_id), json={'id': job_id + '-run'})
+
+    def history(successful, failed):
+        return {'successfulFinishedRuns': [{'id': i} for i in successful],
+                'failedFinishedRuns': [{'id': i} for i in failed]}
+
+    sweeps = [
+        [{'id': 'job-a', 'activeRuns': [{'id': 'job-a-run'}], 'history': history([], [])},
+         {'id': 'job-b', 'activeRuns': [], 'history': history([], ['job-b-run'])}],
+        [{'id': 'job-a', 'activeRuns': [], 'history': history(['job-a-run'], [])},
+         {'id': 'job-b', 'activeRuns': [], 'history': history([], ['job-b-run'])},
+         {'id': 'job-c', 'activeRuns': [], 'history': history(['job-c-run'], [])}],
+    ]
+    for sweep in sweeps:
+        responses.add(responses.GET, base + '?embed=activeRuns&embed=history', json=sweep)
+
+    j = Jobs(default_url=Url.from_string('https://localhost:443/service/metronome'))
+    j.jobs_poller.interval = 0.01
+    results = j.run_many(['job-a', 'job-b', 'job-c'], max_in_flight=2)
+
+    assert [(success, run['id'], job['id']) for success, run, job in results] == [
+        (True, 'job-a-run', 'job-a'), (False, 'job-b-run', 'job-b'), (True, 'job-c-run', 'job-c')]
+    # job-c was started once an earlier run finished, and no run was polled on its own
+    urls = [c.request.url for c in responses.calls]
+    assert urls.index('{}/job-c/runs'.format(base)) > urls.index(base + '?embed=activeRuns&embed=history')
+    assert len([u for u in urls if u.startswith(base + '?')]) == len(urls) - 3
+    assert j.jobs_poller.fetch_count <= 4
+
+
+def test_job_history_index():
+    history = JobHistory()
+    assert history.outcome('run1') is None
+    job = {'id': 'myjob', 'history': {'successfulFinishedRuns': [{'id': 'run1'}],
+                                      'failedFinishedRuns': [{'id': 'run2'}]}}
+    history.update(job)
+    assert history.outcome('run1') == (True, {'id': 'run1'})
+    assert history.outcome('run2') == (False, {'id': 'run2'})
+    # runs indexed earlier are kept when they age out of the embedded history
+    history.update({'id': 'myjob', 'history': {'successfulFinishedRuns': [{'id': 'run3'}]}})
+    assert history.outcome('run1') == (True, {'id': 'run1'})
+    assert history.outcome('run3') == (True, {'id': 'run3'})
+
+
+def test_jobs_history_fetches_only_unknown_runs(mock_url, replay_session):
+    job_payload = {'id': 'myjob', 'history': {'successfulFinishedRuns': [{'id': 'run1'}],
+                                              'failedFinishedRuns': []}}
+    replay_session.queue([MockResponse(job_payload, 200), MockResponse(job_payload, 200)])
+
+    j = Jobs(default_url=mock_url)
+    assert j._is_history_available('myjob', 'run1') is True
+    assert j._is_history_available('myjob', 'run1') is True
+    assert len(replay_session.debug_cache) == 1
+    assert j._is_history_available('myjob', 'run2') is False
+    assert len(replay_session.debug_cache) == 2
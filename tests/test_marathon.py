@@ -0,0 +1,312 @@
+"""Tests for dcos_test_utils.marathon."""
+import http.server
+import json
+import queue
+import socketserver
+import threading
+import time
+
+import pytest
+import responses
+
+from dcos_test_utils import marathon
+from dcos_test_utils.helpers import Url
+
+
+class StubMarathon:
+    """ State of a stub Marathon which runs the tasks of a posted app after a delay
+    and announces it on its event bus
+
+    :param events: 'sse' to serve the event bus, 'missing' to answer it with a 404 or
+        'drop' to close the event stream instead of sending the deployment events
+    :param outcome: deployment event sent once the app is deployed, or None for none
+    :param progress_event: event announcing the app's tasks once they are up
+    """
+    def __init__(self, events='sse', delay=0.3, outcome='deployment_success', progress_event='status_update_event'):
+        self.events = events
+        self.delay = delay
+        self.outcome = outcome
+        self.progress_event = progress_event
+        self.apps = {}
+        self.pods = {}
+        self.deploying = 0
+        self.max_deploying = 0
+        self.requests = []
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        for subscriber in self.subscribers:
+            subscriber.put('event: {}\ndata: {}\n\n'.format(event_type, json.dumps(data)))
+
+    def deploy_pod(self, pod_id):
+        time.sleep(self.delay)
+        with self.lock:
+            self.pods[pod_id]['status'] = 'STABLE'
+            self.deploying -= 1
+
+    def deploy(self, app_id):
+        time.sleep(self.delay)
+        with self.lock:
+            self.deploying -= 1
+        if self.outcome == 'deployment_failed':
+            self.publish(self.outcome, {'id': 'deployment-' + app_id.strip('/')})
+            return
+        with self.lock:
+            self.apps[app_id]['tasksRunning'] = self.apps[app_id]['instances']
+            self.apps[app_id]['tasksHealthy'] = self.apps[app_id]['instances']
+            self.apps[app_id]['tasks'] = [
+                {'host': '10.0.0.{}'.format(i), 'ports': [10000 + i], 'ipAddresses': [{'ipAddress': '9.0.0.1'}]}
+                for i in range(self.apps[app_id]['instances'])]
+        if self.events == 'drop':
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+            return
+        if self.progress_event == 'instance_health_changed_event':
+            self.publish(self.progress_event, {'runSpecId': app_id, 'healthy': True})
+        else:
+            self.publish(self.progress_event, {'appId': app_id, 'taskStatus': 'TASK_RUNNING'})
+        if self.outcome is not None:
+            self.publish(self.outcome, {'id': 'deployment-' + app_id.strip('/')})
+
+
+class StubMarathonHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.stub.requests.append(('POST', self.path))
+        app = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        with self.stub.lock:
+            self.stub.deploying += 1
+            self.stub.max_deploying = max(self.stub.max_deploying, self.stub.deploying)
+            if self.path == '/v2/pods':
+                self.stub.pods[app['id']] = {'id': app['id'], 'status': 'DEPLOYING'}
+            else:
+                self.stub.apps[app['id']] = dict(app, tasksRunning=0, tasksHealthy=0, tasks=[])
+        deploy = self.stub.deploy_pod if self.path == '/v2/pods' else self.stub.deploy
+        threading.Thread(target=deploy, args=(app['id'],), daemon=True).start()
+        self.send_json(dict(app, deployments=[{'id': 'deployment-' + app['id'].strip('/')}]), status=201)
+
+    def do_GET(self):
+        self.stub.requests.append(('GET', self.path))
+        if self.path.startswith('/v2/events'):
+            return self.stream_events()
+        path = self.path.split('?')[0]
+        with self.stub.lock:
+            if path == '/v2/apps':
+                return self.send_json({'apps': [dict(app) for app in self.stub.apps.values()]})
+            if path == '/v2/pods/::status':
+                return self.send_json([dict(pod) for pod in self.stub.pods.values()])
+        app_id = path[len('/v2/apps'):]
+        with self.stub.lock:
+            self.send_json({'app': dict(self.stub.apps[app_id])})
+
+    def stream_events(self):
+        if self.stub.events == 'missing':
+            return self.send_json({'message': 'not found'}, status=404)
+        subscriber = queue.Queue()
+        subscriber.put(': subscribed\n\n')
+        self.stub.subscribers.append(subscriber)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        while True:
+            try:
+                message = subscriber.get(timeout=5)
+            except queue.Empty:
+                message = None
+            if message is None:
+                self.wfile.write(b'0\r\n\r\n')
+                self.close_connection = True
+                return
+            data = message.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_marathon(request):
+    stub = StubMarathon(**getattr(request, 'param', {}))
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StubMarathonHandler)
+    server.daemon_threads = True
+    server.stub = stub
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield stub, marathon.Marathon(Url.from_string('http://127.0.0.1:{}'.format(server.server_address[1])))
+    for subscriber in stub.subscribers:
+        subscriber.put(None)
+    server.shutdown()
+    server.server_close()
+
+
+APP = {'id': '/test-app', 'instances': 2}
+
+
+def _app_checks(stub):
+    return [r for r in stub.requests if r[0] == 'GET' and r[1].startswith('/v2/apps/test-app')]
+
+
+def test_iter_sse_events():
+    stream = (b': keep-alive\n\nevent: deployment_success\r\ndata: {"id":', b' "1"}\n\n',
+              b'data: {"a": 1}\ndata: \n\nevent: status_update_event\ndata: {}\n\n')
+    assert list(marathon.iter_sse_events(iter(stream))) == [
+        marathon.Event('deployment_success', {'id': '1'}),
+        marathon.Event('message', {'a': 1}),
+        marathon.Event('status_update_event', {})]
+
+
+def test_deploy_app_with_event_stream(stub_marathon):
+    stub, client = stub_marathon
+    start = time.monotonic()
+    client.deploy_app(APP, use_event_stream=True)
+    # resolved by the events rather than the 5 second poll interval
+    assert time.monotonic() - start < 3
+    assert stub.requests[0][0] == 'GET' and stub.requests[0][1].startswith('/v2/events?event_type=')
+    assert 2 <= len(_app_checks(stub)) <= 3
+
+
+@pytest.mark.parametrize('stub_marathon', [{'outcome': None, 'progress_event': 'instance_health_changed_event'}],
+                         indirect=True)
+def test_deploy_app_with_event_stream_instance_events(stub_marathon):
+    stub, client = stub_marathon
+    start = time.monotonic()
+    client.deploy_app(APP, use_event_stream=True)
+    # instance events name the app runSpecId; without matching it the wait lasts until the 30 second re-check
+    assert time.monotonic() - start < 3
+    assert 2 <= len(_app_checks(stub)) <= 3
+
+
+def test_deploy_app_without_event_stream_does_not_subscribe(stub_marathon):
+    stub, client = stub_marathon
+    client.deploy_app(APP)
+    assert not [r for r in stub.requests if r[1].startswith('/v2/events')]
+
+
+@pytest.mark.parametrize('stub_marathon', [{'outcome': 'deployment_failed'}], indirect=True)
+def test_deploy_app_with_event_stream_failed_deployment(stub_marathon):
+    _, client = stub_marathon
+    with pytest.raises(AssertionError, match='deployment-test-app failed'):
+        client.deploy_app(APP, use_event_stream=True)
+
+
+@pytest.mark.parametrize('stub_marathon', [{'events': 'drop'}, {'events': 'missing', 'delay': 0}], indirect=True)
+def test_deploy_app_falls_back_to_polling(stub_marathon):
+    stub, client = stub_marathon
+    start = time.monotonic()
+    client.deploy_app(APP, use_event_stream=True)
+    assert time.monotonic() - start < 3
+    assert _app_checks(stub)
+
+
+@pytest.mark.parametrize('stub_marathon', [{'delay': 0.2}], indirect=True)
+def test_deploy_apps(stub_marathon):
+    stub, client = stub_marathon
+    apps = [{'id': '/app-{}'.format(i), 'instances': i % 3 + 1} for i in range(7)]
+    pod = {'id': '/pod-1', 'containers': [{'name': 'sleep'}]}
+    client.apps_poller.interval = client.pods_poller.interval = 0.05
+    results = client.deploy_apps(apps + [pod], max_in_flight=3)
+
+    assert list(results) == [d['id'] for d in apps + [pod]]
+    for app in apps:
+        assert len(results[app['id']].endpoints) == app['instances']
+        assert results[app['id']].seconds >= 0.2
+    assert results['/pod-1'].endpoints == []
+    assert results['/pod-1'].data['status'] == 'STABLE'
+    assert stub.max_deploying <= 3
+    # all states come from the shared polls rather than one request per app
+    assert not [r for r in stub.requests if r[0] == 'GET' and r[1].startswith('/v2/apps/')]
+
+
+def test_deploy_apps_timeout(stub_marathon):
+    _, client = stub_marathon
+    with pytest.raises(Exception, match='/slow-app was not completed'):
+        client.deploy_apps([{'id': '/slow-app', 'instances': 1}], timeout=0.1)
+
+
+def test_deploy_apps_rejects_duplicate_ids(stub_marathon):
+    stub, client = stub_marathon
+    with pytest.raises(ValueError, match='app-1'):
+        client.deploy_apps([{'id': '/app-1'}, {'id': '/app-2'}, {'id': 'app-1'}])
+    assert not stub.requests
+
+
+@responses.activate
+def test_purge():
+    base = 'http://marathon'
+    responses.add(responses.GET, base + '/v2/apps', json={'apps': [{'id': '/a'}, {'id': '/g/b'}]})
+    responses.add(responses.GET, base + '/v2/pods', json=[{'id': '/p'}])
+    responses.add(responses.DELETE, base + '/v2/apps/a', json={'deploymentId': 'd-a'})
+    responses.add(responses.DELETE, base + '/v2/apps/g/b', status=404, json={'message': 'gone'})
+    responses.add(responses.DELETE, base + '/v2/pods/p', headers={'Marathon-Deployment-Id': 'd-p'})
+    responses.add(responses.DELETE, base + '/v2/groups/', json={'deploymentId': 'd-g'})
+    # unrelated deployments are not waited for
+    for deployments in (['d-a', 'd-p', 'd-g', 'other'], ['d-p', 'other'], ['other']):
+        responses.add(responses.GET, base + '/v2/deployments', json=[{'id': i} for i in deployments])
+
+    client = marathon.Marathon(Url.from_string(base))
+    client.deployment_tracker.poller.interval = 0.01
+    timings = client.purge()
+    assert list(timings) == ['list', 'delete', 'wait']
+    assert len([c for c in responses.calls if c.request.url == base + '/v2/deployments']) == 3
+    assert len([c for c in responses.calls if c.request.method == 'DELETE']) == 4
+
+
+@responses.activate
+def test_purge_single_request():
+    responses.add(responses.DELETE, 'http://marathon/v2/groups/', json={'deploymentId': 'd-g'})
+    responses.add(responses.GET, 'http://marathon/v2/deployments', json=[])
+    marathon.Marathon(Url.from_string('http://marathon')).purge(single_request=True)
+    assert [c.request.method for c in responses.calls] == ['DELETE', 'GET']
+
+
+def test_deploy_app_coalesced(stub_marathon):
+    stub, client = stub_marathon
+    client.apps_poller.interval = 0.05
+    apps = [{'id': '/app-{}'.format(i), 'instances': 1} for i in range(8)]
+    threads = [threading.Thread(target=client.deploy_app, args=(app,), kwargs={'coalesce': True}) for app in apps]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(stub.apps[app['id']]['tasksRunning'] == 1 for app in apps)
+    assert not [r for r in stub.requests if r[0] == 'GET' and r[1].startswith('/v2/apps/')]
+    assert client.apps_poller.fetch_count < len(apps) * 4
+
+
+@responses.activate
+def test_destroy_apps_share_deployment_polls():
+    base = 'http://marathon'
+    for i in range(5):
+        responses.add(responses.DELETE, base + '/v2/apps/app-{}'.format(i), json={'deploymentId': 'd-{}'.format(i)})
+    responses.add(responses.DELETE, base + '/v2/pods/pod', headers={'Marathon-Deployment-Id': 'd-pod'})
+    in_flight = [['d-{}'.format(i) for i in range(5)] + ['d-pod', 'other'], ['d-3', 'other'], ['other']]
+    for deployments in in_flight:
+        responses.add(responses.GET, base + '/v2/deployments', json=[{'id': i} for i in deployments])
+
+    client = marathon.Marathon(Url.from_string(base))
+    client.deployment_tracker.poller.interval = 0.2
+    threads = [threading.Thread(target=client.destroy_app, args=('app-{}'.format(i),)) for i in range(5)]
+    threads.append(threading.Thread(target=client.destroy_pod, args=('/pod',)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # all six destroyers were served by the same deployment list fetches
+    assert client.deployment_tracker.poller.fetch_count <= 4
+    assert len([c for c in responses.calls if c.request.url == base + '/v2/deployments']) <= 4
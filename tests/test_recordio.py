@@ -0,0 +1,124 @@
+import io
+import json
+
+import pytest
+import requests
+import responses
+
+from dcos_test_utils import recordio
+
+
+def _encode(messages):
+    encoder = recordio.Encoder(lambda m: json.dumps(m).encode('UTF-8'))
+    return b''.join(encoder.encode(m) for m in messages)
+
+
+MESSAGES = [{'type': 'SUBSCRIBED'}, {}, {'type': 'HEARTBEAT', 'data': 'x' * 5000}, {'type': 'TASK_ADDED'}]
+
+
+def test_decode_whole_feed():
+    decoder = recordio.Decoder(lambda d: json.loads(d.decode('UTF-8')))
+    assert decoder.decode(_encode(MESSAGES)) == MESSAGES
+    assert decoder.state == recordio.Decoder.HEADER
+    assert len(decoder.buffer) == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 4096])
+def test_decode_chunked_feed(chunk_size):
+    data = _encode(MESSAGES)
+    decoder = recordio.Decoder(lambda d: json.loads(d.decode('UTF-8')))
+    records = []
+    for i in range(0, len(data), chunk_size):
+        records += decoder.decode(data[i:i + chunk_size])
+    assert records == MESSAGES
+    assert len(decoder.buffer) == 0
+
+
+def test_decode_zero_length_records():
+    decoder = recordio.Decoder(lambda d: d)
+    assert decoder.decode(b'0\n0\n') == [b'', b'']
+    assert decoder.decode(b'0') == []
+    assert decoder.decode(b'\n5\nhel') == [b'']
+    assert decoder.decode(b'lo') == [b'hello']
+
+
+def test_decode_partial_record_is_buffered():
+    decoder = recordio.Decoder(lambda d: d)
+    assert decoder.decode(b'6\nworl') == []
+    assert decoder.state == recordio.Decoder.RECORD
+    assert decoder.decode(b'd!5\nhello') == [b'world!', b'hello']
+    assert decoder.state == recordio.Decoder.HEADER
+
+
+@pytest.mark.parametrize('data', [b'abc\nhello', b'-1\n'])
+def test_decode_bad_header_fails(data):
+    decoder = recordio.Decoder(lambda d: d)
+    with pytest.raises(Exception, match='Failed to decode length'):
+        decoder.decode(data)
+    assert decoder.state == recordio.Decoder.FAILED
+    with pytest.raises(Exception, match='FAILED state'):
+        decoder.decode(b'5\nhello')
+
+
+def test_decode_requires_bytes():
+    decoder = recordio.Decoder(lambda d: d)
+    with pytest.raises(Exception):
+        decoder.decode('5\nhello')
+
+
+def _json_deserialize(data):
+    return json.loads(data.decode('UTF-8'))
+
+
+def test_iter_records_from_file_object():
+    source = io.BytesIO(_encode(MESSAGES))
+    assert list(recordio.iter_records(source, _json_deserialize, chunk_size=3)) == MESSAGES
+
+
+def test_iter_records_from_chunk_iterable_is_lazy():
+    data = _encode(MESSAGES)
+    first = len(_encode(MESSAGES[:1]))
+    chunks = iter([data[:first], data[first:]])
+    records = recordio.iter_records(chunks, _json_deserialize)
+    assert next(records) == MESSAGES[0]
+    # only the first chunk has been consumed so far
+    assert next(chunks) == data[first:]
+
+
+@responses.activate
+def test_iter_records_from_response():
+    responses.add(responses.POST, 'http://leader.mesos/mesos/api/v1', body=_encode(MESSAGES))
+    r = requests.post('http://leader.mesos/mesos/api/v1', stream=True)
+    assert list(recordio.iter_records(r, _json_deserialize)) == MESSAGES
+
+
+def test_iter_records_truncated_stream():
+    data = _encode(MESSAGES)
+    with pytest.raises(Exception, match='middle of a'):
+        list(recordio.iter_records(io.BytesIO(data[:-1]), _json_deserialize))
+
+
+def test_encode():
+    encoder = recordio.Encoder(lambda m: m)
+    assert encoder.encode(b'hello') == b'5\nhello'
+    assert encoder.encode(b'') == b'0\n'
+    with pytest.raises(Exception):
+        encoder.encode('hello')
+
+
+def test_encode_many():
+    encoder = recordio.Encoder(lambda m: m)
+    buffers = encoder.encode_many([b'hello', b'', b'world!'])
+    assert buffers == [b'5\n', b'hello', b'0\n', b'', b'6\n', b'world!']
+    assert b''.join(buffers) == b''.join(encoder.encode(m) for m in [b'hello', b'', b'world!'])
+
+
+def test_write_to_round_trip():
+    messages = [{'id': i} for i in range(2500)]
+    encoder = recordio.Encoder(lambda m: json.dumps(m).encode('UTF-8'))
+    out = io.BytesIO()
+    written = encoder.write_to(out, iter(messages), batch_size=1000)
+    assert written == len(out.getvalue())
+    assert out.getvalue() == _encode(messages)
+    out.seek(0)
+    assert list(recordio.iter_records(out, _json_deserialize)) == messages
@@ -1,8 +1,12 @@
+import asyncio
 import getpass
+import json
 import os
 import random
 import socket
 import subprocess
+import sys
+import time
 import uuid
 from contextlib import contextmanager
 
@@ -192,3 +196,374 @@ def test_scp(tunnel_args, sshd_manager, tmpdir):
     result = runner.run_command('run', ['test', '-f', str(remote_file_path)])
     for cmd in result:
         assert cmd['returncode'] == 0
+
+
+FAKE_SSH = """#!{python}
+import json, os, subprocess, sys, time
+args = sys.argv[1:]
+with open({log!r}, 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+control = next((a.split('=', 1)[1] for a in args if a.startswith('-oControlPath=')), None)
+if '-O' in args:
+    if not (control and os.path.exists(control)):
+        sys.exit(255)
+    if args[args.index('-O') + 1] == 'exit':
+        os.remove(control)
+    sys.exit(0)
+if '-fnN' in args:
+    if os.path.exists({delay!r}):
+        with open({delay!r}) as f:
+            time.sleep(float(f.read()))
+    open(control, 'w').close()
+    sys.exit(0)
+i = 0
+while args[i].startswith('-'):
+    i += 2 if args[i] in ('-p', '-i') else 1
+# commands run in the directory of their host, if it has one
+host_dir = os.path.join({hosts!r}, args[i].split('@')[-1])
+if os.path.isdir(host_dir):
+    os.chdir(host_dir)
+os.execvp('sh', ['sh', '-c', ' '.join(args[i + 1:])])
+"""
+
+FAKE_SCP = """#!{python}
+import json, os, shutil, sys
+args = sys.argv[1:]
+with open({log!r}, 'a') as f:
+    f.write(json.dumps(['scp'] + args) + '\\n')
+paths = [a for i, a in enumerate(args) if not a.startswith('-') and args[i - 1] not in ('-P', '-i')]
+def local_path(path):
+    if ':' not in path:
+        return path
+    host, path = path.split('@')[-1].split(':', 1)
+    return os.path.join({hosts!r}, host, path) if os.path.isdir(os.path.join({hosts!r}, host)) else path
+src, dst = map(local_path, paths)
+# copies from one host to another need the forwarded agent to authenticate
+if os.getcwd().startswith({hosts!r}) and 'SSH_AUTH_SOCK' not in os.environ:
+    sys.exit(1)
+shutil.copy(src, dst)
+"""
+
+
+@pytest.fixture
+def fake_ssh(tmpdir, monkeypatch):
+    """ Puts an ssh and scp on the PATH which run commands and copy files locally and log
+    their arguments. Commands run in, and files are copied to, tmpdir/hosts/<host> if it
+    exists. Opening a tunnel takes as many seconds as written to tmpdir/handshake_delay.
+    Returns a function listing the logged invocations
+    """
+    log_path = str(tmpdir.join('ssh.log'))
+    bin_dir = tmpdir.mkdir('bin')
+    hosts = str(tmpdir.join('hosts'))
+    bin_dir.join('ssh').write(FAKE_SSH.format(
+        python=sys.executable, log=log_path, delay=str(tmpdir.join('handshake_delay')), hosts=hosts))
+    bin_dir.join('scp').write(FAKE_SCP.format(python=sys.executable, log=log_path, hosts=hosts))
+    bin_dir.join('ssh').chmod(0o755)
+    bin_dir.join('scp').chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+
+    def invocations():
+        if not os.path.exists(log_path):
+            return []
+        with open(log_path) as f:
+            return [json.loads(line) for line in f]
+    return invocations
+
+
+def _handshakes(invocations):
+    return [args[-1] for args in invocations() if '-fnN' in args]
+
+
+def _exits(invocations):
+    return [args[-1] for args in invocations() if args[-2:-1] == ['exit']]
+
+
+def test_ssh_client_reuses_tunnels(fake_ssh):
+    ssh = ssh_client.SshClient('core', 'key')
+    for _ in range(3):
+        for host in ('10.0.0.1', '10.0.0.2'):
+            assert ssh.command(host, ['echo', 'hi']) == b'hi\n'
+    assert ssh.get_home_dir('10.0.0.1', port=2222) == os.getcwd()
+
+    assert sorted(_handshakes(fake_ssh)) == ['core@10.0.0.1', 'core@10.0.0.1', 'core@10.0.0.2']
+    assert len(ssh.tunnel_pool) == 3
+    assert _exits(fake_ssh) == []
+    ssh.close()
+    assert sorted(_exits(fake_ssh)) == ['core@10.0.0.1', 'core@10.0.0.1', 'core@10.0.0.2']
+    assert len(ssh.tunnel_pool) == 0
+
+
+def test_ssh_client_evicts_idle_tunnels(fake_ssh):
+    ssh = ssh_client.SshClient('core', 'key', tunnel_idle_timeout=0)
+    ssh.command('10.0.0.1', ['true'])
+    ssh.command('10.0.0.2', ['true'])
+    # opening the second tunnel evicted the first, which was idle
+    assert _exits(fake_ssh) == ['core@10.0.0.1']
+    with ssh.tunnel('10.0.0.2') as t:
+        ssh.tunnel_pool.evict_idle()
+        # not evicted while in use
+        assert t.command(['echo', 'in use']) == b'in use\n'
+    assert _exits(fake_ssh) == ['core@10.0.0.1', 'core@10.0.0.2']
+    assert len(_handshakes(fake_ssh)) == 3
+
+
+def test_ssh_client_without_tunnel_reuse(fake_ssh):
+    ssh = ssh_client.SshClient('core', 'key', reuse_tunnels=False)
+    ssh.command('10.0.0.1', ['true'])
+    ssh.command('10.0.0.1', ['true'])
+    assert len(_handshakes(fake_ssh)) == 2
+    assert len(_exits(fake_ssh)) == 2
+
+
+def test_async_ssh_client_reuses_tunnels(fake_ssh):
+    hosts = ['10.0.0.{}'.format(i) for i in range(5)]
+    runner = ssh_client.AsyncSshClient('core', 'key', hosts)
+    for _ in range(3):
+        results = runner.run_command('run', ['echo', 'hi'])
+        assert [r['stdout'] for r in results] == [b'hi\n'] * len(hosts)
+    assert sorted(_handshakes(fake_ssh)) == ['core@' + host for host in hosts]
+    runner.close()
+
+
+@pytest.mark.parametrize('reuse_tunnels', [True, False])
+def test_async_ssh_client_opens_tunnels_in_parallel(fake_ssh, tmpdir, reuse_tunnels):
+    tmpdir.join('handshake_delay').write('1')
+    hosts = ['10.0.0.{}:22'.format(i) for i in range(5)]
+    runner = ssh_client.AsyncSshClient('core', 'key', hosts, parallelism=5, reuse_tunnels=reuse_tunnels)
+    start = time.monotonic()
+    results = runner.run_command('run', ['true'])
+    # serialized tunnel setup would take 5 * 1 seconds
+    assert time.monotonic() - start < 4
+    assert [r['returncode'] for r in results] == [0] * len(hosts)
+    assert len(_handshakes(fake_ssh)) == len(hosts)
+    runner.close()
+
+
+def test_async_tunnel_pool_opens_each_tunnel_once(fake_ssh, tmpdir):
+    tmpdir.join('handshake_delay').write('0.2')
+    runner = ssh_client.AsyncSshClient('core', 'key', ['10.0.0.1'] * 5)
+    results = runner.run_command('run', ['echo', 'hi'])
+    assert [r['stdout'] for r in results] == [b'hi\n'] * 5
+    assert _handshakes(fake_ssh) == ['core@10.0.0.1']
+    runner.close()
+
+
+def _stream_events(runner, cmd, **kwargs):
+    async def collect():
+        events = []
+        async with runner.stream(cmd, **kwargs) as output:
+            async for event in output:
+                events.append(event)
+        return events
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(collect())
+    finally:
+        loop.close()
+
+
+def test_async_ssh_client_stream(fake_ssh):
+    hosts = ['10.0.0.{}'.format(i) for i in range(3)]
+    runner = ssh_client.AsyncSshClient('core', 'key', hosts)
+    events = _stream_events(runner, ['printf', '"a\\nb\\nc"', ';', 'echo', 'err', '>&2'])
+
+    for host in hosts:
+        assert [e.data for e in events if e.host == host and e.stream == 'stdout'] == [b'a\n', b'b\n', b'c']
+        assert [e.data for e in events if e.host == host and e.stream == 'stderr'] == [b'err\n']
+        exit_event = [e for e in events if e.host == host][-1]
+        assert exit_event.stream == 'exit'
+        assert exit_event.data['returncode'] == 0
+        assert exit_event.data['dropped'] == 0
+    runner.close()
+
+
+def test_async_ssh_client_stream_long_lines_in_chunks(fake_ssh):
+    runner = ssh_client.AsyncSshClient('core', 'key', ['10.0.0.1'])
+    events = _stream_events(runner, ['printf', '%0250d', '0'], chunk_size=100)
+    assert [len(e.data) for e in events if e.stream == 'stdout'] == [100, 100, 50]
+    runner.close()
+
+
+@pytest.mark.parametrize('spill', [True, False])
+def test_async_ssh_client_stream_output_cap(fake_ssh, tmpdir, spill):
+    runner = ssh_client.AsyncSshClient('core', 'key', ['10.0.0.1', '10.0.0.2:2222'])
+    spill_directory = str(tmpdir.mkdir('spill')) if spill else None
+    events = _stream_events(runner, ['seq', '1', '1000'], max_output=100, spill_directory=spill_directory)
+    full = ''.join('{}\n'.format(i) for i in range(1, 1001)).encode()
+
+    for host in ('10.0.0.1', '10.0.0.2:2222'):
+        streamed = b''.join(e.data for e in events if e.host == host and e.stream == 'stdout')
+        assert streamed == full[:100]
+        result = [e for e in events if e.host == host][-1].data
+        if spill:
+            assert result['dropped'] == 0
+            with open(result['spill_files']['stdout'], 'rb') as f:
+                assert streamed + f.read() == full
+        else:
+            assert result['dropped'] == len(full) - 100
+            assert result['spill_files'] == {}
+    runner.close()
+
+
+def test_async_ssh_client_stream_closed_early(fake_ssh):
+    runner = ssh_client.AsyncSshClient('core', 'key', ['10.0.0.1', '10.0.0.2'])
+
+    async def first_event():
+        async with runner.stream(['echo', 'started', ';', 'exec', 'sleep', '30']) as output:
+            async for event in output:
+                return event
+
+    start = time.monotonic()
+    loop = asyncio.new_event_loop()
+    try:
+        event = loop.run_until_complete(first_event())
+    finally:
+        loop.close()
+    assert event.data == b'started\n'
+    assert time.monotonic() - start < 10
+    runner.close()
+
+
+@pytest.fixture
+def client_key(tmpdir):
+    key_path = str(tmpdir.join('client_key'))
+    subprocess.check_call(['ssh-keygen', '-q', '-f', key_path, '-t', 'ed25519', '-N', ''])
+    with open(key_path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('fanout', [1, 3])
+def test_async_ssh_client_distribute(fake_ssh, tmpdir, client_key, fanout):
+    hosts = ['10.0.0.{}'.format(i) for i in range(12)]
+    for host in hosts:
+        tmpdir.join('hosts', host).ensure(dir=True)
+    installer = tmpdir.join('installer.sh')
+    installer.write_binary(os.urandom(100000))
+    runner = ssh_client.AsyncSshClient('core', client_key, hosts)
+
+    results = runner.distribute(str(installer), 'installer.sh', fanout=fanout)
+
+    assert [r['host'] for r in results] == hosts
+    assert all(r['returncode'] == 0 and r['verified'] for r in results)
+    for host in hosts:
+        assert tmpdir.join('hosts', host, 'installer.sh').read_binary() == installer.read_binary()
+    # the runner uploaded it once per round of copies, the rest was relayed between hosts
+    from_runner = [r['host'] for r in results if r['source'] is None]
+    assert len(from_runner) <= fanout * 5
+    runner.close()
+
+
+def test_async_ssh_client_distribute_skips_corrupt_relays(fake_ssh, tmpdir, client_key, monkeypatch):
+    hosts = ['10.0.0.{}'.format(i) for i in range(6)]
+    for host in hosts:
+        tmpdir.join('hosts', host).ensure(dir=True)
+    installer = tmpdir.join('installer.sh')
+    installer.write('installer')
+    runner = ssh_client.AsyncSshClient('core', client_key, hosts)
+    copy = runner.copy
+
+    async def corrupting_copy(sem, host, local_path, remote_path, recursive):
+        result = await copy(sem, host, local_path, remote_path, recursive)
+        if host == hosts[0]:
+            tmpdir.join('hosts', host, remote_path).write('corrupt')
+        return result
+    monkeypatch.setattr(runner, 'copy', corrupting_copy)
+
+    results = runner.distribute(str(installer), 'installer.sh', fanout=1)
+
+    assert results[0]['verified'] is False
+    assert all(r['verified'] for r in results[1:])
+    assert all(r['source'] != hosts[0] for r in results)
+    runner.close()
+
+
+FAKE_RSYNC = """#!{python}
+import filecmp, os, shutil, sys
+args = sys.argv[1:]
+source, target = [a.split(':', 1)[-1] for a in args[-2:]]
+total = literal = 0
+files = [(source, target)]
+if source.endswith('/'):
+    files = [(os.path.join(root, f), os.path.join(target, os.path.relpath(os.path.join(root, f), source)))
+             for root, _, names in os.walk(source) for f in names]
+for src, dst in files:
+    size = os.path.getsize(src)
+    total += size
+    if not (os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False)):
+        literal += size
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        shutil.copy(src, dst)
+print('Number of files: {{}}'.format(len(files)))
+print('Total file size: {{:,}} bytes'.format(total))
+print('Literal data: {{:,}} bytes'.format(literal))
+print('Matched data: {{:,}} bytes'.format(total - literal))
+print('Total bytes sent: {{:,}}'.format(literal + 100))
+print('Total bytes received: {{:,}}'.format(literal + 50))
+"""
+
+
+@pytest.fixture
+def copy_tree(tmpdir):
+    src = tmpdir.mkdir('copy_src')
+    src.join('config.yaml').write('a: 1\n' * 1000)
+    src.mkdir('nested').join('package.tar').write_binary(os.urandom(20000))
+    return src
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_copy_file_with_tar(fake_ssh, tmpdir, copy_tree, compress):
+    tunnel = ssh_client.Tunnelled([], 'core@10.0.0.1', 22)
+    dst = tmpdir.join('dst')
+    stats = tunnel.copy_file(str(copy_tree), str(dst), method='tar', compress=compress)
+    assert dst.join('nested', 'package.tar').computehash() == copy_tree.join('nested', 'package.tar').computehash()
+    assert stats.method == 'tar'
+    assert stats.bytes_total == 25000
+    assert stats.bytes_skipped == 0
+    # the text config compresses well, the random package does not
+    assert (stats.bytes_sent < 25000) == compress
+
+    # copied into an existing directory, like scp does
+    stats = tunnel.copy_file(str(copy_tree.join('config.yaml')), str(dst), method='tar')
+    assert dst.join('config.yaml').read() == copy_tree.join('config.yaml').read()
+
+    back = tmpdir.join('back')
+    stats = tunnel.copy_file(str(dst), str(back), to_remote=False, method='tar')
+    assert back.join('nested', 'package.tar').computehash() == copy_tree.join('nested', 'package.tar').computehash()
+    assert stats.bytes_total == 25000
+
+
+def test_copy_file_with_scp_reports_bytes(fake_ssh, tmpdir, copy_tree):
+    tunnel = ssh_client.Tunnelled([], 'core@10.0.0.1', 22)
+    stats = tunnel.copy_file(str(copy_tree.join('config.yaml')), str(tmpdir.join('config.yaml')))
+    assert stats[:4] == ('scp', 5000, 5000, 0)
+
+
+def test_copy_file_with_rsync(fake_ssh, tmpdir, copy_tree):
+    tmpdir.join('bin', 'rsync').write(FAKE_RSYNC.format(python=sys.executable))
+    tmpdir.join('bin', 'rsync').chmod(0o755)
+    tunnel = ssh_client.Tunnelled([], 'core@10.0.0.1', 22)
+    # copied into the existing directory both times, like scp does
+    dst = tmpdir.mkdir('dst')
+
+    stats = tunnel.copy_file(str(copy_tree), str(dst), method='rsync')
+    assert dst.join('copy_src', 'nested', 'package.tar').computehash() == copy_tree.join(
+        'nested', 'package.tar').computehash()
+    assert stats[:4] == ('rsync', 25000, 25100, 0)
+
+    copy_tree.join('config.yaml').write('a: 2\n' * 1000)
+    stats = tunnel.copy_file(str(copy_tree), str(dst), method='rsync')
+    assert dst.join('copy_src', 'config.yaml').read() == copy_tree.join('config.yaml').read()
+    assert stats[:4] == ('rsync', 25000, 5100, 20000)
+
+
+def test_copy_file_with_rsync_falls_back_to_tar(fake_ssh, tmpdir, copy_tree, monkeypatch):
+    monkeypatch.setattr(ssh_client.shutil, 'which', lambda cmd: None)
+    tunnel = ssh_client.Tunnelled([], 'core@10.0.0.1', 22)
+    stats = tunnel.copy_file(str(copy_tree), str(tmpdir.join('dst')), method='rsync')
+    assert stats.method == 'tar'
+    assert tmpdir.join('dst', 'config.yaml').check()
+
+
+def test_copy_file_unknown_method():
+    with pytest.raises(ValueError):
+        ssh_client.Tunnelled([], 'core@10.0.0.1', 22).copy_file('a', 'b', method='ftp')